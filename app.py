@@ -9,326 +9,22 @@ import sqlite3
 import os
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-import pandas as pd
-# Import your existing modules
-from openai_handler import get_vertical_submarkets
-from horizontal_handler import get_horizontal_submarkets
-from global_metrics_agent import get_global_overview
-from utils import split_tables, markdown_table_to_dataframe
-from metrics_agent import get_detailed_metrics
-from companies_agent import get_top_companies
-from mergers_agent import get_mergers_table
-from split_and_upload_chunks import split_and_upload_pdf_chunks
-from query_uploaded_chunks import query_chunks
-from compare_pdf_agent import compare_uploaded_pdfs
-from web_search_agent import search_web_insights
+# Import your existing modules (agents, pandas and PyMuPDF are imported where they are first used)
+from market_orchestrator import (fan_out_market_analysis, fetch_market_analysis, fetch_drilldown, clear_memo,
+                                 expire_hours_for, is_cacheable, MARKET_STREAMS)
+from llm_client import breaker
+from model_router import Retraction
+from market_db import WorkingMarketDB
+from prefetcher import prefetcher_for
+from semantic_cache import semantic_cache_for
+import llm_metrics
+import deadlines
+from market_schemas import (SubmarketsResult, MetricRow, CompanyRow, DealRow, render_markdown, count_rows,
+                            ROW_TYPES, STRUCTURED_QUERY)
 
 st.set_page_config(page_title="Market Sub-Segment Explorer", layout="wide")
 
-# === WORKING DATABASE CLASS (BUILT-IN) ===
-class WorkingMarketDB:
-    def __init__(self, db_path: str = "working_market.db"):
-        self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """Initialize the database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.executescript("""
-                CREATE TABLE IF NOT EXISTS market_cache (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    market_name TEXT NOT NULL,
-                    query_type TEXT NOT NULL,
-                    query_hash TEXT UNIQUE NOT NULL,
-                    result_data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP,
-                    source TEXT DEFAULT 'openai'
-                );
-                
-                CREATE TABLE IF NOT EXISTS pdf_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_name TEXT NOT NULL,
-                    file_hash TEXT NOT NULL,
-                    file_size INTEGER,
-                    total_pages INTEGER,
-                    chunks_count INTEGER,
-                    openai_file_ids TEXT,
-                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'processed'
-                );
-                
-                CREATE TABLE IF NOT EXISTS pdf_qa (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    pdf_history_id INTEGER,
-                    question TEXT NOT NULL,
-                    answer TEXT,
-                    query_tokens INTEGER,
-                    response_tokens INTEGER,
-                    cost_estimate REAL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (pdf_history_id) REFERENCES pdf_history (id)
-                );
-                
-                CREATE TABLE IF NOT EXISTS ma_searches (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    market_name TEXT NOT NULL,
-                    timeframe TEXT NOT NULL,
-                    result_data TEXT,
-                    deals_count INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                
-                CREATE TABLE IF NOT EXISTS usage_analytics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_type TEXT NOT NULL,
-                    event_data TEXT,
-                    user_agent TEXT,
-                    session_id TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                
-                CREATE INDEX IF NOT EXISTS idx_market_cache_hash ON market_cache(query_hash);
-                CREATE INDEX IF NOT EXISTS idx_market_cache_name ON market_cache(market_name);
-                CREATE INDEX IF NOT EXISTS idx_pdf_history_hash ON pdf_history(file_hash);
-            """)
-    
-    def generate_query_hash(self, market_name: str, query_type: str, **kwargs) -> str:
-        """Generate a hash for caching purposes"""
-        query_string = f"{market_name}:{query_type}:{json.dumps(kwargs, sort_keys=True)}"
-        return hashlib.md5(query_string.encode()).hexdigest()
-    
-    # === CACHE METHODS ===
-    def get_cached_result(self, market_name: str, query_type: str, **kwargs) -> Optional[Dict]:
-        """Retrieve cached market analysis result"""
-        query_hash = self.generate_query_hash(market_name, query_type, **kwargs)
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT result_data, created_at, expires_at 
-                FROM market_cache 
-                WHERE query_hash = ? AND (expires_at IS NULL OR expires_at > datetime('now'))
-            """, (query_hash,))
-            
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'data': row['result_data'],  # Keep as string for simplicity
-                    'cached_at': row['created_at'],
-                    'expires_at': row['expires_at']
-                }
-        return None
-    
-    def cache_result(self, market_name: str, query_type: str, result_data: Any, 
-                    source: str = 'openai', expire_hours: int = 24, **kwargs):
-        """Cache a market analysis result"""
-        query_hash = self.generate_query_hash(market_name, query_type, **kwargs)
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO market_cache 
-                (market_name, query_type, query_hash, result_data, source, expires_at)
-                VALUES (?, ?, ?, ?, ?, datetime('now', '+{} hours'))
-            """.format(expire_hours), (market_name, query_type, query_hash, 
-                                     str(result_data), source))
-    
-    # === PDF METHODS ===
-    def save_pdf_processing(self, file_name: str, file_content: bytes, 
-                           total_pages: int, openai_file_ids: List[str]) -> int:
-        """Save PDF processing information"""
-        file_hash = hashlib.md5(file_content).hexdigest()
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                INSERT INTO pdf_history 
-                (file_name, file_hash, file_size, total_pages, chunks_count, openai_file_ids)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (file_name, file_hash, len(file_content), total_pages, 
-                  len(openai_file_ids), json.dumps(openai_file_ids)))
-            
-            return cursor.lastrowid
-    
-    def get_pdf_by_hash(self, file_hash: str) -> Optional[Dict]:
-        """Check if PDF was already processed"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM pdf_history WHERE file_hash = ? AND status = 'processed'
-                ORDER BY processed_at DESC LIMIT 1
-            """, (file_hash,))
-            
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'id': row['id'],
-                    'file_name': row['file_name'],
-                    'total_pages': row['total_pages'],
-                    'chunks_count': row['chunks_count'],
-                    'openai_file_ids': json.loads(row['openai_file_ids']),
-                    'processed_at': row['processed_at']
-                }
-        return None
-    
-    def save_pdf_qa(self, pdf_history_id: int, question: str, answer: str, 
-                   query_tokens: int = 0, response_tokens: int = 0) -> int:
-        """Save PDF Q&A interaction"""
-        cost_estimate = (query_tokens * 0.01 + response_tokens * 0.03) / 1000
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                INSERT INTO pdf_qa 
-                (pdf_history_id, question, answer, query_tokens, response_tokens, cost_estimate)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (pdf_history_id, question, answer, query_tokens, response_tokens, cost_estimate))
-            
-            return cursor.lastrowid
-    
-    def get_pdf_qa_history(self, pdf_history_id: int) -> List[Dict]:
-        """Get Q&A history for a specific PDF"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT question, answer, created_at, cost_estimate
-                FROM pdf_qa 
-                WHERE pdf_history_id = ?
-                ORDER BY created_at DESC
-            """, (pdf_history_id,))
-            
-            return [dict(row) for row in cursor.fetchall()]
-    
-    # === M&A METHODS ===
-    def save_ma_search(self, market_name: str, timeframe: str, result_data: str, deals_count: int = 0):
-        """Save M&A search result"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO ma_searches (market_name, timeframe, result_data, deals_count)
-                VALUES (?, ?, ?, ?)
-            """, (market_name, timeframe, result_data, deals_count))
-    
-    def get_recent_ma_searches(self, limit: int = 10) -> List[Dict]:
-        """Get recent M&A searches"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT market_name, timeframe, deals_count, created_at, result_data
-                FROM ma_searches 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            """, (limit,))
-            
-            return [dict(row) for row in cursor.fetchall()]
-    
-    # === ANALYTICS METHODS ===
-    def log_event(self, event_type: str, event_data: Dict = None, session_id: str = None):
-        """Log usage analytics event"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO usage_analytics (event_type, event_data, session_id)
-                VALUES (?, ?, ?)
-            """, (event_type, json.dumps(event_data) if event_data else None, session_id))
-    
-    def get_popular_markets(self, days: int = 30, limit: int = 10) -> List[Dict]:
-        """Get most popular markets in the last N days"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT market_name, COUNT(*) as query_count, MAX(created_at) as last_queried
-                FROM market_cache 
-                WHERE created_at > datetime('now', '-{} days')
-                GROUP BY market_name
-                ORDER BY query_count DESC
-                LIMIT ?
-            """.format(days), (limit,))
-            
-            return [{'market_name': row[0], 'query_count': row[1], 'last_queried': row[2]} 
-                   for row in cursor.fetchall()]
-    
-    # === HISTORY BROWSING METHODS ===
-    def get_market_analysis_history(self, limit: int = 20) -> List[Dict]:
-        """Get history of market analyses for browsing"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT DISTINCT market_name, query_type, created_at,
-                       COUNT(*) OVER (PARTITION BY market_name, query_type) as access_count
-                FROM market_cache 
-                WHERE expires_at > datetime('now') OR expires_at IS NULL
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (limit,))
-            
-            return [dict(row) for row in cursor.fetchall()]
-    
-    def get_pdf_sessions_summary(self, limit: int = 15) -> List[Dict]:
-        """Get summary of PDF sessions for browsing"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT p.id, p.file_name, p.total_pages, p.chunks_count, 
-                       p.processed_at, p.openai_file_ids,
-                       COUNT(q.id) as qa_count,
-                       MAX(q.created_at) as last_question
-                FROM pdf_history p
-                LEFT JOIN pdf_qa q ON p.id = q.pdf_history_id
-                WHERE p.status = 'processed'
-                GROUP BY p.id
-                ORDER BY p.processed_at DESC
-                LIMIT ?
-            """, (limit,))
-            
-            return [dict(row) for row in cursor.fetchall()]
-    
-    def restore_pdf_session(self, pdf_id: int) -> Dict:
-        """Get all data needed to restore a PDF session"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            # Get PDF info
-            pdf_cursor = conn.execute("""
-                SELECT * FROM pdf_history WHERE id = ? AND status = 'processed'
-            """, (pdf_id,))
-            pdf_data = pdf_cursor.fetchone()
-            
-            if not pdf_data:
-                return None
-            
-            # Get Q&A history
-            qa_cursor = conn.execute("""
-                SELECT question, answer, created_at, cost_estimate
-                FROM pdf_qa 
-                WHERE pdf_history_id = ?
-                ORDER BY created_at ASC
-            """, (pdf_id,))
-            qa_history = [dict(row) for row in qa_cursor.fetchall()]
-            
-            return {
-                'pdf_info': dict(pdf_data),
-                'qa_history': qa_history
-            }
-    
-    # === UTILITY METHODS ===
-    def cleanup_expired_cache(self):
-        """Remove expired cache entries"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM market_cache WHERE expires_at < datetime('now')")
-    
-    def get_database_stats(self) -> Dict:
-        """Get database statistics"""
-        with sqlite3.connect(self.db_path) as conn:
-            stats = {}
-            tables = ['market_cache', 'pdf_history', 'pdf_qa', 'ma_searches', 'usage_analytics']
-            for table in tables:
-                cursor = conn.execute(f"SELECT COUNT(*) FROM {table}")
-                stats[f"{table}_count"] = cursor.fetchone()[0]
-            
-            stats['db_size_mb'] = os.path.getsize(self.db_path) / (1024 * 1024) if os.path.exists(self.db_path) else 0
-            return stats
-
 # === INITIALIZE APP ===
-# Clear any cached resources to prevent conflicts
-st.cache_data.clear()
-st.cache_resource.clear()
-
 # Initialize database
 @st.cache_resource
 def init_working_database():
@@ -336,6 +32,13 @@ def init_working_database():
     return WorkingMarketDB()
 
 db = init_working_database()
+llm_metrics.configure(db.db_path)
+
+def invalidate_caches():
+    """Drop cached reads after rows are deleted (orchestrator memo, semantic index and st.cache_data)"""
+    clear_memo()
+    semantic_cache_for(db).reset()
+    st.cache_data.clear()
 
 # Initialize session state variables
 def initialize_session_state():
@@ -371,37 +74,161 @@ initialize_session_state()
 if 'session_id' not in st.session_state:
     st.session_state.session_id = hashlib.md5(str(st.session_state).encode()).hexdigest()[:12]
 
+# === REQUEST DEADLINES ===
+def render_deadline_settings():
+    """Sidebar controls for per-agent deadlines and hedging; applied to this script run"""
+    with st.sidebar.expander("⏱️ Request Deadlines"):
+        hedging = st.checkbox("Hedge slow drill-downs", value=True, key="deadline_hedging",
+                              help="Send a duplicate request when a call is slower than usual; first answer wins")
+        overrides = {
+            agent: st.slider(agent.replace('_', ' ').title(), min_value=15, max_value=deadlines.MAX_DEADLINE, value=default,
+                             step=15, key=f"deadline_{agent}", help="Seconds, retries included")
+            for agent, default in deadlines.AGENT_DEADLINES.items()
+        }
+    deadlines.use_session_settings(overrides, hedging)
+
+render_deadline_settings()
+
 # === ENHANCED FUNCTIONS ===
 @st.cache_data(ttl=600)  # Cache for 10 minutes
 def get_cached_market_analysis(market_name: str, analysis_type: str):
     """Get market analysis with caching"""
-    # Check cache first
-    cached = db.get_cached_result(market_name, analysis_type)
-    if cached:
-        return cached['data'], True  # Return data and cache_hit flag
+    # Cache lookup, then a single-flight fetch shared with other sessions
+    result, cache_hit = fetch_market_analysis(market_name, analysis_type, db)
     
-    # Perform fresh analysis
-    if analysis_type == 'global':
-        result = get_global_overview(market_name)
-    elif analysis_type == 'vertical':
-        result = get_vertical_submarkets(market_name)
-    elif analysis_type == 'horizontal':
-        result = get_horizontal_submarkets(market_name)
-    else:
-        result = None
+    if is_cacheable(result):
+        # Log analytics event; cache hits count too, the cache warmer ranks markets by these
+        db.log_event('market_analysis', {
+            'market_name': market_name,
+            'analysis_type': analysis_type,
+            'result_length': len(str(result)),
+            'cache_hit': cache_hit
+        }, st.session_state.session_id)
     
-    # Cache the result for 24 hours
-    if result:
-        db.cache_result(market_name, analysis_type, result, expire_hours=24)
-        
-        # Log analytics event
+    return result, cache_hit  # Return data and cache_hit flag
+
+def write_routed_stream(deltas) -> str:
+    """st.write_stream for model_router streams: an answer rejected for escalation is replaced on screen"""
+    placeholder = st.empty()
+    text = ""
+    for delta in deltas:
+        text = text[:len(text) - delta.length] if isinstance(delta, Retraction) else text + delta
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
+
+def stream_market_analysis(market_name: str, analysis_type: str):
+    """Render one analysis into the current container, streaming tokens on a cache miss"""
+    streamed = []
+    interrupted = []
+    
+    def stream_fetch(name: str) -> str:
+        try:
+            text = st.write_stream(MARKET_STREAMS[analysis_type](name))
+        except Exception as e:
+            # The partial answer stays on screen but must not be cached as the result
+            interrupted.append(e)
+            return f"⚠️ The {analysis_type} analysis was cut off: {e}"
+        streamed.append(text)
+        return text
+    
+    result, cache_hit = fetch_market_analysis(market_name, analysis_type, db, fetch=stream_fetch)
+    
+    if interrupted:
+        st.warning(f"⚠️ The answer above was cut off ({interrupted[0]}).")
+        if cache_hit:
+            st.caption("🕰️ Showing the last cached version instead:")
+            st.markdown(result)
+        return result, cache_hit
+    if not streamed:
+        # Cache hit, or another session fetched it while we waited
+        st.markdown(result or "⚠️ No data returned.")
+    if is_cacheable(result):
+        # Log analytics event; cache hits count too, the cache warmer ranks markets by these
         db.log_event('market_analysis', {
             'market_name': market_name,
             'analysis_type': analysis_type,
-            'result_length': len(str(result))
+            'result_length': len(str(result)),
+            'cache_hit': cache_hit
         }, st.session_state.session_id)
     
-    return result, False  # Return data and cache_hit flag
+    return result, cache_hit
+
+def load_submarkets(result: str):
+    """Parse a cached/fetched 'submarkets' result; None if it is an error message"""
+    try:
+        return SubmarketsResult.from_json(result)
+    except (TypeError, ValueError):
+        return None
+
+def cached_result_markdown(query_type: str, data: str) -> str:
+    """Markdown for any market_cache entry, structured (JSON) or not"""
+    if query_type == 'submarkets':
+        submarkets = load_submarkets(data)
+        return submarkets.to_markdown() if submarkets else data
+    if query_type in ROW_TYPES:
+        return render_markdown(data, ROW_TYPES[query_type])
+    return data
+
+def store_submarkets(submarkets: SubmarketsResult):
+    """Put sub-market tables in session state for display, drilldown and download"""
+    st.session_state["vertical_df"] = submarkets.vertical_dataframe()
+    st.session_state["horizontal_df"] = submarkets.horizontal_dataframe()
+    st.session_state["raw_markdown"] = submarkets.to_markdown()
+
+def prefetch_submarket_drilldowns():
+    """Warm metrics/companies for every listed sub-market, default-selected rows first"""
+    columns = []
+    for key in ["vertical_df", "horizontal_df"]:
+        df = st.session_state.get(key)
+        if df is not None and not df.empty:
+            columns.append(df[df.columns[0]].dropna().unique().tolist())
+    
+    # Interleave the two lists so both radio defaults (row 0) are fetched first
+    ordered = []
+    for row in range(max((len(c) for c in columns), default=0)):
+        for column in columns:
+            if row < len(column) and column[row] not in ordered:
+                ordered.append(column[row])
+    
+    if ordered:
+        prefetcher_for(db).schedule(ordered)
+
+def render_upstream_status() -> bool:
+    """Staleness banner while the upstream circuit breaker is not closed; True if shown"""
+    status = breaker.snapshot()
+    if status['state'] == 'closed':
+        return False
+    recovery = (f"next recovery probe in {status['retry_in']:.0f}s" if status['state'] == 'open'
+                else "checking whether it has recovered")
+    st.warning(f"🔌 **Degraded mode:** the analysis service is failing, so results come from the newest "
+               f"cached data and may be out of date ({recovery}).")
+    return True
+
+def render_cache_age(name: str, analysis_types: List[str], structured: bool = False):
+    """Caption with when each result served in degraded mode was cached"""
+    query = STRUCTURED_QUERY if structured else {}
+    for analysis_type in analysis_types:
+        cached = db.get_last_known_result(name, analysis_type, **query)
+        if cached:
+            expired = " (expired)" if cached['expired'] else ""
+            st.caption(f"🕰️ {analysis_type.title()} cached {cached['cached_at']}{expired}")
+
+def render_drilldown(submarket: str, metrics_title: str, companies_title: str):
+    """Render metrics and top companies for a sub-market from the shared cache (one combined call on a miss)"""
+    drilldown = fetch_drilldown(submarket, db)
+    metrics_json, metrics_cached = drilldown['metrics']
+    companies_json, companies_cached = drilldown['companies']
+    
+    st.markdown(metrics_title)
+    st.markdown(render_markdown(metrics_json, MetricRow) if metrics_json else "⚠️ No metrics found.")
+    st.markdown(companies_title)
+    st.markdown(render_markdown(companies_json, CompanyRow) if companies_json else "⚠️ No company data found.")
+    
+    if metrics_cached and companies_cached:
+        st.caption("📋 From cache")
+    if render_upstream_status():
+        render_cache_age(submarket, ['metrics', 'companies'], structured=True)
 
 def process_pdf_with_deduplication(uploaded_file):
     """Process PDF with deduplication check"""
@@ -434,6 +261,7 @@ def process_pdf_with_deduplication(uploaded_file):
     # Process new PDF
     uploaded_file.seek(0)  # Reset file pointer
     with st.spinner("⏳ Processing new PDF..."):
+        from split_and_upload_chunks import split_and_upload_pdf_chunks
         file_chunks = split_and_upload_pdf_chunks(uploaded_file)
         openai_file_ids = [chunk['file_id'] for chunk in file_chunks]
         total_pages = max([chunk['end'] for chunk in file_chunks])
@@ -460,15 +288,16 @@ def process_pdf_with_deduplication(uploaded_file):
         
     return file_chunks
 
-def save_pdf_qa_to_db(question: str, answer: str):
-    """Save PDF Q&A to database and session state"""
+def save_pdf_qa_to_db(question: str, answer: str, usage: llm_metrics.UsageTotals):
+    """Save PDF Q&A to database and session state, with the real token usage of the answer"""
     if hasattr(st.session_state, 'current_pdf_id'):
         qa_id = db.save_pdf_qa(
             st.session_state.current_pdf_id,
             question,
             answer,
-            query_tokens=len(question.split()) * 1.3,  # Rough estimate
-            response_tokens=len(answer.split()) * 1.3   # Rough estimate
+            query_tokens=usage.input_tokens,
+            response_tokens=usage.output_tokens,
+            cost_estimate=usage.cost_usd
         )
         
         # Also add to session state for immediate display
@@ -490,6 +319,7 @@ def restore_complete_market_analysis(market_name: str):
     try:
         # Get all cached analysis types for this market
         global_cached = db.get_cached_result(market_name, 'global')
+        submarkets_cached = db.get_cached_result(market_name, 'submarkets')
         vertical_cached = db.get_cached_result(market_name, 'vertical')
         horizontal_cached = db.get_cached_result(market_name, 'horizontal')
         
@@ -497,7 +327,11 @@ def restore_complete_market_analysis(market_name: str):
         if global_cached:
             st.session_state["global_md"] = global_cached['data']
         
-        if vertical_cached or horizontal_cached:
+        if submarkets_cached:
+            store_submarkets(load_submarkets(submarkets_cached['data']) or SubmarketsResult())
+            prefetch_submarket_drilldowns()
+        elif vertical_cached or horizontal_cached:
+            # Analyses cached before the combined sub-markets call
             raw_markdown = ""
             if vertical_cached:
                 raw_markdown += vertical_cached['data']
@@ -507,9 +341,11 @@ def restore_complete_market_analysis(market_name: str):
             st.session_state["raw_markdown"] = raw_markdown
             
             # Process tables
+            from utils import split_tables, markdown_table_to_dataframe
             vertical_table_md, horizontal_table_md = split_tables(raw_markdown)
             st.session_state["vertical_df"] = markdown_table_to_dataframe(vertical_table_md)
             st.session_state["horizontal_df"] = markdown_table_to_dataframe(horizontal_table_md)
+            prefetch_submarket_drilldowns()
         
         st.session_state["market_analyzed"] = market_name
         return True
@@ -579,39 +415,83 @@ with tab1:
     # Market input form
     with st.form("market_input_form"):
         market = st.text_input("Enter a market (e.g. AI, Plastics, EV Batteries):", key="market_input")
+        reuse_similar = st.checkbox("♻️ Reuse the analysis of a near-identical cached market", value=True,
+                                    help="e.g. 'ev battery market' reuses 'EV Batteries' instead of a new search")
         submitted = st.form_submit_button("Analyze Market")
 
     if submitted and market:
-        # Get cached analyses with cache status
-        with st.spinner("Analyzing market data..."):
-            global_md, global_cached = get_cached_market_analysis(market, 'global')
-            verticals_md, vertical_cached = get_cached_market_analysis(market, 'vertical')
-            horizontals_md, horizontal_cached = get_cached_market_analysis(market, 'horizontal')
+        # Near-duplicate of a market we already analyzed? Analyze under the cached name instead
+        semantic_match = None
+        if reuse_similar:
+            matched_market, similarity = semantic_cache_for(db).resolve(market)
+            if similarity is not None:
+                semantic_match = {'query': market, 'market': matched_market, 'similarity': similarity}
+                market = matched_market
+        st.session_state["semantic_match"] = semantic_match
         
-        # Show cache status
+        # Fetch cache misses concurrently and preview each section as it lands
+        section_titles = {
+            'global': "## Market Overview",
+            'submarkets': "## 🏗️ Sub-markets"
+        }
+        previews = {analysis_type: st.empty() for analysis_type in section_titles}
+        results = {}
         cache_status = []
-        if global_cached: cache_status.append("Global")
-        if vertical_cached: cache_status.append("Vertical")  
-        if horizontal_cached: cache_status.append("Horizontal")
+        
+        # One structured call lists vertical and horizontal sub-markets while the overview streams in
+        pending_results = fan_out_market_analysis(market, ['submarkets'], db)
+        
+        with previews['global'].container():
+            st.markdown(section_titles['global'])
+            results['global'], global_cached = stream_market_analysis(market, 'global')
+        if global_cached:
+            cache_status.append("Global")
+        
+        with st.spinner("Analyzing sub-markets..."):
+            for analysis_type, result, cache_hit in pending_results:
+                results[analysis_type] = load_submarkets(result)
+                if cache_hit:
+                    cache_status.append("Sub-markets")
+                if results[analysis_type]:
+                    # Log analytics event
+                    db.log_event('market_analysis', {
+                        'market_name': market,
+                        'analysis_type': analysis_type,
+                        'result_length': len(str(result)),
+                        'cache_hit': cache_hit
+                    }, st.session_state.session_id)
+                
+                with previews[analysis_type].container():
+                    st.markdown(section_titles[analysis_type])
+                    st.markdown(results[analysis_type].to_markdown() if results[analysis_type]
+                                else (result or "⚠️ No data returned."))
+        
+        # The full display below takes over from the previews
+        for preview in previews.values():
+            preview.empty()
         
         if cache_status:
             st.info(f"📋 Using cached data for: {', '.join(cache_status)}")
+        if render_upstream_status():
+            render_cache_age(market, ['global', 'submarkets'])
+        if not semantic_match and is_cacheable(results.get('global')):
+            semantic_cache_for(db).add(market)
         
         # Store in session state
-        st.session_state["global_md"] = global_md
+        st.session_state["global_md"] = results.get('global')
         st.session_state["market_analyzed"] = market
-        st.session_state["raw_markdown"] = f"{verticals_md}\n\n{horizontals_md}"
-        
-        # Process tables
-        vertical_table_md, horizontal_table_md = split_tables(st.session_state["raw_markdown"])
-        st.session_state["vertical_df"] = markdown_table_to_dataframe(vertical_table_md)
-        st.session_state["horizontal_df"] = markdown_table_to_dataframe(horizontal_table_md)
+        store_submarkets(results.get('submarkets') or SubmarketsResult())
+        prefetch_submarket_drilldowns()
 
     # Display results
     if st.session_state.get("global_md"):
         st.markdown("## Market Overview")
         if st.session_state.get("market_analyzed"):
             st.markdown(f"**Market:** {st.session_state['market_analyzed']}")
+        if st.session_state.get("semantic_match"):
+            match = st.session_state["semantic_match"]
+            st.info(f"♻️ Reused analysis for **{match['market']}** (similar to '{match['query']}', "
+                    f"similarity {match['similarity']:.2f}). Untick the reuse option to analyze it separately.")
         st.markdown(st.session_state["global_md"])
 
     if st.session_state.get("vertical_df") is not None and not st.session_state["vertical_df"].empty:
@@ -647,7 +527,7 @@ with tab1:
                 if popular_markets:
                     for market_data in popular_markets:
                         if st.button(f"🎯 {market_data['market_name']} ({market_data['query_count']})", 
-                                   key=f"popular_{market_data['market_name']}"):
+                                   key=f"popular_{market_data['market_id']}"):
                             st.session_state.suggested_market = market_data['market_name']
                             st.rerun()
                 else:
@@ -675,10 +555,9 @@ with tab1:
             )
 
             if clicked_vertical:
-                st.markdown(f"### 📈 Metrics for: {clicked_vertical}")
-                st.markdown(get_detailed_metrics(clicked_vertical) or "⚠️ No metrics found.")
-                st.markdown(f"### 🏢 Top Companies: {clicked_vertical}")
-                st.markdown(get_top_companies(clicked_vertical) or "⚠️ No company data found.")
+                render_drilldown(clicked_vertical,
+                                 f"### 📈 Metrics for: {clicked_vertical}",
+                                 f"### 🏢 Top Companies: {clicked_vertical}")
 
         if horizontal_df is not None and not horizontal_df.empty:
             horiz_col = horizontal_df.columns[0]
@@ -689,20 +568,16 @@ with tab1:
             )
 
             if clicked_horizontal:
-                st.markdown(f"### 📈 Metrics for: {clicked_horizontal}")
-                st.markdown(get_detailed_metrics(clicked_horizontal) or "⚠️ No metrics found.")
-                st.markdown(f"### 🏢 Top Companies: {clicked_horizontal}")
-                st.markdown(get_top_companies(clicked_horizontal) or "⚠️ No company data found.")
+                render_drilldown(clicked_horizontal,
+                                 f"### 📈 Metrics for: {clicked_horizontal}",
+                                 f"### 🏢 Top Companies: {clicked_horizontal}")
 
     # Manual query expander
     with st.expander("🔎 Manual Query: Explore Any Market"):
         custom_query = st.text_input("Enter any market (e.g. US plastic recycling, AI chips, etc.):", key="manual_input")
         if st.button("Run Custom Exploration"):
             with st.spinner("Fetching metrics and companies..."):
-                st.markdown("### 📈 Custom Metrics")
-                st.markdown(get_detailed_metrics(custom_query) or "⚠️ No metrics found.")
-                st.markdown("### 🏢 Custom Companies")
-                st.markdown(get_top_companies(custom_query) or "⚠️ No company data found.")
+                render_drilldown(custom_query, "### 📈 Custom Metrics", "### 🏢 Custom Companies")
 
     # Clear button for Tab 1
     if st.button("🗑️ Clear Tab 1 Data"):
@@ -751,25 +626,27 @@ with tab2:
             submit_query = st.form_submit_button("Ask")
 
         if submit_query and query:
-            with st.spinner("🤖 Querying your uploaded PDF..."):
-                try:
-                    response = query_chunks(query, st.session_state["pdf_file_id_chunks"])
-                    
-                    # Save to database AND session state
-                    save_pdf_qa_to_db(query, response)
-                    
-                    # Log analytics
-                    db.log_event('pdf_query', {
-                        'question_length': len(query),
-                        'answer_length': len(response) if response else 0,
-                        'pdf_name': st.session_state.get("uploaded_pdf_name")
-                    }, st.session_state.session_id)
-                    
-                    st.markdown("### 📑 Latest Response:")
-                    st.markdown(response or "⚠️ No answer returned.")
-                    
-                except Exception as e:
-                    st.error(f"❌ Error during query: {e}")
+            st.markdown("### 📑 Latest Response:")
+            try:
+                from query_uploaded_chunks import stream_query_chunks
+                with llm_metrics.llm_agent('pdf_qa'), llm_metrics.usage_scope() as usage:
+                    response = write_routed_stream(stream_query_chunks(query, st.session_state["pdf_file_id_chunks"]))
+                
+                # Save to database AND session state
+                save_pdf_qa_to_db(query, response, usage)
+                
+                # Log analytics
+                db.log_event('pdf_query', {
+                    'question_length': len(query),
+                    'answer_length': len(response) if response else 0,
+                    'pdf_name': st.session_state.get("uploaded_pdf_name")
+                }, st.session_state.session_id)
+                
+                if not response:
+                    st.markdown("⚠️ No answer returned.")
+                
+            except Exception as e:
+                st.error(f"❌ Error during query: {e}")
 
         # Display Q&A history from session state (which includes DB data)
         if st.session_state.get("pdf_responses"):
@@ -803,7 +680,7 @@ with tab3:
     # Display previous results if they exist
     if st.session_state.get("ma_results"):
         st.markdown(f"## Previous M&A Analysis: {st.session_state.get('ma_market_searched', 'Unknown')}")
-        st.markdown(st.session_state["ma_results"])
+        st.markdown(render_markdown(st.session_state["ma_results"], DealRow))
 
     st.markdown("Explore recent M&A activity related to the market.")
     
@@ -816,16 +693,33 @@ with tab3:
                                        ["Last 3 years", "Last 5 years", "Custom Range"])
     with col2:
         custom_range = st.text_input("If custom, enter range (e.g., 2018–2020):")
+    split_search = st.checkbox("⚡ Search each year in parallel", value=False,
+                               help="One search per year of the timeframe, run concurrently and merged into one "
+                                    "de-duplicated deal table. More complete; costs one search per year.")
 
     if st.button("🔍 Search M&A Activity"):
         if ma_market:
             timeframe_str = custom_range if timeframe_option == "Custom Range" and custom_range else timeframe_option.lower()
             
-            with st.spinner("Searching for M&A activity..."):
-                result = get_mergers_table(ma_market, timeframe_str)
-                
-                # Save to database
-                deals_count = result.count('|') // 7 if result else 0
+            st.markdown("## 🔍 M&A Analysis Results")
+            with st.spinner("Searching M&A activity..."):
+                from mergers_agent import get_mergers_table, get_mergers_table_split
+                search = get_mergers_table_split if split_search else get_mergers_table
+                with llm_metrics.llm_agent('mna'):
+                    result = search(ma_market, timeframe_str, structured=True)
+            previous = None if is_cacheable(result) else db.get_latest_ma_search(ma_market, timeframe_str)
+            if previous:
+                # Upstream failed: fall back to the last saved search for this market and timeframe
+                render_upstream_status()
+                st.caption(f"🕰️ Showing the search saved {previous['created_at']}")
+                result = previous['result_data']
+            st.markdown(render_markdown(result, DealRow))
+            if previous:
+                st.session_state["ma_results"] = result
+                st.session_state["ma_market_searched"] = ma_market
+            elif result:
+                # Save to database (compact JSON rows; rendered at display time)
+                deals_count = count_rows(result, DealRow)
                 db.save_ma_search(ma_market, timeframe_str, result, deals_count)
                 
                 # Log analytics
@@ -838,9 +732,8 @@ with tab3:
                 # Update session state
                 st.session_state["ma_results"] = result
                 st.session_state["ma_market_searched"] = ma_market
-                
-                st.markdown("## 🔍 M&A Analysis Results")
-                st.markdown(result or "⚠️ No data found.")
+            else:
+                st.markdown("⚠️ No data found.")
 
     # Cached sidebar for recent searches
     with st.sidebar:
@@ -921,16 +814,27 @@ with tab4:
         else:
             with st.spinner("Analyzing and comparing PDFs..."):
                 try:
-                    comparison_dict = compare_uploaded_pdfs(pdf_files, prompt)
+                    from compare_pdf_agent import compare_uploaded_pdfs
+                    from web_search_agent import get_web_insights
+                    with llm_metrics.llm_agent('pdf_compare'):
+                        comparison_dict = compare_uploaded_pdfs(pdf_files, prompt)
                     st.session_state["comparison_results"] = comparison_dict
                     st.session_state["compared_files"] = [f.name for f in pdf_files]
 
-                    # Perform web search if enabled
+                    # Perform web search if enabled (shared cache, keyed by normalized prompt)
                     web_insights = None
                     if enable_web_search:
                         web_prompt = prompt_web if prompt_web else prompt
-                        web_insights = search_web_insights(web_prompt)
+                        web_insights, web_cache_hit = get_web_insights(web_prompt, db)
                         st.session_state["web_insights_results"] = web_insights
+                        if web_cache_hit:
+                            st.caption("📋 Web insights from cache")
+                        elif is_cacheable(web_insights):
+                            st.caption(f"🌐 Fresh web search (cached for {expire_hours_for('web_insights')}h)")
+
+                    db.save_pdf_comparison([f.name for f in pdf_files], prompt, comparison_dict,
+                                           web_insights=web_insights, web_search_enabled=enable_web_search)
+                    db.log_event('pdf_comparison', {'files': len(pdf_files), 'web_search': enable_web_search})
 
                     # Layout results
                     st.markdown("## 📊 Comparison Result")
@@ -1023,6 +927,7 @@ with tab5:
                                                 DELETE FROM market_cache WHERE market_name = ?
                                             """, (market_name,))
                                             deleted_count = cursor.rowcount
+                                        invalidate_caches()
                                         
                                         st.success(f"✅ Deleted {deleted_count} analyses for {market_name}")
                                         st.session_state[confirm_key] = False
@@ -1049,6 +954,7 @@ with tab5:
                                                 DELETE FROM market_cache 
                                                 WHERE market_name = ? AND query_type = ?
                                             """, (market_name, analysis['query_type']))
+                                        invalidate_caches()
                                         
                                         st.success(f"✅ Deleted {analysis['query_type']} analysis for {market_name}")
                                         st.rerun()
@@ -1187,6 +1093,7 @@ with tab5:
                                                 DELETE FROM ma_searches 
                                                 WHERE market_name = ? AND created_at = ?
                                             """, (search['market_name'], search['created_at']))
+                                        invalidate_caches()
                                         
                                         st.success(f"✅ Deleted M&A search for {search['market_name']}")
                                         st.rerun()
@@ -1248,8 +1155,10 @@ with tab5:
                                     DELETE FROM pdf_qa;
                                     DELETE FROM pdf_history;
                                     DELETE FROM ma_searches;
+                                    DELETE FROM pdf_comparisons;
                                 """)
                                 st.success("✅ Deleted all history data")
+                        invalidate_caches()
                         
                         st.session_state[confirm_key] = False
                         st.rerun()
@@ -1283,7 +1192,7 @@ with tab5:
                             for market_name, query_type, result_data, created_at in cursor.fetchall():
                                 safe_name = market_name.replace('/', '_').replace(' ', '_')
                                 filename = f"market_{safe_name}_{query_type}_{created_at[:10]}.md"
-                                zip_file.writestr(filename, result_data)
+                                zip_file.writestr(filename, cached_result_markdown(query_type, result_data))
                     
                     # Export PDF Q&As (if in filter)
                     if history_type in ["All", "PDF Sessions"]:
@@ -1368,10 +1277,11 @@ with tab6:
     # === MANAGEMENT SECTION ===
     st.markdown("### 🗂️ Data Management")
     
-    management_tab1, management_tab2, management_tab3 = st.tabs([
+    management_tab1, management_tab2, management_tab3, management_tab4 = st.tabs([
         "🗑️ Delete Data", 
         "📈 Analytics", 
-        "⚙️ Maintenance"
+        "⚙️ Maintenance",
+        "🤖 LLM Calls"
     ])
     
     # DELETE DATA TAB
@@ -1407,6 +1317,7 @@ with tab6:
                         with sqlite3.connect(db.db_path) as conn:
                             for market in markets_to_delete:
                                 conn.execute("DELETE FROM market_cache WHERE market_name = ?", (market,))
+                        invalidate_caches()
                         st.success(f"✅ Deleted {len(markets_to_delete)} markets from cache")
                         st.rerun()
             else:
@@ -1417,6 +1328,7 @@ with tab6:
                 if st.session_state.get("confirm_clear_cache", False):
                     with sqlite3.connect(db.db_path) as conn:
                         conn.execute("DELETE FROM market_cache")
+                    invalidate_caches()
                     st.success("✅ All market cache cleared!")
                     st.session_state.confirm_clear_cache = False
                     st.rerun()
@@ -1471,6 +1383,7 @@ with tab6:
                                 WHERE created_at < datetime('now', '-{} days')
                             """.format(days_old))
                             deleted_count = cursor.rowcount
+                        invalidate_caches()
                         st.success(f"✅ Deleted {deleted_count} old M&A searches")
                         st.rerun()
             else:
@@ -1495,6 +1408,7 @@ with tab6:
                     use_container_width=True,
                     column_config={
                         "market_name": st.column_config.TextColumn("Market", width="medium"),
+                        "market_id": st.column_config.TextColumn("Canonical ID", width="small"),
                         "query_count": st.column_config.NumberColumn("Queries", format="%d"),
                         "last_queried": st.column_config.DatetimeColumn("Last Query")
                     }
@@ -1521,6 +1435,7 @@ with tab6:
                 usage_data = cursor.fetchall()
             
             if usage_data:
+                import pandas as pd
                 usage_df = pd.DataFrame(usage_data, columns=['Date', 'Events'])
                 st.line_chart(usage_df.set_index('Date'), height=200)
                 
@@ -1630,9 +1545,12 @@ with tab6:
                             DELETE FROM pdf_qa;
                             DELETE FROM pdf_history;
                             DELETE FROM ma_searches;
+                            DELETE FROM pdf_comparisons;
                             DELETE FROM usage_analytics;
+                            DELETE FROM llm_calls;
                             VACUUM;
                         """)
+                    invalidate_caches()
                     st.success("✅ All data has been reset!")
                     st.session_state.confirm_reset = False
                     st.rerun()
@@ -1640,6 +1558,85 @@ with tab6:
                     st.session_state.confirm_reset = True
                     st.error("⚠️ **DANGER**: This will delete ALL data! Click again to confirm.")
 
+    # LLM CALLS TAB
+    with management_tab4:
+        st.markdown("#### 🤖 Upstream LLM Calls")
+        circuit = breaker.snapshot()
+        st.caption(f"🔌 Circuit breaker: {circuit['state'].replace('_', '-')} · "
+                   f"{circuit['error_rate']:.0%} errors over {circuit['calls']} recent calls · "
+                   f"tripped {circuit['trips']} times since start")
+        llm_days = st.selectbox("Period:", [1, 7, 30], index=1, format_func=lambda x: f"Last {x} days",
+                                key="llm_stats_days")
+        agent_stats = db.get_llm_agent_stats(days=llm_days)
+        
+        if agent_stats:
+            import pandas as pd
+            stats_df = pd.DataFrame(agent_stats)
+            lookups = stats_df['upstream_calls'] + stats_df['cache_hits']
+            stats_df['cache_hit_ratio'] = (stats_df['cache_hits'] / lookups.where(lookups > 0)).fillna(0)
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("📡 Upstream Calls", int(stats_df['upstream_calls'].sum()))
+            with col2:
+                st.metric("💵 Cost (USD)", f"${stats_df['cost_usd'].sum():.2f}")
+            with col3:
+                st.metric("🧮 Tokens", f"{int(stats_df['input_tokens'].sum() + stats_df['output_tokens'].sum()):,}")
+            with col4:
+                st.metric("❌ Errors", int(stats_df['errors'].sum()))
+            
+            st.dataframe(
+                stats_df,
+                use_container_width=True,
+                column_config={
+                    "agent": st.column_config.TextColumn("Agent"),
+                    "upstream_calls": st.column_config.NumberColumn("Calls", format="%d"),
+                    "cache_hits": st.column_config.NumberColumn("Cache Hits", format="%d"),
+                    "cache_hit_ratio": st.column_config.NumberColumn("Hit Ratio", format="%.2f"),
+                    "avg_latency_ms": st.column_config.NumberColumn("Avg Latency (ms)", format="%.0f"),
+                    "cost_usd": st.column_config.NumberColumn("Cost (USD)", format="$%.4f"),
+                }
+            )
+            
+            st.markdown("##### 💵 Cost per Agent")
+            st.bar_chart(stats_df.set_index('agent')['cost_usd'], height=250)
+            
+            st.markdown("##### ⏱️ Latency Distribution")
+            latencies = pd.DataFrame(db.get_llm_latencies(days=llm_days))
+            if not latencies.empty:
+                bins = [0, 1, 2, 5, 10, 20, 30, 60, float("inf")]
+                labels = ["<1s", "1-2s", "2-5s", "5-10s", "10-20s", "20-30s", "30-60s", ">60s"]
+                latencies['bucket'] = pd.cut(latencies['latency_ms'] / 1000, bins=bins, labels=labels, right=False)
+                histogram = pd.crosstab(latencies['bucket'], latencies['agent']).reindex(labels, fill_value=0)
+                st.bar_chart(histogram, height=300)
+                st.caption(f"p50 {latencies['latency_ms'].quantile(0.5) / 1000:.1f}s · "
+                           f"p95 {latencies['latency_ms'].quantile(0.95) / 1000:.1f}s · "
+                           f"p99 {latencies['latency_ms'].quantile(0.99) / 1000:.1f}s")
+            
+            routing = pd.DataFrame(db.get_model_routing_stats(days=llm_days))
+            if not routing.empty:
+                st.markdown("##### 🔀 Model Routing")
+                per_agent = routing.groupby('agent')[['calls', 'escalated_calls']].sum()
+                first_tier = (per_agent['calls'] - per_agent['escalated_calls']).where(lambda n: n > 0)
+                per_agent['escalation_rate'] = (per_agent['escalated_calls'] / first_tier).fillna(0)
+                st.dataframe(
+                    per_agent.reset_index(),
+                    use_container_width=True,
+                    column_config={
+                        "escalation_rate": st.column_config.NumberColumn("Escalation Rate", format="%.2f"),
+                    }
+                )
+                st.dataframe(
+                    routing,
+                    use_container_width=True,
+                    column_config={
+                        "avg_latency_ms": st.column_config.NumberColumn("Avg Latency (ms)", format="%.0f"),
+                        "cost_usd": st.column_config.NumberColumn("Cost (USD)", format="$%.4f"),
+                    }
+                )
+        else:
+            st.info("🤖 No LLM calls recorded yet")
+
     st.markdown("---")
     
     # === QUICK STATS FOOTER ===
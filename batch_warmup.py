@@ -0,0 +1,239 @@
+# batch_warmup.py
+
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, Iterator, List, Tuple
+from global_metrics_agent import build_global_overview_request
+from metrics_agent import build_detailed_metrics_request
+from companies_agent import build_top_companies_request
+from submarkets_agent import build_submarkets_request
+from llm_client import get_client, upload_file
+from market_db import WorkingMarketDB
+from market_schemas import ROW_TYPES, STRUCTURED_QUERY, SubmarketsResult, parse_rows, rows_or_message
+from utils import split_tables, markdown_table_to_dataframe
+
+# query_type -> request builder; results land in market_cache under the same query_type
+BATCH_REQUEST_BUILDERS = {
+    'global': build_global_overview_request,
+    'submarkets': build_submarkets_request,
+    'metrics': build_detailed_metrics_request,
+    'companies': build_top_companies_request,
+}
+
+# Drilldowns are warmed in structured mode, the form the app and prefetcher read
+STRUCTURED_BATCH_TYPES = {'metrics', 'companies'}
+
+# Structured results are validated and compacted before they are cached
+BATCH_RESULT_PARSERS = {
+    'submarkets': lambda text: SubmarketsResult.from_json(text).to_json(),
+    'metrics': lambda text: rows_or_message(parse_rows(text, ROW_TYPES['metrics']), ""),
+    'companies': lambda text: rows_or_message(parse_rows(text, ROW_TYPES['companies']), ""),
+}
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+CUSTOM_ID_SEPARATOR = "::"
+
+
+def write_batch_jsonl(jobs: List[Tuple[str, str]], path: str) -> int:
+    """Write (market_name, query_type) jobs as Batch API request lines; returns the line count"""
+    with open(path, "w") as f:
+        for market_name, query_type in jobs:
+            f.write(json.dumps({
+                "custom_id": f"{query_type}{CUSTOM_ID_SEPARATOR}{market_name}",
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": (BATCH_REQUEST_BUILDERS[query_type](market_name, structured=True)
+                         if query_type in STRUCTURED_BATCH_TYPES else BATCH_REQUEST_BUILDERS[query_type](market_name)),
+            }) + "\n")
+    return len(jobs)
+
+
+def extract_body_text(body: dict) -> str:
+    """Text of the first message item of a Responses API body (plain dict form)"""
+    for item in body.get("output", []):
+        if item.get("type") == "message":
+            return "".join(part.get("text", "") for part in item.get("content", [])).strip()
+    return ""
+
+
+class OpenAIBatchBackend:
+    """Submits through the real Batch API on the shared client"""
+
+    def submit(self, jsonl_path: str) -> str:
+        with open(jsonl_path, "rb") as f:
+            batch_file = upload_file(f, purpose="batch")
+        batch = get_client().batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/responses",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return get_client().batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> Iterator[dict]:
+        batch = get_client().batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                for line in get_client().files.content(file_id).text.splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+
+
+# Default LocalBatchBackend answers for the structured query types
+CANNED_RESULTS = {
+    'submarkets': '{"vertical":[{"sub_market":"Canned","source":"local"}],"horizontal":[]}',
+    'metrics': '{"rows":[{"metric":"Market Size","value":"canned","source":"local"}]}',
+    'companies': '{"rows":[{"company":"Canned Co","market_share":"0","basis":"local","source":"local"}]}',
+}
+
+
+class LocalBatchBackend:
+    """
+    Local stand-in for the Batch API: accepts the same JSONL, completes after a few polls
+    and answers every request from `canned` (query_type -> text) in the Batch output format.
+    """
+
+    def __init__(self, canned: Dict[str, str] = None, polls_until_complete: int = 1):
+        self.canned = canned or {}
+        self.polls_until_complete = polls_until_complete
+        self._batches = {}
+
+    def submit(self, jsonl_path: str) -> str:
+        with open(jsonl_path) as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        for request in requests:
+            if request.get("url") != "/v1/responses" or "body" not in request:
+                raise ValueError(f"Invalid batch line: {request.get('custom_id')}")
+        batch_id = f"batch_local_{len(self._batches) + 1}"
+        self._batches[batch_id] = {"requests": requests, "polls": 0}
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        batch = self._batches[batch_id]
+        batch["polls"] += 1
+        return "completed" if batch["polls"] >= self.polls_until_complete else "in_progress"
+
+    def results(self, batch_id: str) -> Iterator[dict]:
+        for i, request in enumerate(self._batches[batch_id]["requests"]):
+            query_type = request["custom_id"].split(CUSTOM_ID_SEPARATOR, 1)[0]
+            default = CANNED_RESULTS.get(query_type, f"| Metric | Value |\n|---|---|\n| canned | {query_type} |")
+            text = self.canned.get(query_type, default)
+            yield {
+                "id": f"batch_req_{i}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]},
+                },
+                "error": None,
+            }
+
+
+def ingest_batch_results(db, results: Iterator[dict], expire_hours: int = 24) -> Dict[str, int]:
+    """Write successful batch results into market_cache"""
+    stats = {"cached": 0, "failed": 0}
+    for line in results:
+        query_type, market_name = line["custom_id"].split(CUSTOM_ID_SEPARATOR, 1)
+        response = line.get("response") or {}
+        text = extract_body_text(response.get("body") or {}) if response.get("status_code") == 200 else ""
+        if text and query_type in BATCH_RESULT_PARSERS:
+            try:
+                text = BATCH_RESULT_PARSERS[query_type](text)
+            except (ValueError, TypeError) as e:
+                print(f"⚠️ Unparseable {query_type} result for {market_name}: {e}")
+                text = ""
+        if text:
+            query = STRUCTURED_QUERY if query_type in STRUCTURED_BATCH_TYPES else {}
+            db.cache_result(market_name, query_type, text, source='batch', expire_hours=expire_hours, **query)
+            stats["cached"] += 1
+        else:
+            print(f"❌ Batch request failed for {query_type} / {market_name}: {line.get('error')}")
+            stats["failed"] += 1
+    return stats
+
+
+def run_batch_warmup(db, jobs: List[Tuple[str, str]], backend=None,
+                     poll_interval: float = 60, expire_hours: int = 24) -> Dict[str, int]:
+    """Write jobs as JSONL, submit, poll until done and ingest the results into market_cache"""
+    backend = backend or OpenAIBatchBackend()
+    if not jobs:
+        return {"submitted": 0, "cached": 0, "failed": 0}
+
+    fd, jsonl_path = tempfile.mkstemp(suffix=".jsonl", prefix="batch_warmup_")
+    os.close(fd)
+    try:
+        submitted = write_batch_jsonl(jobs, jsonl_path)
+        batch_id = backend.submit(jsonl_path)
+        print(f"📦 Submitted batch {batch_id} with {submitted} requests")
+
+        status = backend.status(batch_id)
+        while status not in TERMINAL_STATUSES:
+            print(f"⏳ Batch {batch_id}: {status}")
+            time.sleep(poll_interval)
+            status = backend.status(batch_id)
+
+        print(f"✅ Batch {batch_id} finished with status '{status}'")
+        stats = ingest_batch_results(db, backend.results(batch_id), expire_hours=expire_hours)
+        stats["submitted"] = submitted
+        db.log_event('batch_warmup', {'batch_id': batch_id, 'status': status, **stats})
+        return stats
+    finally:
+        os.remove(jsonl_path)
+
+
+def listed_submarkets(db, market: str) -> List[str]:
+    """Sub-market names shown in the sidebar for a market, from its cached tables"""
+    cached = db.get_cached_result(market, 'submarkets')
+    if cached:
+        try:
+            result = SubmarketsResult.from_json(cached['data'])
+            return [row.sub_market for row in result.vertical + result.horizontal]
+        except (ValueError, TypeError):
+            pass
+
+    # Older analyses cached the two markdown tables separately
+    names = []
+    for analysis_type in ['vertical', 'horizontal']:
+        cached = db.get_cached_result(market, analysis_type)
+        if cached:
+            df = markdown_table_to_dataframe(split_tables(cached['data'] + "\n")[0])
+            if not df.empty:
+                # Same values the sidebar radio uses, so the cache keys line up
+                names.extend(df[df.columns[0]].dropna().unique().tolist())
+    return names
+
+
+def collect_warmup_jobs(db, markets: List[str], query_types: List[str]) -> List[Tuple[str, str]]:
+    """
+    Build (market_name, query_type) jobs. 'global' and 'submarkets' run per market; 'metrics'
+    and 'companies' run per sub-market listed in each market's cached sub-market tables.
+    """
+    jobs = []
+    drilldown_types = [t for t in query_types if t in ('metrics', 'companies')]
+    for market in markets:
+        jobs.extend((market, t) for t in query_types if t in ('global', 'submarkets'))
+        if drilldown_types:
+            for submarket in listed_submarkets(db, market):
+                jobs.extend((submarket, query_type) for query_type in drilldown_types)
+    return list(dict.fromkeys(jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm market_cache through the Batch API")
+    parser.add_argument("--markets", nargs="*", default=[], help="Markets to warm (default: most requested markets)")
+    parser.add_argument("--top", type=int, default=20, help="Number of most requested markets when --markets is empty")
+    parser.add_argument("--types", nargs="+", default=list(BATCH_REQUEST_BUILDERS), choices=list(BATCH_REQUEST_BUILDERS))
+    parser.add_argument("--poll-interval", type=float, default=60)
+    parser.add_argument("--local", action="store_true", help="Use the local stand-in instead of the Batch API")
+    args = parser.parse_args()
+
+    db = WorkingMarketDB()
+    markets = args.markets or [m['market_name'] for m in db.get_requested_markets(days=30, limit=args.top)]
+    jobs = collect_warmup_jobs(db, markets, args.types)
+    backend = LocalBatchBackend() if args.local else OpenAIBatchBackend()
+    print(run_batch_warmup(db, jobs, backend, poll_interval=0 if args.local else args.poll_interval))
@@ -0,0 +1,217 @@
+# bench_flows.py
+
+import io
+import os
+import math
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import resource
+import subprocess
+import multiprocessing
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+FLOWS = ['market_analysis', 'drilldown', 'mna', 'pdf_qa', 'pdf_compare']
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def make_pdf(pages: int, label: str) -> io.BytesIO:
+    """In-memory PDF with `pages` pages of text, named like an upload"""
+    import fitz
+    doc = fitz.open()
+    for page_number in range(pages):
+        doc.new_page().insert_text((72, 72), f"{label} report, page {page_number + 1}")
+    data = io.BytesIO(doc.tobytes())
+    data.name = f"{label}.pdf"
+    doc.close()
+    return data
+
+
+class FlowContext:
+    """What a flow needs: the database, a seeded RNG and the simulated workload"""
+
+    def __init__(self, db, rng: random.Random, markets: int, pdf_pages: int):
+        self.db = db
+        self.rng = rng
+        self.markets = [f"Benchmark Market {i}" for i in range(markets)]
+        self.pdf_pages = pdf_pages
+
+    def pick_market(self) -> str:
+        # Zipf-like popularity, so repeated runs exercise the cache the way real traffic does
+        weights = [1 / (rank + 1) for rank in range(len(self.markets))]
+        return self.rng.choices(self.markets, weights=weights)[0]
+
+
+# === FLOWS: each returns (cache_hits, cache_lookups) ===
+def flow_market_analysis(ctx: FlowContext) -> Tuple[int, int]:
+    """Tab 1: overview streamed in the script thread while sub-markets are fetched concurrently"""
+    from market_orchestrator import fan_out_market_analysis, fetch_market_analysis
+    from global_metrics_agent import stream_global_overview
+    market = ctx.pick_market()
+    pending = fan_out_market_analysis(market, ['submarkets'], ctx.db)
+    _, global_hit = fetch_market_analysis(market, 'global', ctx.db,
+                                          fetch=lambda name: "".join(stream_global_overview(name)))
+    hits = [global_hit] + [hit for _, _, hit in pending]
+    return sum(hits), len(hits)
+
+
+def flow_drilldown(ctx: FlowContext) -> Tuple[int, int]:
+    """Sidebar: metrics and top companies for one sub-market"""
+    from market_orchestrator import fetch_drilldown
+    submarket = f"{ctx.pick_market()} / segment {ctx.rng.randint(1, 8)}"
+    hits = [cache_hit for _, cache_hit in fetch_drilldown(submarket, ctx.db).values()]
+    return sum(hits), len(hits)
+
+
+def flow_mna(ctx: FlowContext) -> Tuple[int, int]:
+    """Tab 3: one M&A search (not cached)"""
+    from mergers_agent import get_mergers_table
+    get_mergers_table(ctx.pick_market(), "last 3 years", structured=True)
+    return 0, 0
+
+
+def flow_pdf_qa(ctx: FlowContext) -> Tuple[int, int]:
+    """Tab 2: upload with de-duplication by hash, then one question over every chunk"""
+    from split_and_upload_chunks import chunk_ranges, split_and_upload_pdf_chunks
+    from query_uploaded_chunks import query_chunks
+    pdf = make_pdf(ctx.pdf_pages, ctx.pick_market().replace(" ", "_"))
+    content = pdf.getvalue()
+    existing = ctx.db.get_pdf_by_hash(hashlib.md5(content).hexdigest())
+    if existing:
+        # Same page ranges the upload produced, so cached and fresh runs ask identical questions
+        chunks = [{'file_id': file_id, 'start': start, 'end': end}
+                  for file_id, (start, end) in zip(existing['openai_file_ids'], chunk_ranges(existing['total_pages']))]
+    else:
+        chunks = split_and_upload_pdf_chunks(pdf)
+        ctx.db.save_pdf_processing(pdf.name, content, ctx.pdf_pages, [c['file_id'] for c in chunks])
+    query_chunks("What is the market size?", chunks)
+    return int(existing is not None), 1
+
+
+def flow_pdf_compare(ctx: FlowContext) -> Tuple[int, int]:
+    """Tab 4: compare two PDFs (not cached)"""
+    from compare_pdf_agent import compare_uploaded_pdfs
+    pdfs = [make_pdf(ctx.pdf_pages, f"compare_{i}") for i in range(2)]
+    compare_uploaded_pdfs(pdfs, "Compare the market outlooks.")
+    return 0, 0
+
+
+FLOW_FUNCTIONS = {name: globals()[f"flow_{name}"] for name in FLOWS}
+
+
+def run_flow(flow: str, settings: dict) -> Dict:
+    """Run one flow `iterations` times against a fresh replay server and database"""
+    from llm_client import use_replay_server
+    from market_db import WorkingMarketDB
+    from replay_transport import Cassette, FaultProfile, ReplayServer
+
+    server = ReplayServer(
+        Cassette(settings['cassette']),
+        FaultProfile(latency_ms=settings['latency_ms'], latency_sigma=settings['latency_sigma'],
+                     rate_limit_rate=settings['rate_limit_rate'], error_rate=settings['error_rate'],
+                     seed=settings['seed']),
+    )
+    use_replay_server(server)
+    db_dir = tempfile.mkdtemp(prefix="bench_")
+    ctx = FlowContext(WorkingMarketDB(os.path.join(db_dir, "bench.db")), random.Random(settings['seed']),
+                      settings['markets'], settings['pdf_pages'])
+
+    timings, hits, lookups, errors = [], 0, 0, 0
+    for _ in range(settings['iterations']):
+        started = time.perf_counter()
+        try:
+            flow_hits, flow_lookups = FLOW_FUNCTIONS[flow](ctx)
+            hits += flow_hits
+            lookups += flow_lookups
+        except Exception as e:
+            print(f"❌ {flow} iteration failed: {e}")
+            errors += 1
+        timings.append(time.perf_counter() - started)
+
+    return {
+        'iterations': settings['iterations'],
+        'errors': errors,
+        'p50_s': round(percentile(timings, 50), 4),
+        'p95_s': round(percentile(timings, 95), 4),
+        'p99_s': round(percentile(timings, 99), 4),
+        'mean_s': round(sum(timings) / len(timings), 4) if timings else 0.0,
+        'upstream_calls': server.total_calls(),
+        'upstream_calls_by_path': dict(server.calls),
+        'cache_hit_ratio': round(hits / lookups, 4) if lookups else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def _run_isolated(flow: str, settings: dict) -> Dict:
+    # A fresh process per flow, so peak RSS and warm caches don't leak between flows
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_flow, (flow, settings))
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark of the analysis flows (offline)")
+    parser.add_argument("--flows", nargs="+", default=FLOWS, choices=FLOWS)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--markets", type=int, default=10, help="Distinct markets in the simulated workload")
+    parser.add_argument("--pdf-pages", type=int, default=120)
+    parser.add_argument("--latency-ms", type=float, default=2500, help="Median simulated upstream latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.6, help="Lognormal spread (tail heaviness)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02, help="Share of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 500")
+    parser.add_argument("--cassette", default=None, help="Recorded cassette (default: synthesized answers)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=f"bench_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    args = parser.parse_args()
+
+    settings = {
+        'iterations': args.iterations,
+        'markets': args.markets,
+        'pdf_pages': args.pdf_pages,
+        'latency_ms': args.latency_ms,
+        'latency_sigma': args.latency_sigma,
+        'rate_limit_rate': args.rate_limit_rate,
+        'error_rate': args.error_rate,
+        'cassette': args.cassette,
+        'seed': args.seed,
+    }
+    results = {}
+    for flow in args.flows:
+        print(f"⏱️ Running {flow} x{args.iterations}")
+        results[flow] = _run_isolated(flow, settings)
+        print(f"   p50 {results[flow]['p50_s']}s  p95 {results[flow]['p95_s']}s  "
+              f"calls {results[flow]['upstream_calls']}  hit ratio {results[flow]['cache_hit_ratio']}")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            'revision': git_revision(),
+            'run_at': datetime.now().isoformat(timespec="seconds"),
+            'settings': settings,
+            'flows': results,
+        }, f, indent=2)
+    print(f"✅ Results written to {args.out}")
@@ -0,0 +1,114 @@
+# bench_import_time.py
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+from bench_flows import git_revision
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Entry points whose cold start we track: the Streamlit worker (app.py in bare mode) and the CLI scripts
+TARGETS = {
+    'streamlit_app': 'app',
+    'cache_warmer': 'cache_warmer',
+    'batch_warmup': 'batch_warmup',
+    'bench_flows': 'bench_flows',
+}
+
+# "import time:  self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Rows of -X importtime output as {module, self_us, cumulative_us, depth}"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({'module': module, 'self_us': int(self_us), 'cumulative_us': int(cumulative_us),
+                         'depth': (len(indent) - 1) // 2})
+    return rows
+
+
+def profile_import(module: str, cwd: str) -> Dict:
+    """Import `module` once in a fresh interpreter and summarize where the time went"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=cwd, env=env)
+    wall_ms = (time.perf_counter() - started) * 1000
+    rows = parse_importtime(proc.stderr)
+    top_level = [row for row in rows if row['depth'] == 0]
+
+    # Self time summed per top-level package, so e.g. everything pandas pulls in counts as pandas
+    by_package = {}
+    for row in rows:
+        package = row['module'].split('.')[0]
+        by_package[package] = by_package.get(package, 0) + row['self_us']
+
+    result = {
+        'ok': proc.returncode == 0,
+        'wall_ms': round(wall_ms, 1),
+        'import_ms': round(sum(row['cumulative_us'] for row in top_level) / 1000, 1),
+        'by_package_ms': {name: round(us / 1000, 1)
+                          for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:15]},
+        'slowest_self_ms': [(row['module'], round(row['self_us'] / 1000, 1))
+                            for row in sorted(rows, key=lambda r: -r['self_us'])[:15]],
+    }
+    if proc.returncode != 0:
+        result['error'] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"
+    return result
+
+
+def benchmark_target(module: str, runs: int) -> Dict:
+    """Median over `runs` fresh interpreters; the first (coldest) run is reported separately"""
+    with tempfile.TemporaryDirectory(prefix="importtime_") as cwd:  # keeps app.py's database out of the repo
+        profiles = [profile_import(module, cwd) for _ in range(runs)]
+    imports = [p['import_ms'] for p in profiles]
+    median_run = sorted(profiles, key=lambda p: p['import_ms'])[len(profiles) // 2]
+    return {
+        'module': module,
+        'runs': runs,
+        'first_run_import_ms': imports[0],
+        'median_import_ms': round(statistics.median(imports), 1),
+        'median_wall_ms': round(statistics.median(p['wall_ms'] for p in profiles), 1),
+        'ok': all(p['ok'] for p in profiles),
+        **{key: median_run[key] for key in ('by_package_ms', 'slowest_self_ms', 'error') if key in median_run},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start import time of the app and CLI scripts (-X importtime)")
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per target")
+    parser.add_argument("--out", default=f"import_times_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    args = parser.parse_args()
+
+    results = {}
+    for target in args.targets:
+        print(f"⏱️ Importing {TARGETS[target]} x{args.runs}")
+        results[target] = benchmark_target(TARGETS[target], args.runs)
+        status = "" if results[target]['ok'] else f"  ❌ {results[target].get('error')}"
+        print(f"   median {results[target]['median_import_ms']}ms imports, "
+              f"{results[target]['median_wall_ms']}ms wall{status}")
+        for package, ms in list(results[target]['by_package_ms'].items())[:5]:
+            print(f"     {package:<24} {ms}ms")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            'revision': git_revision(),
+            'run_at': datetime.now().isoformat(timespec="seconds"),
+            'python': sys.version.split()[0],
+            'targets': results,
+        }, f, indent=2)
+    print(f"✅ Results written to {args.out}")
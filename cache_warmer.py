@@ -0,0 +1,87 @@
+# cache_warmer.py
+
+import time
+import random
+import argparse
+import llm_metrics
+from typing import Dict, List, Optional
+from market_db import WorkingMarketDB
+from market_names import MarketKey
+from market_orchestrator import MARKET_AGENTS, expire_hours_for, refresh_analysis
+from market_schemas import STRUCTURED_QUERY
+
+
+def plan_refreshes(db, top: int = 20, horizon_hours: float = 6, days: int = 30) -> List[Dict]:
+    """
+    Entries of the top-N most requested markets that go stale within horizon_hours,
+    most requested market first, soonest expiry first within a market.
+    """
+    popular = db.get_requested_markets(days=days, limit=top)
+    rank = {m['market_id']: i for i, m in enumerate(popular)}
+    entries = [e for e in db.get_expiring_entries([m['market_name'] for m in popular], horizon_hours)
+               if e['query_type'] in MARKET_AGENTS]
+    return sorted(entries, key=lambda e: (rank[MarketKey(e['canonical_name'], e['region']).market_id],
+                                          e['refresh_at']))
+
+
+def run_warm_cycle(db, top: int = 20, horizon_hours: float = 6, max_refreshes: int = 10,
+                   expire_hours: Optional[int] = None) -> Dict:
+    """
+    Refresh what is about to expire, stopping at max_refreshes upstream calls.
+    Refreshed entries get their analysis type's TTL unless expire_hours overrides it.
+    """
+    distribution = db.get_expiry_distribution(bucket_hours=1)
+    plan = plan_refreshes(db, top, horizon_hours)
+    print(f"🔥 {len(plan)} entries expiring within {horizon_hours}h; budget {max_refreshes}")
+
+    refreshed, failed, skipped = [], [], []
+    for entry in plan:
+        key = f"{entry['market_name']}:{entry['query_type']}"
+        if len(refreshed) + len(failed) >= max_refreshes:
+            skipped.append(key)
+            continue
+        # Structured (JSON) entries are refreshed in structured mode
+        structured = entry['query_hash'] == db.generate_query_hash(entry['market_name'], entry['query_type'],
+                                                                   **STRUCTURED_QUERY)
+        query = STRUCTURED_QUERY if structured else {}
+        # Claim it like a stale-while-revalidate refresh so the app doesn't refresh it too
+        if not db.mark_refreshing(entry['market_name'], entry['query_type'], **query):
+            skipped.append(key)
+            continue
+        try:
+            ok = refresh_analysis(entry['market_name'], entry['query_type'], db,
+                                  expire_hours or expire_hours_for(entry['query_type']), structured)
+        except Exception as e:
+            print(f"❌ Warm-up failed for {key}: {e}")
+            ok = False
+        (refreshed if ok else failed).append(key)
+
+    stats = {
+        'refreshed': refreshed,
+        'failed': failed,
+        'skipped': skipped,
+        'budget': max_refreshes,
+        'horizon_hours': horizon_hours,
+        'expiry_distribution': distribution,
+    }
+    db.log_event('cache_warm', stats)
+    print(f"✅ Warmed {len(refreshed)}, failed {len(failed)}, skipped {len(skipped)}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh popular market_cache entries before they expire")
+    parser.add_argument("--top", type=int, default=20, help="Number of most requested markets to keep warm")
+    parser.add_argument("--horizon-hours", type=float, default=6, help="Refresh entries going stale within this window")
+    parser.add_argument("--max-refreshes", type=int, default=10, help="Upstream call budget per run")
+    parser.add_argument("--interval-minutes", type=float, default=0, help="Repeat every N minutes (0 = run once)")
+    args = parser.parse_args()
+
+    db = WorkingMarketDB()
+    llm_metrics.configure(db.db_path)
+    while True:
+        run_warm_cycle(db, args.top, args.horizon_hours, args.max_refreshes)
+        if not args.interval_minutes:
+            break
+        # Jitter the schedule too, so several warmers don't fire in lockstep
+        time.sleep(args.interval_minutes * 60 * random.uniform(0.9, 1.1))
@@ -0,0 +1,132 @@
+# circuit_breaker.py
+
+import time
+import threading
+from collections import deque
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Upstream calls are short-circuited while the breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Trips when the error rate of recent upstream calls passes a threshold.
+    Closed: calls flow and outcomes are tracked over a sliding time window.
+    Open: calls fail fast with CircuitOpenError for `cooldown` seconds.
+    Half-open: up to `probes` calls go through; a probe's success closes the breaker, its failure
+    reopens it. Calls admitted before the breaker opened can't change its state once it has.
+    """
+
+    def __init__(self, error_threshold: float = 0.5, min_calls: int = 6, window: float = 60.0,
+                 cooldown: float = 30.0, probes: int = 1):
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.probes = probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self._outcomes = deque()  # (time, failed)
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    # === STATE ===
+    def _trim(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(failed for _, failed in self._outcomes) / len(self._outcomes)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._probes_in_flight = 0
+        print(f"🔌 Circuit opened: upstream error rate {self._error_rate():.0%}, "
+              f"failing fast for {self.cooldown:.0f}s")
+
+    def _maybe_half_open(self, now: float):
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+
+    def allows_requests(self) -> bool:
+        """Whether a call made now would be let through (without claiming a probe)"""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self.state == CLOSED:
+                return True
+            return self.state == HALF_OPEN and self._probes_in_flight < self.probes
+
+    # === CALL LIFECYCLE ===
+    def before_call(self, what: str = "LLM call") -> bool:
+        """
+        Let a call through or raise CircuitOpenError. Returns whether the call is a half-open
+        probe; pass that to the record_* / release call that ends it.
+        """
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                print(f"🔌 Circuit half-open, probing upstream with {what}")
+                return True
+        raise CircuitOpenError(f"{what} skipped: upstream circuit is open")
+
+    def record_success(self, probe: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if probe and self.state == HALF_OPEN:
+                print("🔌 Circuit closed: probe succeeded")
+                self.state = CLOSED
+                self._outcomes.clear()
+                self._probes_in_flight = 0
+                return
+            if self.state != CLOSED:
+                return  # a call admitted before the breaker tripped; only probes decide
+            self._outcomes.append((now, False))
+            self._trim(now)
+
+    def record_failure(self, probe: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if probe and self.state == HALF_OPEN:
+                self._open(now)
+                return
+            if self.state != CLOSED:
+                return  # a call admitted before the breaker tripped
+            self._outcomes.append((now, True))
+            self._trim(now)
+            if len(self._outcomes) >= self.min_calls and self._error_rate() >= self.error_threshold:
+                self._open(now)
+
+    def release(self, probe: bool = False):
+        """A call ended without a health signal (cancelled, 4xx, 429); frees its probe slot"""
+        with self._lock:
+            if probe and self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def snapshot(self) -> Dict:
+        """State for the UI: state, error_rate, calls in the window, seconds until the next probe"""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            self._trim(now)
+            return {
+                'state': self.state,
+                'error_rate': round(self._error_rate(), 3),
+                'calls': len(self._outcomes),
+                'retry_in': round(max(0.0, self.opened_at + self.cooldown - now), 1) if self.state == OPEN else 0.0,
+                'trips': self.trips,
+            }
@@ -1,11 +1,11 @@
 # companies_agent.py
 
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-import streamlit as st
-load_dotenv()
-client = OpenAI()
+from llm_client import extract_message_text
+from model_router import create_routed_response
+from typing import Dict, List
+from market_schemas import (CompanyRow, BATCHED_INSTRUCTIONS, STRUCTURED_INSTRUCTIONS, batched_input, batched_schema,
+                            json_schema_format, parse_batched_rows, parse_rows, rows_or_message, rows_to_json,
+                            table_schema)
 
 MODEL = "gpt-4o"
 
@@ -31,22 +31,68 @@ Strict rules:
 
 TOOLS = [{"type": "web_search_preview"}]
 
-def get_top_companies(submarket: str) -> str:
+def build_top_companies_request(submarket: str, structured: bool = False) -> dict:
+    """Request body for responses.create (shared by the interactive and batch paths)"""
     prompt = (
         f"List the top companies in the '{submarket}' market in US using reports published between 2018 and 2023. "
         "Use trusted sources like Grand View, Mordor, MarketsandMarkets, FortuneBI. Format as a Markdown table."
     )
+    request = {
+        "model": MODEL,
+        "input": prompt,
+        "instructions": SYSTEM_PROMPT,
+        "tools": TOOLS,
+        "temperature": 0.3
+    }
+    if structured:
+        request["instructions"] = SYSTEM_PROMPT + STRUCTURED_INSTRUCTIONS
+        request["text"] = json_schema_format("top_companies", table_schema(CompanyRow))
+    return request
 
-    response = client.responses.create(
-        model=MODEL,
-        input=prompt,
-        instructions=SYSTEM_PROMPT,
-        tools=TOOLS,
-        temperature=0.3
-    )
+def get_top_companies(submarket: str, structured: bool = False) -> str:
+    """Markdown table, or compact CompanyRow JSON when structured"""
+    # Starts on the small model; escalates to gpt-4o when the answer isn't a well-formed table
+    try:
+        response = create_routed_response('companies', **build_top_companies_request(submarket, structured))
+    except Exception as e:
+        print(f"❌ Error fetching companies for {submarket}: {e}")
+        return "⚠️ Failed to retrieve top companies."
+
+    if structured:
+        try:
+            return rows_or_message(parse_rows(extract_message_text(response), CompanyRow), "⚠️ No company data found.")
+        except (ValueError, TypeError) as e:
+            print(f"❌ Unparseable companies for {submarket}: {e}")
+            return "❌ No output from GPT-4o."
 
     for item in response.output:
         if getattr(item, "type", "") == "message":
             return "".join([c.text for c in item.content])
 
     return "❌ No output from GPT-4o."
+
+
+BATCHED_TASK = """
+For each sub-market, list the top companies in the US using reports published between 2018 and 2023.
+"""
+
+def build_top_companies_batched_request(submarkets: List[str]) -> dict:
+    """One structured request covering several sub-markets"""
+    return {
+        "model": MODEL,
+        "input": batched_input(submarkets),
+        "instructions": SYSTEM_PROMPT + BATCHED_TASK + BATCHED_INSTRUCTIONS,
+        "tools": TOOLS,
+        "temperature": 0.3,
+        "text": json_schema_format("top_companies_batched", batched_schema(CompanyRow))
+    }
+
+def get_top_companies_batched(submarkets: List[str]) -> Dict[str, str]:
+    """Compact CompanyRow JSON per sub-market from one request; sub-markets without rows are left out"""
+    response = create_routed_response('companies_batched', **build_top_companies_batched_request(submarkets))
+    try:
+        rows = parse_batched_rows(extract_message_text(response), CompanyRow, submarkets)
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"❌ Unparseable batched companies for {len(submarkets)} sub-markets: {e}")
+        return {}
+    return {name: rows_to_json(found) for name, found in rows.items() if found}
@@ -1,13 +1,7 @@
 # compare_pdf_agent.py
-import time
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
 from pdf_chunks_util import split_pdf_to_chunks
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from llm_client import upload_file
+from model_router import create_routed_response
 
 def compare_uploaded_pdfs(pdf_files: list, user_prompt: str) -> dict:
     results = {}
@@ -19,10 +13,11 @@ def compare_uploaded_pdfs(pdf_files: list, user_prompt: str) -> dict:
 
         for (start, end, path) in chunks:
             with open(path, "rb") as f:
-                uploaded = client.files.create(file=f, purpose="user_data")
+                uploaded = upload_file(f, purpose="user_data")
 
             try:
-                response = client.responses.create(
+                response = create_routed_response(
+                    'pdf_chunk',
                     model="gpt-4o",
                     input=[
                         {
@@ -38,8 +33,6 @@ def compare_uploaded_pdfs(pdf_files: list, user_prompt: str) -> dict:
             except Exception as e:
                 chunk_outputs.append(f"❌ Error on pages {start}-{end}: {e}")
 
-            time.sleep(1.5)  # Avoid rate limits
-
         results[file_name] = "\n\n".join(chunk_outputs)
 
     return results
@@ -0,0 +1,56 @@
+# config.py
+
+import os
+import sys
+import threading
+from typing import Any, Callable, Optional
+
+
+class Settings:
+    """
+    Every setting the app reads, resolved once per process: Streamlit secrets first,
+    then the environment (with .env loaded). Secrets are only consulted when Streamlit
+    is already running, so CLI scripts never pay for importing it.
+    """
+
+    def __init__(self):
+        from dotenv import load_dotenv
+        load_dotenv()
+        self._secrets = _streamlit_secrets()
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, default: Any = None, cast: Optional[Callable] = None) -> Any:
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = self._secrets.get(name, os.getenv(name))
+            value = self._values[name]
+        if value is None:
+            return default
+        return cast(value) if cast else value
+
+    def __call__(self, name: str, default: Any = None) -> Any:
+        return self.get(name, default)
+
+
+def _streamlit_secrets() -> dict:
+    if "streamlit" not in sys.modules:
+        return {}
+    try:
+        return dict(sys.modules["streamlit"].secrets)
+    except Exception:
+        return {}  # No secrets.toml
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Process-wide Settings, loaded on first use"""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings()
+    return _settings
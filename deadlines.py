@@ -0,0 +1,79 @@
+# deadlines.py
+
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Seconds one logical agent call may take end to end, retries and backoff included
+AGENT_DEADLINES = {
+    'global': 90,
+    'submarkets': 90,
+    'vertical': 90,
+    'horizontal': 90,
+    'metrics': 60,
+    'companies': 60,
+    'drilldown': 75,
+    'metrics_batched': 150,
+    'companies_batched': 150,
+    'mna': 120,
+    'web_insights': 90,
+    'pdf_qa': 180,
+    'pdf_compare': 180,
+}
+DEFAULT_DEADLINE = 180
+MAX_DEADLINE = 300  # upper bound for UI overrides; single-flight leases are sized from it
+
+# p99-sensitive agents: fire a duplicate request once the primary is slower than this percentile
+HEDGE_PERCENTILES = {
+    'metrics': 95,
+    'companies': 95,
+    'drilldown': 95,
+    'submarkets': 95,
+}
+HEDGE_MIN_SAMPLES = 20  # latency history needed before hedging an agent
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed before it finished"""
+
+
+_overrides: ContextVar[Dict[str, float]] = ContextVar("llm_deadline_overrides", default={})
+_hedging: ContextVar[bool] = ContextVar("llm_hedging", default=True)
+
+
+def use_session_settings(overrides: Dict[str, float], hedging: bool = True):
+    """
+    Per-agent deadlines and hedging chosen in the UI, for the rest of this script run.
+    Worker threads pick them up when the orchestrator submits with a copied context.
+    """
+    _overrides.set({agent: min(seconds, MAX_DEADLINE) for agent, seconds in overrides.items()})
+    _hedging.set(hedging)
+
+
+def agent_deadline(agent: str) -> Optional[float]:
+    """Deadline in seconds for one call of `agent` (None or 0 = none)"""
+    seconds = _overrides.get().get(agent, AGENT_DEADLINES.get(agent, DEFAULT_DEADLINE))
+    return seconds or None
+
+
+def hedge_percentile(agent: str) -> Optional[float]:
+    """Latency percentile after which `agent` is hedged, or None if it never is"""
+    return HEDGE_PERCENTILES.get(agent) if _hedging.get() else None
+
+
+def call_deadline(agent: str) -> Optional[float]:
+    """Absolute time.monotonic() by which a call of `agent` starting now must finish"""
+    seconds = agent_deadline(agent)
+    return time.monotonic() + seconds if seconds else None
+
+
+def remaining(at: Optional[float]) -> Optional[float]:
+    """Seconds left before the deadline `at` (None = no deadline)"""
+    return None if at is None else at - time.monotonic()
+
+
+def check(at: Optional[float], what: str = "LLM call"):
+    """Raise DeadlineExceeded if the deadline `at` has passed"""
+    left = remaining(at)
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{what} exceeded its deadline")
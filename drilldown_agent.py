@@ -0,0 +1,51 @@
+# drilldown_agent.py
+
+from llm_client import extract_message_text
+from model_router import create_routed_response
+from market_schemas import DrilldownResult, DRILLDOWN_SCHEMA, json_schema_format
+TOOLS = [{"type": "web_search_preview"}]
+
+DRILLDOWN_PROMPT = """
+You are a precise market research assistant with web access (web_search_preview).
+
+Given a sub-market (e.g. "Plastics in Automotive"), search once and return both:
+
+Metrics:
+- Market Size (USD), CAGR and Forecast Years, from reports published between 2018 and 2023
+- Trusted sources only: Grand View Research, Mordor Intelligence, MarketsandMarkets, Fortune Business Insights
+
+Companies:
+- The top companies in this sub-market in the US, with their market share in percent
+- If no share is published, give an intelligent estimate and say so in `basis`;
+  when a value is clear and factual, say that in `basis` instead
+
+Strict rules:
+- ONLY return results that **explicitly match the sub-market name**
+- Never generalize to broader markets like 'Plastics' or 'Plastic Packaging'
+- Cells hold plain text (no Markdown). `source` is the bare URL, or the basis of the
+  figure when there is no URL.
+"""
+
+
+def build_drilldown_request(submarket: str) -> dict:
+    """Responses API request for get_drilldown"""
+    return dict(
+        model="gpt-4o",
+        input=f"Sub-market: {submarket}",
+        tools=TOOLS,
+        instructions=DRILLDOWN_PROMPT,
+        temperature=0.3,
+        text=json_schema_format("drilldown", DRILLDOWN_SCHEMA),
+    )
+
+
+def get_drilldown(submarket: str, retries: int = 3) -> str:
+    """Metrics and top companies from one web-search pass, as compact DrilldownResult JSON"""
+    try:
+        print(f"🔍 Fetching metrics and companies for {submarket}")
+        # Starts on the small model; escalates to gpt-4o when either section comes back empty
+        response = create_routed_response('drilldown', retries=retries, **build_drilldown_request(submarket))
+        return DrilldownResult.from_json(extract_message_text(response)).to_json()
+    except Exception as e:
+        print(f"❌ Error fetching drilldown for {submarket}: {e}")
+    return "⚠️ Failed to retrieve sub-market details."
@@ -1,13 +1,6 @@
-import os
 import fitz  # PyMuPDF
-from openai import OpenAI
-from dotenv import load_dotenv
 import tempfile
-import time
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from llm_client import create_response, upload_file
 CHUNK_SIZE = 50  # Number of pages per chunk
 PROMPT_TEMPLATE = """
 You are a market analyst. Based on the PDF content provided, extract a table of key market insights (e.g. CAGR, market size, top companies, segmentation, trends).
@@ -49,9 +42,9 @@ def get_file_augmented_market_report(query: str, uploaded_files: list) -> str:
         print(f"📄 Processing chunk {idx+1}/{len(chunks)}: Pages {start_page}-{end_page}")
         try:
             with open(path, "rb") as f:
-                uploaded = client.files.create(file=f, purpose="user_data")
+                uploaded = upload_file(f, purpose="user_data")
 
-            response = client.responses.create(
+            response = create_response(
                         model="gpt-4o",
                         input=[{
                             "role": "user",
@@ -71,6 +64,4 @@ def get_file_augmented_market_report(query: str, uploaded_files: list) -> str:
         except Exception as e:
             combined_output += f"\n❌ Error on pages {start_page}-{end_page}: {e}"
 
-        time.sleep(1.5)  # Basic rate-limit protection
-
     return combined_output.strip() or "⚠️ No valid insights extracted from the uploaded PDF."
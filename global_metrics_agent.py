@@ -1,13 +1,9 @@
 # global_metrics_agent.py
 
-import os
-import time
-from dotenv import load_dotenv
-from openai import OpenAI, RateLimitError
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from typing import Iterator
+from llm_client import create_response, extract_message_text, stream_response, stream_with_fallback
+from market_schemas import (MetricRow, STRUCTURED_INSTRUCTIONS, json_schema_format,
+                            parse_rows, rows_or_message, table_schema)
 TOOLS = [{"type": "web_search_preview"}]
 
 GLOBAL_METRIC_PROMPT = """
@@ -52,23 +48,35 @@ Only return the Markdown table. Do not include anything else.
 
 
 
-def get_global_overview(market: str, retries: int = 3) -> str:
-    for attempt in range(retries):
-        try:
-            print(f"🌍 Fetching global metrics for {market} (attempt {attempt+1})")
-            response = client.responses.create(
-                model="gpt-4o",
-                input=market,
-                tools=TOOLS,
-                instructions=GLOBAL_METRIC_PROMPT,
-            )
-            final = next((o for o in response.output if getattr(o, "type", "") == "message"), None)
-            return "".join(part.text for part in final.content).strip() if final else "⚠️ No output returned."
-        except RateLimitError:
-            delay = 3 + attempt * 2
-            print(f"⚠️ Rate limit hit. Retrying in {delay}s...")
-            time.sleep(delay)
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            break
+def build_global_overview_request(market: str, structured: bool = False) -> dict:
+    """Request body for responses.create (shared by the interactive and batch paths)"""
+    request = {
+        "model": "gpt-4o",
+        "input": market,
+        "tools": TOOLS,
+        "instructions": GLOBAL_METRIC_PROMPT,
+    }
+    if structured:
+        request["instructions"] = GLOBAL_METRIC_PROMPT + STRUCTURED_INSTRUCTIONS
+        request["text"] = json_schema_format("global_metrics", table_schema(MetricRow))
+    return request
+
+
+def get_global_overview(market: str, retries: int = 3, structured: bool = False) -> str:
+    """Markdown table, or compact MetricRow JSON when structured"""
+    try:
+        print(f"🌍 Fetching global metrics for {market}")
+        response = create_response(**build_global_overview_request(market, structured), retries=retries)
+        if structured:
+            return rows_or_message(parse_rows(extract_message_text(response), MetricRow), "⚠️ No global metrics found.")
+        return extract_message_text(response) or "⚠️ No output returned."
+    except Exception as e:
+        print(f"❌ Error: {e}")
     return "⚠️ Failed to fetch global overview."
+
+
+def stream_global_overview(market: str, retries: int = 3) -> Iterator[str]:
+    """Streaming variant of get_global_overview that yields text deltas"""
+    print(f"🌍 Streaming global metrics for {market}")
+    return stream_with_fallback(stream_response(**build_global_overview_request(market), retries=retries),
+                                "⚠️ Failed to fetch global overview.")
@@ -1,13 +1,9 @@
 # horizontal_handler.py
 
-import os
-import time
-from dotenv import load_dotenv
-from openai import OpenAI, RateLimitError
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from typing import Iterator
+from llm_client import create_response, extract_message_text, stream_response, stream_with_fallback
+from market_schemas import (HorizontalSubmarket, STRUCTURED_INSTRUCTIONS, json_schema_format,
+                            parse_rows, rows_or_message, table_schema)
 TOOLS = [
     {"type": "web_search_preview"}
 ]
@@ -33,24 +29,39 @@ Format:
 No paragraphs. No introductions. Just the table.
 """
 
-def get_horizontal_submarkets(industry: str, retries: int = 3) -> str:
+def get_horizontal_submarkets(industry: str, retries: int = 3, structured: bool = False) -> str:
+    """Markdown table, or compact HorizontalSubmarket JSON when structured"""
     prompt = PROMPT_TEMPLATE.format(industry=industry)
-    for attempt in range(retries):
-        try:
-            print(f"🔍 Fetching horizontals for {industry} [attempt {attempt+1}]")
-            response = client.responses.create(
-                model="gpt-4o",
-                input=industry,
-                tools=TOOLS,
-                instructions=prompt
-            )
-            final = next((o for o in response.output if getattr(o, "type", "") == "message"), None)
-            return "".join(part.text for part in final.content).strip() if final else "(no output)"
-        except RateLimitError:
-            delay = 3 + attempt * 2
-            print(f"⚠️ Rate limit. Retrying in {delay}s...")
-            time.sleep(delay)
-        except Exception as e:
-            print(f"❌ Error fetching horizontal submarkets: {e}")
-            break
+    structured_kwargs = dict(
+        instructions=prompt + STRUCTURED_INSTRUCTIONS,
+        text=json_schema_format("horizontal_submarkets", table_schema(HorizontalSubmarket))
+    ) if structured else dict(instructions=prompt)
+    try:
+        print(f"🔍 Fetching horizontals for {industry}")
+        response = create_response(
+            model="gpt-4o",
+            input=industry,
+            tools=TOOLS,
+            retries=retries,
+            **structured_kwargs
+        )
+        if structured:
+            return rows_or_message(parse_rows(extract_message_text(response), HorizontalSubmarket),
+                                   "⚠️ No horizontal sub-markets found.")
+        return extract_message_text(response) or "(no output)"
+    except Exception as e:
+        print(f"❌ Error fetching horizontal submarkets: {e}")
     return "⚠️ Failed to retrieve horizontal sub-markets."
+
+
+def stream_horizontal_submarkets(industry: str, retries: int = 3) -> Iterator[str]:
+    """Streaming variant of get_horizontal_submarkets that yields text deltas"""
+    prompt = PROMPT_TEMPLATE.format(industry=industry)
+    print(f"🔍 Streaming horizontals for {industry}")
+    return stream_with_fallback(stream_response(
+        model="gpt-4o",
+        input=industry,
+        tools=TOOLS,
+        instructions=prompt,
+        retries=retries
+    ), "⚠️ Failed to retrieve horizontal sub-markets.")
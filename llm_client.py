@@ -0,0 +1,525 @@
+# llm_client.py
+
+import sys
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Iterator, List
+from config import get_settings
+from rate_limiter import RateLimiter
+from circuit_breaker import CircuitBreaker
+from llm_metrics import LLMCall, current_agent, is_escalated, latency_percentile
+from deadlines import (DeadlineExceeded, HEDGE_MIN_SAMPLES, call_deadline, check, hedge_percentile,
+                       remaining)
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+# openai and httpx are imported on first use: importing this module stays cheap for the UI's first paint
+settings = get_settings()
+
+# === POOL CONFIGURATION ===
+MAX_CONNECTIONS = settings.get("LLM_MAX_CONNECTIONS", 20, int)
+MAX_KEEPALIVE = settings.get("LLM_MAX_KEEPALIVE", 10, int)
+KEEPALIVE_EXPIRY = settings.get("LLM_KEEPALIVE_EXPIRY", 60, float)
+MAX_CONCURRENCY = settings.get("LLM_MAX_CONCURRENCY", 8, int)
+REQUEST_TIMEOUT = settings.get("LLM_REQUEST_TIMEOUT", 120, float)
+
+# === RATE LIMITS (starting budget; corrected from x-ratelimit-* headers) ===
+REQUESTS_PER_MINUTE = settings.get("LLM_REQUESTS_PER_MINUTE", 500, float)
+TOKENS_PER_MINUTE = settings.get("LLM_TOKENS_PER_MINUTE", 30000, float)
+FILE_TOKEN_ESTIMATE = 20000  # a 50-page PDF chunk
+OUTPUT_TOKEN_ESTIMATE = 1500
+
+# === CIRCUIT BREAKER (trips on upstream error rate, probes to recover) ===
+BREAKER_ERROR_RATE = settings.get("LLM_BREAKER_ERROR_RATE", 0.5, float)
+BREAKER_MIN_CALLS = settings.get("LLM_BREAKER_MIN_CALLS", 6, int)
+BREAKER_WINDOW = settings.get("LLM_BREAKER_WINDOW_SECONDS", 60, float)
+BREAKER_COOLDOWN = settings.get("LLM_BREAKER_COOLDOWN_SECONDS", 30, float)
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+# Loop thread (and its own async client) for hedged calls made from blocking code
+_loop = None
+_loop_client = None
+
+# Offline stand-in for the API (LLM_REPLAY_MODE=replay|record), resolved on first use
+_replay_server = None
+_replay_resolved = False
+
+# One limiter for every agent in this process: RPM/TPM buckets + AIMD concurrency cap
+limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, max_concurrency=MAX_CONCURRENCY)
+
+# One breaker for every agent in this process, so a failing upstream fails fast everywhere
+breaker = CircuitBreaker(BREAKER_ERROR_RATE, BREAKER_MIN_CALLS, BREAKER_WINDOW, BREAKER_COOLDOWN)
+
+# Set by prefetch/warm-up work so it yields to interactive requests
+_background = ContextVar("llm_background", default=False)
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _replay():
+    """Current ReplayServer or None; caller holds _client_lock"""
+    global _replay_server, _replay_resolved
+    if not _replay_resolved:
+        from replay_transport import server_from_settings
+        _replay_server = server_from_settings(settings)
+        _replay_resolved = True
+    return _replay_server
+
+
+def use_replay_server(server):
+    """Route both shared clients through `server` (None = the real API); used by benchmarks"""
+    global _client, _async_client, _loop_client, _replay_server, _replay_resolved
+    with _client_lock:
+        _replay_server, _replay_resolved = server, True
+        _client = _async_client = _loop_client = None
+
+
+def get_replay_server():
+    with _client_lock:
+        return _replay()
+
+
+def _api_key(server) -> str:
+    # The replay server never checks the key, so offline runs need no secrets
+    return settings.get("OPENAI_API_KEY") or ("replay" if server else None)
+
+
+def get_client() -> "OpenAI":
+    """Shared blocking client backed by a keep-alive connection pool"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI, DefaultHttpxClient
+                server = _replay()
+                _client = OpenAI(
+                    api_key=_api_key(server),
+                    timeout=REQUEST_TIMEOUT,
+                    max_retries=0,  # retries are handled by the agents
+                    http_client=DefaultHttpxClient(transport=server.transport(), timeout=REQUEST_TIMEOUT)
+                    if server else DefaultHttpxClient(limits=_limits(), timeout=REQUEST_TIMEOUT),
+                )
+    return _client
+
+
+def _build_async_client(server) -> "AsyncOpenAI":
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return AsyncOpenAI(
+        api_key=_api_key(server),
+        timeout=REQUEST_TIMEOUT,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(transport=server.async_transport(), timeout=REQUEST_TIMEOUT)
+        if server else DefaultAsyncHttpxClient(limits=_limits(), timeout=REQUEST_TIMEOUT),
+    )
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Shared async client for fan-out from asyncio code"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = _build_async_client(_replay())
+    return _async_client
+
+
+def estimate_tokens(request: dict) -> int:
+    """Cheap upper-bound guess of a request's token cost, settled against real usage afterwards"""
+    text = f"{request.get('instructions') or ''}{request.get('input') or ''}"
+    return len(text) // 4 + text.count("input_file") * FILE_TOKEN_ESTIMATE + OUTPUT_TOKEN_ESTIMATE
+
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage else None
+
+
+@contextmanager
+def background_priority():
+    """Run the enclosed calls at background priority"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+@contextmanager
+def concurrency_slot(estimated_tokens: int = 0):
+    """Hold one of the process-wide upstream call slots"""
+    limiter.acquire(estimated_tokens, background=_background.get())
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+@asynccontextmanager
+async def async_concurrency_slot(estimated_tokens: int = 0):
+    """Async counterpart of concurrency_slot"""
+    await limiter.aacquire(estimated_tokens, background=_background.get())
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """Errors that say the upstream is unhealthy (not 4xx caller mistakes or 429s)"""
+    from openai import APIConnectionError, APIStatusError
+    if isinstance(error, APIConnectionError):  # includes APITimeoutError at the pool's REQUEST_TIMEOUT
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _cut_short_by_deadline(error: BaseException, at) -> bool:
+    """
+    The caller's deadline ended the request, not the upstream: DeadlineExceeded, or a timeout that
+    fired once the deadline had passed (its request timeout was shortened to the time left)
+    """
+    from openai import APITimeoutError
+    if isinstance(error, DeadlineExceeded):
+        return True
+    left = remaining(at)
+    return isinstance(error, APITimeoutError) and left is not None and left <= 0
+
+
+@contextmanager
+def upstream_call(what: str = "LLM call", at=None):
+    """
+    Run one upstream request through the circuit breaker (raises CircuitOpenError while open).
+    Requests cut short by their deadline `at` count neither way: a short per-user deadline
+    says nothing about upstream health. Nor do refused requests (4xx, 429).
+    """
+    probe = breaker.before_call(what)
+    try:
+        yield
+    except Exception as e:
+        if _is_upstream_failure(e) and not _cut_short_by_deadline(e, at):
+            breaker.record_failure(probe)
+        else:
+            breaker.release(probe)
+        raise
+    except BaseException:
+        breaker.release(probe)  # cancelled (hedge loser, stopped script)
+        raise
+    else:
+        breaker.record_success(probe)
+
+
+# === DEADLINES & HEDGING ===
+def _request_timeout(at, what: str = "LLM call") -> float:
+    """Per-request timeout: the pool default, cut short by the call's deadline"""
+    check(at, what)
+    left = remaining(at)
+    return REQUEST_TIMEOUT if left is None else min(REQUEST_TIMEOUT, left)
+
+
+def _retry_delay(attempt: int, retry_after, at, what: str) -> float:
+    delay = limiter.backoff_delay(attempt, retry_after)
+    left = remaining(at)
+    if left is not None and delay >= left:
+        raise DeadlineExceeded(f"{what} would retry past its deadline")
+    return delay
+
+
+def _hedge_delay(agent: str):
+    """Seconds to wait before hedging a call of `agent`, or None to not hedge it"""
+    pct = hedge_percentile(agent)
+    if pct is None or _background.get():
+        return None  # background work is never worth a duplicate request
+    latency_ms = latency_percentile(agent, pct, HEDGE_MIN_SAMPLES)
+    return latency_ms / 1000 if latency_ms else None
+
+
+def _hedge_loop() -> asyncio.AbstractEventLoop:
+    """Event loop thread that runs hedged calls for the blocking API, started on first use"""
+    global _loop, _loop_client
+    with _client_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-hedge", daemon=True).start()
+        if _loop_client is None:
+            # Its own client: an async connection pool must stay on the loop that opened it
+            _loop_client = _build_async_client(_replay())
+    return _loop
+
+
+async def _with_deadline(awaitable, at, what: str):
+    """Await `awaitable`, cancelling it (and its in-flight request) when the deadline passes"""
+    left = remaining(at)
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{what} exceeded its deadline") from None
+
+
+async def _hedged_create(call: LLMCall, retries: int, kwargs: dict, at, delay: float, background: bool):
+    """Primary request plus, once it is slower than `delay`, a duplicate; the first success wins"""
+    _background.set(background)
+    tasks = {asyncio.ensure_future(_acreate(_loop_client, call, retries, kwargs, at))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            print(f"🏁 {call.agent} slower than {delay:.1f}s, sending a hedged request")
+            tasks.add(asyncio.ensure_future(_acreate(_loop_client, call, retries, kwargs, at)))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()  # the loser's request is dropped mid-flight
+
+
+def _run_hedged(call: LLMCall, retries: int, kwargs: dict, at, delay: float):
+    loop = _hedge_loop()
+    what = f"{call.agent} call"
+    future = asyncio.run_coroutine_threadsafe(
+        _with_deadline(_hedged_create(call, retries, kwargs, at, delay, _background.get()), at, what), loop)
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()  # e.g. the Streamlit script was stopped
+        raise
+
+
+# === CALL HELPERS ===
+def _call_record(agent, model, depth: int = 2) -> LLMCall:
+    """Call record attributed to `agent`, the llm_agent scope, or else the calling module"""
+    name = agent or current_agent() or sys._getframe(depth).f_globals.get("__name__", "unknown")
+    return LLMCall(agent=name, model=model, escalated=is_escalated())
+
+
+def create_response(retries: int = 3, agent: str = None, **kwargs):
+    """
+    responses.create through the shared pool, retrying 429s with the limiter's backoff.
+    The whole call, retries included, must finish within the agent's deadline; p99-sensitive
+    agents get a hedged duplicate request when the first one is unusually slow.
+    """
+    call = _call_record(agent, kwargs.get("model"))
+    at = call_deadline(call.agent)
+    try:
+        delay = _hedge_delay(call.agent)
+        if delay is not None:
+            response = _run_hedged(call, retries, kwargs, at, delay)
+        else:
+            response = _create(call, retries, kwargs, at)
+        call.finish(getattr(response, "usage", None))
+        return response
+    except Exception as e:
+        call.fail(e)
+        raise
+
+
+def _create(call: LLMCall, retries: int, kwargs: dict, at):
+    from openai import APITimeoutError, RateLimitError
+    what = f"{call.agent} call"
+    estimated = estimate_tokens(kwargs)
+    for attempt in range(retries):
+        call.retries = attempt
+        try:
+            with upstream_call(what, at), concurrency_slot(estimated):
+                raw = get_client().responses.with_raw_response.create(
+                    **kwargs, timeout=_request_timeout(at, what))
+            limiter.update_from_headers(raw.headers)
+            limiter.on_success()
+            response = raw.parse()
+            limiter.settle_tokens(estimated, _usage_tokens(response))
+            return response
+        except RateLimitError as e:
+            retry_after = limiter.on_rate_limited(e.response.headers)
+            if attempt == retries - 1:
+                raise
+            delay = _retry_delay(attempt, retry_after, at, what)
+            print(f"⚠️ Rate limit. Retrying in {delay:.1f}s (attempt {attempt + 1}/{retries})...")
+            time.sleep(delay)
+        except APITimeoutError:
+            check(at, what)  # the request was cut short by the deadline
+            raise
+
+
+def stream_response(retries: int = 3, agent: str = None, **kwargs) -> Iterator[str]:
+    """
+    responses.create(stream=True) through the shared pool, yielding output text deltas.
+    429s are retried only while nothing has been yielded yet. The stream is closed
+    when the agent's deadline passes.
+    """
+    # Resolved here rather than in the generator, while the caller's frame is still on the stack
+    call = _call_record(agent, kwargs.get("model"))
+    return _stream_response(retries, call, call_deadline(call.agent), **kwargs)
+
+
+def _stream_response(retries: int, call: LLMCall, at, **kwargs) -> Iterator[str]:
+    from openai import APITimeoutError, RateLimitError
+    what = f"{call.agent} stream"
+    estimated = estimate_tokens(kwargs)
+    usage = None
+    try:
+        for attempt in range(retries):
+            call.retries = attempt
+            try:
+                with upstream_call(what, at), concurrency_slot(estimated):
+                    stream = get_client().responses.create(stream=True, timeout=_request_timeout(at, what), **kwargs)
+                    limiter.update_from_headers(stream.response.headers)
+                    try:
+                        for event in stream:
+                            check(at, what)
+                            if event.type == "response.output_text.delta":
+                                yield event.delta
+                            elif event.type == "response.completed":
+                                usage = getattr(event.response, "usage", None)
+                                limiter.settle_tokens(estimated, _usage_tokens(event.response))
+                    finally:
+                        stream.close()
+                limiter.on_success()
+                call.finish(usage)
+                return
+            except RateLimitError as e:
+                retry_after = limiter.on_rate_limited(e.response.headers)
+                if attempt == retries - 1:
+                    raise
+                delay = _retry_delay(attempt, retry_after, at, what)
+                print(f"⚠️ Rate limit. Retrying in {delay:.1f}s (attempt {attempt + 1}/{retries})...")
+                time.sleep(delay)
+            except APITimeoutError:
+                check(at, what)
+                raise
+    except GeneratorExit:
+        call.finish(usage)  # consumer stopped reading early
+        raise
+    except Exception as e:
+        call.fail(e)
+        raise
+
+
+def stream_with_fallback(deltas: Iterator[str], fallback: str) -> Iterator[str]:
+    """
+    Yield `deltas`; if the stream fails before anything was yielded, yield `fallback` instead.
+    A failure after text has gone out is re-raised, so a truncated answer never passes for a whole one.
+    """
+    started = False
+    try:
+        for delta in deltas:
+            started = True
+            yield delta
+    except Exception as e:
+        if started:
+            print(f"❌ Stream interrupted: {e}")
+            raise
+        print(f"❌ Error: {e}")
+        yield fallback
+
+
+async def acreate_response(retries: int = 3, agent: str = None, **kwargs):
+    """Async responses.create through the shared pool, cancelled at the agent's deadline"""
+    call = _call_record(agent, kwargs.get("model"))
+    at = call_deadline(call.agent)
+    try:
+        response = await _with_deadline(_acreate(get_async_client(), call, retries, kwargs, at), at,
+                                        f"{call.agent} call")
+        call.finish(getattr(response, "usage", None))
+        return response
+    except Exception as e:
+        call.fail(e)
+        raise
+
+
+async def _acreate(client: "AsyncOpenAI", call: LLMCall, retries: int, kwargs: dict, at):
+    from openai import APITimeoutError, RateLimitError
+    what = f"{call.agent} call"
+    estimated = estimate_tokens(kwargs)
+    for attempt in range(retries):
+        call.retries = max(call.retries, attempt)
+        try:
+            with upstream_call(what, at):
+                async with async_concurrency_slot(estimated):
+                    raw = await client.responses.with_raw_response.create(**kwargs, timeout=_request_timeout(at, what))
+            limiter.update_from_headers(raw.headers)
+            limiter.on_success()
+            response = raw.parse()
+            limiter.settle_tokens(estimated, _usage_tokens(response))
+            return response
+        except RateLimitError as e:
+            retry_after = limiter.on_rate_limited(e.response.headers)
+            if attempt == retries - 1:
+                raise
+            await asyncio.sleep(_retry_delay(attempt, retry_after, at, what))
+        except APITimeoutError:
+            check(at, what)
+            raise
+
+
+def upload_file(file, purpose: str = "user_data", agent: str = None):
+    """files.create through the shared pool"""
+    call = _call_record(agent, None)
+    at = call_deadline(call.agent)
+    try:
+        with upstream_call(f"{call.agent} upload", at), concurrency_slot():
+            uploaded = get_client().files.create(file=file, purpose=purpose,
+                                                 timeout=_request_timeout(at, f"{call.agent} upload"))
+        call.finish()
+        return uploaded
+    except Exception as e:
+        call.fail(e)
+        raise
+
+
+async def aupload_file(file, purpose: str = "user_data", agent: str = None):
+    """Async files.create through the shared pool"""
+    call = _call_record(agent, None)
+    at = call_deadline(call.agent)
+    what = f"{call.agent} upload"
+    try:
+        with upstream_call(what, at):
+            async with async_concurrency_slot():
+                uploaded = await _with_deadline(
+                    get_async_client().files.create(file=file, purpose=purpose, timeout=_request_timeout(at, what)),
+                    at, what)
+        call.finish()
+        return uploaded
+    except Exception as e:
+        call.fail(e)
+        raise
+
+
+def create_embeddings(texts: List[str], model: str = "text-embedding-3-small", agent: str = None) -> List[List[float]]:
+    """embeddings.create through the shared pool; one vector per text, in order"""
+    call = _call_record(agent, model)
+    at = call_deadline(call.agent)
+    what = f"{call.agent} embedding"
+    try:
+        with upstream_call(what, at), concurrency_slot(sum(len(text) for text in texts) // 4):
+            response = get_client().embeddings.create(model=model, input=texts, encoding_format="float",
+                                                      timeout=_request_timeout(at, what))
+        call.finish(getattr(response, "usage", None))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    except Exception as e:
+        call.fail(e)
+        raise
+
+
+def extract_message_text(response) -> str:
+    """Return the text of the first message item of a Responses API result, or "" """
+    final = next((o for o in response.output if getattr(o, "type", "") == "message"), None)
+    return "".join(part.text for part in final.content).strip() if final else ""
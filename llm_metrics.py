@@ -0,0 +1,249 @@
+# llm_metrics.py
+
+import math
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# USD per 1M tokens: (input, cached input, output); matched on the longest model-name prefix
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    """Dollar cost of one call from its real usage (0 for unknown models)"""
+    matches = [name for name in MODEL_PRICES if model and model.startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, cached_price, output_price = MODEL_PRICES[max(matches, key=len)]
+    uncached = max(0, input_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + output_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class LLMCall:
+    """One logical upstream call (all of its retries), or one cache hit that avoided it"""
+    agent: str
+    model: Optional[str] = None
+    latency_ms: float = 0.0
+    retries: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cache_hit: bool = False
+    error_class: Optional[str] = None
+    escalated: bool = False
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def cost_usd(self) -> float:
+        return estimate_cost(self.model, self.input_tokens, self.cached_tokens, self.output_tokens)
+
+    def add_usage(self, usage):
+        """Take token counts from a Responses API (or embeddings) `usage` object"""
+        if usage is None:
+            return
+        self.input_tokens = getattr(usage, "input_tokens", 0) or getattr(usage, "prompt_tokens", 0) or 0
+        self.output_tokens = getattr(usage, "output_tokens", 0) or 0
+        details = getattr(usage, "input_tokens_details", None)
+        self.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+    def finish(self, usage=None):
+        self.latency_ms = (time.perf_counter() - self.started) * 1000
+        self.add_usage(usage)
+        record(self)
+
+    def fail(self, error: BaseException):
+        self.latency_ms = (time.perf_counter() - self.started) * 1000
+        self.error_class = type(error).__name__
+        record(self)
+
+
+# === USAGE SCOPES (real token totals for a block of calls) ===
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: float = 0.0
+
+    def add(self, call: LLMCall):
+        self.calls += 1
+        self.input_tokens += call.input_tokens
+        self.output_tokens += call.output_tokens
+        self.cached_tokens += call.cached_tokens
+        self.cost_usd += call.cost_usd
+
+
+_scopes: ContextVar[tuple] = ContextVar("llm_usage_scopes", default=())
+_agent: ContextVar[Optional[str]] = ContextVar("llm_agent", default=None)
+_escalated: ContextVar[bool] = ContextVar("llm_escalated", default=False)
+
+
+@contextmanager
+def usage_scope():
+    """Collect the real usage of every upstream call made inside the block"""
+    totals = UsageTotals()
+    token = _scopes.set(_scopes.get() + (totals,))
+    try:
+        yield totals
+    finally:
+        _scopes.reset(token)
+
+
+@contextmanager
+def llm_agent(name: str):
+    """Attribute upstream calls made inside the block to `name`"""
+    token = _agent.set(name)
+    try:
+        yield
+    finally:
+        _agent.reset(token)
+
+
+def current_agent() -> Optional[str]:
+    return _agent.get()
+
+
+@contextmanager
+def escalation():
+    """Mark upstream calls made inside the block as escalations to a larger model"""
+    token = _escalated.set(True)
+    try:
+        yield
+    finally:
+        _escalated.reset(token)
+
+
+def is_escalated() -> bool:
+    return _escalated.get()
+
+
+# === RECENT LATENCIES (in-process, used to time hedged requests) ===
+LATENCY_WINDOW = 200
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_latencies_lock = threading.Lock()
+
+
+def latency_percentile(agent: str, pct: float, min_samples: int = 1) -> Optional[float]:
+    """Nearest-rank percentile (ms) of recent successful upstream calls of `agent`"""
+    with _latencies_lock:
+        samples = sorted(_latencies[agent]) if agent in _latencies else []
+    if len(samples) < max(1, min_samples):
+        return None
+    return samples[max(1, math.ceil(pct / 100 * len(samples))) - 1]
+
+
+# === BATCHED WRITER ===
+INSERT_CALL = """
+    INSERT INTO llm_calls
+    (agent, model, latency_ms, retries, input_tokens, output_tokens, cached_tokens,
+     cost_usd, cache_hit, error_class, escalated)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class LLMCallWriter:
+    """Buffers call records and writes them to llm_calls in batches from one thread"""
+
+    def __init__(self, db_path: str, flush_interval: float = 2.0, max_batch: int = 200):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()  # one flush at a time, and db_path can't change mid-flush
+        self._thread = threading.Thread(target=self._run, name="llm-metrics", daemon=True)
+        self._thread.start()
+
+    def submit(self, call: LLMCall):
+        self._queue.put(call)
+
+    def _drain(self) -> List[LLMCall]:
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        batch = self._drain()
+        while batch:
+            self._write(batch)
+            batch = self._drain()
+
+    def retarget(self, db_path: str):
+        """Write what is already buffered to the current database, then switch to db_path"""
+        with self._lock:
+            self._flush_locked()
+            self.db_path = db_path
+
+    def _write(self, batch: List[LLMCall]):
+        try:
+            with sqlite3.connect(self.db_path, timeout=10) as conn:
+                conn.executemany(INSERT_CALL, [
+                    (c.agent, c.model, round(c.latency_ms, 1), c.retries, c.input_tokens, c.output_tokens,
+                     c.cached_tokens, c.cost_usd, int(c.cache_hit), c.error_class, int(c.escalated))
+                    for c in batch
+                ])
+        except sqlite3.Error as e:
+            print(f"⚠️ Dropped {len(batch)} LLM call records: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_writer: Optional[LLMCallWriter] = None
+_writer_lock = threading.Lock()
+
+
+def configure(db_path: str) -> LLMCallWriter:
+    """
+    Send call records to db_path's llm_calls table (until configured, they only feed usage scopes).
+    Reconfiguring reuses the one writer thread.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LLMCallWriter(db_path)
+        elif _writer.db_path != db_path:
+            _writer.retarget(db_path)
+        return _writer
+
+
+def record(call: LLMCall):
+    if not call.cache_hit and call.error_class is None:
+        with _latencies_lock:
+            _latencies[call.agent].append(call.latency_ms)
+    for totals in _scopes.get():
+        totals.add(call)
+    if _writer is not None:
+        _writer.submit(call)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _writer is not None:
+        _writer.flush()
@@ -0,0 +1,688 @@
+# market_db.py
+
+import sqlite3
+import json
+import hashlib
+import os
+import random
+from typing import Optional, List, Dict, Any
+from market_names import KEY_VERSION, MarketKey, market_key
+
+# How long an entry past its soft TTL may still be served while it is refreshed
+STALE_HOURS = 48
+REFRESH_TIMEOUT_MINUTES = 10
+# Spread soft expiries by +/- this fraction of expire_hours so a burst of writes doesn't expire together
+EXPIRY_JITTER = 0.1
+# Cached under the caller's (already normalized) text instead of a canonical market key
+FREE_TEXT_QUERY_TYPES = {'web_insights'}
+# Key extras in use when market_cache hashes were computed from raw names (plain and structured)
+LEGACY_KEY_EXTRAS = ({}, {"format": "json"})
+
+class WorkingMarketDB:
+    def __init__(self, db_path: str = "working_market.db"):
+        self.db_path = db_path
+        self.init_database()
+    
+    def init_database(self):
+        """Initialize the database with required tables"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS market_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    market_name TEXT NOT NULL,
+                    query_type TEXT NOT NULL,
+                    query_hash TEXT UNIQUE NOT NULL,
+                    result_data TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP,
+                    source TEXT DEFAULT 'openai',
+                    soft_expires_at TIMESTAMP,
+                    refreshing_since TIMESTAMP,
+                    canonical_name TEXT,
+                    region TEXT
+                );
+                
+                CREATE TABLE IF NOT EXISTS pdf_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_name TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    file_size INTEGER,
+                    total_pages INTEGER,
+                    chunks_count INTEGER,
+                    openai_file_ids TEXT,
+                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    status TEXT DEFAULT 'processed'
+                );
+                
+                CREATE TABLE IF NOT EXISTS pdf_qa (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pdf_history_id INTEGER,
+                    question TEXT NOT NULL,
+                    answer TEXT,
+                    query_tokens INTEGER,
+                    response_tokens INTEGER,
+                    cost_estimate REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (pdf_history_id) REFERENCES pdf_history (id)
+                );
+                
+                CREATE TABLE IF NOT EXISTS ma_searches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    market_name TEXT NOT NULL,
+                    timeframe TEXT NOT NULL,
+                    result_data TEXT,
+                    deals_count INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS pdf_comparisons (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_names TEXT NOT NULL,
+                    comparison_prompt TEXT NOT NULL,
+                    result_data TEXT,
+                    web_search_enabled BOOLEAN DEFAULT FALSE,
+                    web_insights TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS usage_analytics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_type TEXT NOT NULL,
+                    event_data TEXT,
+                    user_agent TEXT,
+                    session_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS cache_leases (
+                    query_hash TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP NOT NULL
+                );
+                
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    agent TEXT NOT NULL,
+                    model TEXT,
+                    latency_ms REAL,
+                    retries INTEGER DEFAULT 0,
+                    input_tokens INTEGER DEFAULT 0,
+                    output_tokens INTEGER DEFAULT 0,
+                    cached_tokens INTEGER DEFAULT 0,
+                    cost_usd REAL DEFAULT 0,
+                    cache_hit INTEGER DEFAULT 0,
+                    error_class TEXT,
+                    escalated INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE INDEX IF NOT EXISTS idx_market_cache_hash ON market_cache(query_hash);
+                CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls(created_at);
+                CREATE INDEX IF NOT EXISTS idx_market_cache_name ON market_cache(market_name);
+                CREATE INDEX IF NOT EXISTS idx_pdf_history_hash ON pdf_history(file_hash);
+            """)
+            self._migrate_market_cache(conn)
+            self._migrate_llm_calls(conn)
+    
+    def _migrate_market_cache(self, conn):
+        """Add the stale-while-revalidate and canonical-name columns to databases created before they existed"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(market_cache)")}
+        for column in ('soft_expires_at', 'refreshing_since'):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE market_cache ADD COLUMN {column} TIMESTAMP")
+        for column in ('canonical_name', 'region'):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE market_cache ADD COLUMN {column} TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_market_cache_canonical ON market_cache(canonical_name)")
+        self._rekey_legacy_rows(conn)
+    
+    def _rekey_legacy_rows(self, conn):
+        """
+        Move rows cached under raw market names, or under a canonical key that market_names no
+        longer produces, to their current key. Variants of the same market collapse into one row
+        (the newest wins); rows whose key can't be recovered are dropped. Runs once per
+        market_names.KEY_VERSION, recorded in the database's user_version.
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= KEY_VERSION:
+            return
+        rows = conn.execute("""
+            SELECT id, market_name, query_type, query_hash, canonical_name, region FROM market_cache 
+            ORDER BY created_at DESC
+        """).fetchall()
+        rekeyed = dropped = 0
+        for row_id, market_name, query_type, old_hash, canonical_name, region in rows:
+            key = self.market_key(market_name, query_type)
+            if canonical_name is not None and (canonical_name, region) == (key.canonical, key.region):
+                continue
+            extras = next((extras for extras in LEGACY_KEY_EXTRAS
+                           if self._legacy_hash(market_name, query_type, extras, canonical_name, region) == old_hash),
+                          None)
+            if extras is None:
+                conn.execute("DELETE FROM market_cache WHERE id = ?", (row_id,))
+                dropped += 1
+                continue
+            cursor = conn.execute("""
+                UPDATE OR IGNORE market_cache SET query_hash = ?, canonical_name = ?, region = ? WHERE id = ?
+            """, (self.generate_query_hash(market_name, query_type, **extras), key.canonical, key.region, row_id))
+            if cursor.rowcount == 0:
+                conn.execute("DELETE FROM market_cache WHERE id = ?", (row_id,))  # a newer variant owns the key
+                dropped += 1
+            else:
+                rekeyed += 1
+        conn.execute(f"PRAGMA user_version = {int(KEY_VERSION)}")
+        if rekeyed or dropped:
+            print(f"🔑 Re-keyed {rekeyed} cached analyses by canonical market name "
+                  f"({dropped} duplicate or unrecognized rows dropped)")
+    
+    @staticmethod
+    def _legacy_hash(market_name: str, query_type: str, extras: Dict,
+                     canonical_name: Optional[str] = None, region: Optional[str] = None) -> str:
+        """Hash a row was stored under: raw name before canonical keys, else its stored canonical key"""
+        if canonical_name is None:
+            return hashlib.md5(f"{market_name}:{query_type}:{json.dumps(extras, sort_keys=True)}".encode()).hexdigest()
+        if region:
+            extras = {**extras, 'region': region}
+        return hashlib.md5(f"{canonical_name}:{query_type}:{json.dumps(extras, sort_keys=True)}".encode()).hexdigest()
+    
+    def _migrate_llm_calls(self, conn):
+        """Add the model-routing column to llm_calls tables created before it existed"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_calls)")}
+        if 'escalated' not in columns:
+            conn.execute("ALTER TABLE llm_calls ADD COLUMN escalated INTEGER DEFAULT 0")
+    
+    @staticmethod
+    def market_key(market_name: str, query_type: str) -> MarketKey:
+        """Canonical market key a query is cached under (see market_names)"""
+        if query_type in FREE_TEXT_QUERY_TYPES:
+            return MarketKey(market_name)
+        return market_key(market_name)
+    
+    def generate_query_hash(self, market_name: str, query_type: str, **kwargs) -> str:
+        """Generate a hash for caching purposes; spelling variants of a market share one hash"""
+        key = self.market_key(market_name, query_type)
+        if key.region:
+            kwargs = {**kwargs, 'region': key.region}
+        query_string = f"{key.canonical}:{query_type}:{json.dumps(kwargs, sort_keys=True)}"
+        return hashlib.md5(query_string.encode()).hexdigest()
+    
+    # === CACHE METHODS ===
+    def get_cached_result(self, market_name: str, query_type: str, **kwargs) -> Optional[Dict]:
+        """
+        Retrieve cached market analysis result. Rows past their soft TTL but inside the
+        hard TTL (expires_at) are still returned, flagged 'stale' so the caller can refresh.
+        """
+        query_hash = self.generate_query_hash(market_name, query_type, **kwargs)
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT result_data, created_at, expires_at, soft_expires_at, refreshing_since,
+                       (soft_expires_at IS NOT NULL AND soft_expires_at <= datetime('now')) AS stale
+                FROM market_cache 
+                WHERE query_hash = ? AND (expires_at IS NULL OR expires_at > datetime('now'))
+            """, (query_hash,))
+            
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'data': row['result_data'],  # Keep as string for simplicity
+                    'cached_at': row['created_at'],
+                    'expires_at': row['expires_at'],
+                    'soft_expires_at': row['soft_expires_at'],
+                    'stale': bool(row['stale']),
+                    'refreshing': row['refreshing_since'] is not None
+                }
+        return None
+    
+    def get_last_known_result(self, market_name: str, query_type: str, **kwargs) -> Optional[Dict]:
+        """Newest cached result even if it has expired (degraded mode while the upstream is down)"""
+        query_hash = self.generate_query_hash(market_name, query_type, **kwargs)
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("""
+                SELECT result_data, created_at, expires_at,
+                       (expires_at IS NOT NULL AND expires_at <= datetime('now')) AS expired
+                FROM market_cache 
+                WHERE query_hash = ?
+            """, (query_hash,)).fetchone()
+            if row:
+                return {
+                    'data': row['result_data'],
+                    'cached_at': row['created_at'],
+                    'expires_at': row['expires_at'],
+                    'expired': bool(row['expired'])
+                }
+        return None
+    
+    def cache_result(self, market_name: str, query_type: str, result_data: Any, 
+                    source: str = 'openai', expire_hours: int = 24,
+                    stale_hours: int = STALE_HOURS, jitter: float = EXPIRY_JITTER, **kwargs):
+        """
+        Cache a market analysis result. It is fresh for expire_hours (+/- jitter), then served
+        stale (while a refresh runs) for another stale_hours before it is a hard miss.
+        """
+        query_hash = self.generate_query_hash(market_name, query_type, **kwargs)
+        key = self.market_key(market_name, query_type)
+        fresh_minutes = int(expire_hours * 60 * (1 + random.uniform(-jitter, jitter)))
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO market_cache 
+                (market_name, query_type, query_hash, result_data, source, soft_expires_at, expires_at,
+                 canonical_name, region)
+                VALUES (?, ?, ?, ?, ?, datetime('now', '+{} minutes'), datetime('now', '+{} minutes'), ?, ?)
+            """.format(fresh_minutes, fresh_minutes + stale_hours * 60), (market_name, query_type, query_hash, 
+                                     str(result_data), source, key.canonical, key.region))
+    
+    def mark_refreshing(self, market_name: str, query_type: str, 
+                        timeout_minutes: int = REFRESH_TIMEOUT_MINUTES, **kwargs) -> bool:
+        """
+        Claim the background refresh of a stale row. Only one caller (across processes)
+        wins; a claim older than timeout_minutes is assumed dead and can be taken over.
+        """
+        query_hash = self.generate_query_hash(market_name, query_type, **kwargs)
+        
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            cursor = conn.execute("""
+                UPDATE market_cache SET refreshing_since = datetime('now')
+                WHERE query_hash = ? 
+                  AND (refreshing_since IS NULL OR refreshing_since < datetime('now', '-{} minutes'))
+            """.format(int(timeout_minutes)), (query_hash,))
+            return cursor.rowcount == 1
+    
+    # === LEASE METHODS (single-flight across processes) ===
+    def acquire_lease(self, query_hash: str, owner: str, lease_seconds: int = 180) -> bool:
+        """Try to become the only fetcher for query_hash; expired leases are taken over"""
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            conn.execute("""
+                DELETE FROM cache_leases 
+                WHERE query_hash = ? AND expires_at < datetime('now')
+            """, (query_hash,))
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO cache_leases (query_hash, owner, expires_at)
+                VALUES (?, ?, datetime('now', '+{} seconds'))
+            """.format(int(lease_seconds)), (query_hash, owner))
+            return cursor.rowcount == 1
+    
+    def release_lease(self, query_hash: str, owner: str):
+        """Release a lease held by owner"""
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            conn.execute("""
+                DELETE FROM cache_leases WHERE query_hash = ? AND owner = ?
+            """, (query_hash, owner))
+    
+    def is_lease_active(self, query_hash: str) -> bool:
+        """Check whether some process currently holds an unexpired lease"""
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            cursor = conn.execute("""
+                SELECT 1 FROM cache_leases 
+                WHERE query_hash = ? AND expires_at > datetime('now')
+            """, (query_hash,))
+            return cursor.fetchone() is not None
+    
+    # === PDF METHODS ===
+    def save_pdf_processing(self, file_name: str, file_content: bytes, 
+                           total_pages: int, openai_file_ids: List[str]) -> int:
+        """Save PDF processing information"""
+        file_hash = hashlib.md5(file_content).hexdigest()
+        
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                INSERT INTO pdf_history 
+                (file_name, file_hash, file_size, total_pages, chunks_count, openai_file_ids)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (file_name, file_hash, len(file_content), total_pages, 
+                  len(openai_file_ids), json.dumps(openai_file_ids)))
+            
+            return cursor.lastrowid
+    
+    def get_pdf_by_hash(self, file_hash: str) -> Optional[Dict]:
+        """Check if PDF was already processed"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT * FROM pdf_history WHERE file_hash = ? AND status = 'processed'
+                ORDER BY processed_at DESC LIMIT 1
+            """, (file_hash,))
+            
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'id': row['id'],
+                    'file_name': row['file_name'],
+                    'total_pages': row['total_pages'],
+                    'chunks_count': row['chunks_count'],
+                    'openai_file_ids': json.loads(row['openai_file_ids']),
+                    'processed_at': row['processed_at']
+                }
+        return None
+    
+    def save_pdf_qa(self, pdf_history_id: int, question: str, answer: str, 
+                   query_tokens: int = 0, response_tokens: int = 0, cost_estimate: float = None) -> int:
+        """Save PDF Q&A interaction (cost_estimate from real usage when known)"""
+        if cost_estimate is None:
+            cost_estimate = (query_tokens * 0.01 + response_tokens * 0.03) / 1000
+        
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                INSERT INTO pdf_qa 
+                (pdf_history_id, question, answer, query_tokens, response_tokens, cost_estimate)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (pdf_history_id, question, answer, query_tokens, response_tokens, cost_estimate))
+            
+            return cursor.lastrowid
+    
+    def get_pdf_qa_history(self, pdf_history_id: int) -> List[Dict]:
+        """Get Q&A history for a specific PDF"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT question, answer, created_at, cost_estimate
+                FROM pdf_qa 
+                WHERE pdf_history_id = ?
+                ORDER BY created_at DESC
+            """, (pdf_history_id,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    # === M&A METHODS ===
+    def save_ma_search(self, market_name: str, timeframe: str, result_data: str, deals_count: int = 0):
+        """Save M&A search result"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO ma_searches (market_name, timeframe, result_data, deals_count)
+                VALUES (?, ?, ?, ?)
+            """, (market_name, timeframe, result_data, deals_count))
+    
+    def get_recent_ma_searches(self, limit: int = 10) -> List[Dict]:
+        """Get recent M&A searches"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT market_name, timeframe, deals_count, created_at, result_data
+                FROM ma_searches 
+                ORDER BY created_at DESC 
+                LIMIT ?
+            """, (limit,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_latest_ma_search(self, market_name: str, timeframe: str) -> Optional[Dict]:
+        """Newest saved M&A search for a market and timeframe"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("""
+                SELECT market_name, timeframe, deals_count, created_at, result_data
+                FROM ma_searches 
+                WHERE market_name = ? AND timeframe = ?
+                ORDER BY created_at DESC 
+                LIMIT 1
+            """, (market_name, timeframe)).fetchone()
+            return dict(row) if row else None
+    
+    def save_pdf_comparison(self, file_names: List[str], comparison_prompt: str, results: Dict[str, str],
+                            web_insights: Optional[str] = None, web_search_enabled: bool = False) -> int:
+        """Save a PDF comparison (per-file results) and the web insights shown with it"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                INSERT INTO pdf_comparisons 
+                (file_names, comparison_prompt, result_data, web_search_enabled, web_insights)
+                VALUES (?, ?, ?, ?, ?)
+            """, (json.dumps(file_names), comparison_prompt, json.dumps(results), web_search_enabled, web_insights))
+            return cursor.lastrowid
+    
+    # === ANALYTICS METHODS ===
+    def log_event(self, event_type: str, event_data: Dict = None, session_id: str = None):
+        """Log usage analytics event"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO usage_analytics (event_type, event_data, session_id)
+                VALUES (?, ?, ?)
+            """, (event_type, json.dumps(event_data) if event_data else None, session_id))
+    
+    def get_popular_markets(self, days: int = 30, limit: int = 10) -> List[Dict]:
+        """Get most popular markets in the last N days; spelling variants count as one market"""
+        with sqlite3.connect(self.db_path) as conn:
+            # market_name comes from the newest row of each group (SQLite bare column with MAX)
+            cursor = conn.execute("""
+                SELECT market_name, COUNT(*) as query_count, MAX(created_at) as last_queried, canonical_name, region
+                FROM market_cache 
+                WHERE created_at > datetime('now', '-{} days')
+                    AND query_type IN ('global', 'vertical', 'horizontal', 'submarkets') -- not drilldowns
+                GROUP BY COALESCE(canonical_name, market_name), region
+                ORDER BY query_count DESC
+                LIMIT ?
+            """.format(days), (limit,))
+            
+            return [{'market_name': row[0], 'query_count': row[1], 'last_queried': row[2],
+                     'market_id': MarketKey(row[3] or row[0], row[4]).market_id}
+                   for row in cursor.fetchall()]
+    
+    def get_requested_markets(self, days: int = 30, limit: int = 10) -> List[Dict]:
+        """
+        Markets users asked for most in the last N days, from 'market_analysis' events (cache
+        hits included); spelling variants count as one market, named by the latest spelling
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                SELECT
+                    JSON_EXTRACT(event_data, '$.market_name') as market_name,
+                    COUNT(*) as query_count,
+                    MAX(created_at) as last_queried
+                FROM usage_analytics
+                WHERE event_type = 'market_analysis'
+                    AND created_at > datetime('now', '-{} days')
+                    AND JSON_EXTRACT(event_data, '$.market_name') IS NOT NULL
+                GROUP BY JSON_EXTRACT(event_data, '$.market_name')
+                ORDER BY last_queried
+            """.format(days))
+
+            markets = {}
+            for market_name, query_count, last_queried in cursor.fetchall():
+                market_id = market_key(market_name).market_id
+                entry = markets.setdefault(market_id, {'market_id': market_id, 'query_count': 0})
+                entry['query_count'] += query_count
+                entry.update(market_name=market_name, last_queried=last_queried)  # rows come oldest first
+
+            return sorted(markets.values(), key=lambda m: (m['query_count'], m['last_queried']), reverse=True)[:limit]
+
+    def has_cached_market(self, market_name: str, query_types: List[str]) -> bool:
+        """Whether some spelling of this market has a live (not hard-expired) row of one of these types"""
+        key = market_key(market_name)
+        placeholders = ",".join("?" * len(query_types))
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(f"""
+                SELECT 1 FROM market_cache 
+                WHERE canonical_name = ? AND region IS ? AND query_type IN ({placeholders})
+                    AND expires_at > datetime('now')
+                LIMIT 1
+            """, [key.canonical, key.region, *query_types]).fetchone()
+            return row is not None
+    
+    def get_cached_market_names(self, query_types: List[str]) -> List[str]:
+        """Markets with a live (not hard-expired) cached analysis of one of these types"""
+        placeholders = ",".join("?" * len(query_types))
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(f"""
+                SELECT DISTINCT market_name FROM market_cache 
+                WHERE query_type IN ({placeholders}) AND expires_at > datetime('now')
+                ORDER BY market_name
+            """, list(query_types))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_expiring_entries(self, market_names: List[str], horizon_hours: float = 6) -> List[Dict]:
+        """Cached analyses for these markets (any spelling) that go stale within horizon_hours (or already have)"""
+        if not market_names:
+            return []
+        keys = {market_key(name) for name in market_names}
+        canonical_names = sorted({key.canonical for key in keys})
+        placeholders = ",".join("?" * len(canonical_names))
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT market_name, query_type, query_hash, COALESCE(soft_expires_at, expires_at) as refresh_at,
+                       expires_at, canonical_name, region
+                FROM market_cache 
+                WHERE canonical_name IN ({})
+                    AND COALESCE(soft_expires_at, expires_at) <= datetime('now', '+{} minutes')
+                ORDER BY refresh_at ASC
+            """.format(placeholders, int(horizon_hours * 60)), canonical_names)
+            
+            return [dict(row) for row in cursor.fetchall()
+                    if MarketKey(row['canonical_name'], row['region']) in keys]
+    
+    def get_expiry_distribution(self, bucket_hours: int = 1) -> Dict[int, int]:
+        """Count of live cache entries by hours until they go stale, in bucket_hours buckets"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                SELECT CAST((julianday(COALESCE(soft_expires_at, expires_at)) - julianday('now')) * 24 / ? AS INTEGER) 
+                           * ? as bucket,
+                       COUNT(*)
+                FROM market_cache 
+                WHERE expires_at > datetime('now')
+                GROUP BY bucket
+                ORDER BY bucket
+            """, (bucket_hours, bucket_hours))
+            
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    # === HISTORY BROWSING METHODS ===
+    def get_market_analysis_history(self, limit: int = 20) -> List[Dict]:
+        """Get history of market analyses for browsing"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT DISTINCT market_name, query_type, created_at,
+                       COUNT(*) OVER (PARTITION BY market_name, query_type) as access_count
+                FROM market_cache 
+                WHERE (expires_at > datetime('now') OR expires_at IS NULL)
+                    AND query_type IN ('global', 'vertical', 'horizontal', 'submarkets')
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (limit,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_pdf_sessions_summary(self, limit: int = 15) -> List[Dict]:
+        """Get summary of PDF sessions for browsing"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT p.id, p.file_name, p.total_pages, p.chunks_count, 
+                       p.processed_at, p.openai_file_ids,
+                       COUNT(q.id) as qa_count,
+                       MAX(q.created_at) as last_question
+                FROM pdf_history p
+                LEFT JOIN pdf_qa q ON p.id = q.pdf_history_id
+                WHERE p.status = 'processed'
+                GROUP BY p.id
+                ORDER BY p.processed_at DESC
+                LIMIT ?
+            """, (limit,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def restore_pdf_session(self, pdf_id: int) -> Dict:
+        """Get all data needed to restore a PDF session"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            
+            # Get PDF info
+            pdf_cursor = conn.execute("""
+                SELECT * FROM pdf_history WHERE id = ? AND status = 'processed'
+            """, (pdf_id,))
+            pdf_data = pdf_cursor.fetchone()
+            
+            if not pdf_data:
+                return None
+            
+            # Get Q&A history
+            qa_cursor = conn.execute("""
+                SELECT question, answer, created_at, cost_estimate
+                FROM pdf_qa 
+                WHERE pdf_history_id = ?
+                ORDER BY created_at ASC
+            """, (pdf_id,))
+            qa_history = [dict(row) for row in qa_cursor.fetchall()]
+            
+            return {
+                'pdf_info': dict(pdf_data),
+                'qa_history': qa_history
+            }
+    
+    # === UTILITY METHODS ===
+    # === LLM CALL METRICS ===
+    def get_llm_agent_stats(self, days: int = 7) -> List[Dict]:
+        """Per-agent call counts, cache hits, errors, latency, tokens and cost over the last N days"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT agent,
+                       SUM(cache_hit = 0) as upstream_calls,
+                       SUM(cache_hit) as cache_hits,
+                       SUM(error_class IS NOT NULL) as errors,
+                       SUM(retries) as retries,
+                       AVG(CASE WHEN cache_hit = 0 THEN latency_ms END) as avg_latency_ms,
+                       SUM(input_tokens) as input_tokens,
+                       SUM(cached_tokens) as cached_tokens,
+                       SUM(output_tokens) as output_tokens,
+                       SUM(cost_usd) as cost_usd
+                FROM llm_calls 
+                WHERE created_at > datetime('now', '-{} days')
+                GROUP BY agent
+                ORDER BY cost_usd DESC
+            """.format(days))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_llm_latencies(self, days: int = 7) -> List[Dict]:
+        """Latency of every upstream call over the last N days, for histograms"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT agent, latency_ms, error_class
+                FROM llm_calls 
+                WHERE cache_hit = 0 AND created_at > datetime('now', '-{} days')
+            """.format(days))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_model_routing_stats(self, days: int = 7) -> List[Dict]:
+        """Upstream calls per agent and model over the last N days, with how many were escalations"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT agent, model,
+                       COUNT(*) as calls,
+                       SUM(escalated) as escalated_calls,
+                       SUM(error_class IS NOT NULL) as errors,
+                       AVG(latency_ms) as avg_latency_ms,
+                       SUM(cost_usd) as cost_usd
+                FROM llm_calls 
+                WHERE cache_hit = 0 AND model IS NOT NULL
+                  AND created_at > datetime('now', '-{} days')
+                GROUP BY agent, model
+                ORDER BY agent, calls DESC
+            """.format(days))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def cleanup_expired_cache(self):
+        """Remove expired cache entries"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM market_cache WHERE expires_at < datetime('now')")
+    
+    def get_database_stats(self) -> Dict:
+        """Get database statistics"""
+        with sqlite3.connect(self.db_path) as conn:
+            stats = {}
+            tables = ['market_cache', 'pdf_history', 'pdf_qa', 'ma_searches', 'pdf_comparisons', 'usage_analytics',
+                      'llm_calls']
+            for table in tables:
+                cursor = conn.execute(f"SELECT COUNT(*) FROM {table}")
+                stats[f"{table}_count"] = cursor.fetchone()[0]
+            
+            stats['db_size_mb'] = os.path.getsize(self.db_path) / (1024 * 1024) if os.path.exists(self.db_path) else 0
+            return stats
@@ -0,0 +1,141 @@
+# market_names.py
+
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Bump whenever the rules below change the key a name maps to: market_db re-keys its cached
+# rows once per version
+KEY_VERSION = 2
+
+# Region qualifiers -> region code; "global"/"worldwide" mean no region
+REGIONS = {
+    'us': 'us', 'usa': 'us', 'united states': 'us', 'united states of america': 'us',
+    'north america': 'north_america', 'latin america': 'latin_america', 'latam': 'latin_america',
+    'south america': 'latin_america',
+    'europe': 'europe', 'eu': 'europe', 'european': 'europe', 'european union': 'europe',
+    'uk': 'uk', 'united kingdom': 'uk', 'britain': 'uk', 'great britain': 'uk',
+    'germany': 'germany', 'france': 'france',
+    'asia': 'asia_pacific', 'asia pacific': 'asia_pacific', 'apac': 'asia_pacific',
+    'china': 'china', 'india': 'india', 'japan': 'japan', 'south korea': 'south_korea', 'korea': 'south_korea',
+    'middle east': 'middle_east', 'mena': 'middle_east', 'africa': 'africa',
+    'global': None, 'worldwide': None, 'world': None,
+}
+
+# Variant phrase -> canonical id, matched on whole words after singularization
+ALIASES = {
+    'electric vehicle': 'ev',
+    'electric car': 'ev',
+    'artificial intelligence': 'ai',
+    'generative ai': 'genai',
+    'gen ai': 'genai',
+    'machine learning': 'ml',
+    'software as a service': 'saas',
+    'internet of thing': 'iot',
+    'semiconductor chip': 'semiconductor',
+    'augmented reality': 'ar',
+    'virtual reality': 'vr',
+}
+
+# Words that describe the query rather than the market. "Space", "sector" and "segment" are left out:
+# they name markets themselves ("Commercial Space", "Office Space") too often to be dropped.
+SUFFIX_WORDS = {'market', 'markets', 'industry', 'industries'}
+CONNECTORS = {'the', 'in', 'for', 'of', 'across', 'within'}
+# Words ending in "s" that are not plurals
+SINGULAR_S = {'gas', 'biogas', 'lens', 'news', 'series', 'species', 'analysis', 'diagnosis', 'bus', 'us',
+              'glass', 'mass', 'process', 'logistics', 'aerospace', 'ads', 'saas', 'paas', 'iaas', 'ios'}
+
+# Abbreviations that only ever mean a region, so they count as one even at the start of a bare name
+REGION_CODES = {'us', 'usa', 'uk', 'eu', 'apac', 'latam', 'mena'}
+
+_ALIAS_PATTERN = re.compile(r"\b(" + "|".join(sorted(map(re.escape, ALIASES), key=len, reverse=True)) + r")\b")
+_REGION_ALTERNATION = "|".join(sorted(map(re.escape, REGIONS), key=len, reverse=True))
+_REGION_NAME_PATTERN = re.compile(rf"\b({_REGION_ALTERNATION})\b")
+# "the us", "europe and the us", "us uk and germany" (punctuation is gone by the time these run)
+_REGION_LIST = rf"(?:the\s+)?(?:{_REGION_ALTERNATION})(?:\s+(?:and\s+)?(?:the\s+)?(?:{_REGION_ALTERNATION}))*"
+_SUFFIX = "|".join(sorted(SUFFIX_WORDS, key=len, reverse=True))
+_TRAILING_REGIONS = re.compile(rf"\b(?:in|for|across|within)\s+({_REGION_LIST})(?:\s+(?:{_SUFFIX}))?$")
+_LEADING_REGIONS = re.compile(rf"^({_REGION_LIST})\s+(?=\S)")
+
+
+class MarketKey(NamedTuple):
+    """Cache identity of a market: canonical id plus an optional region code"""
+    canonical: str
+    region: Optional[str] = None
+
+    @property
+    def market_id(self) -> str:
+        return f"{self.canonical}@{self.region}" if self.region else self.canonical
+
+
+def singularize(word: str) -> str:
+    if len(word) <= 3 or word in SINGULAR_S or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _strip_edges(words: list) -> list:
+    """Drop "market"/"industry" suffixes and dangling connectors at either end"""
+    while words and (words[-1] in SUFFIX_WORDS or words[-1] in CONNECTORS):
+        words.pop()
+    while words and words[0] in CONNECTORS:
+        words.pop(0)
+    return words
+
+
+def _region_code(phrase: str) -> Optional[str]:
+    """Region code for one or more region names; several regions sort into one code ('europe+us')"""
+    codes = {REGIONS[name] for name in _REGION_NAME_PATTERN.findall(phrase)} - {None}
+    return "+".join(sorted(codes)) or None
+
+
+def _split_region(text: str):
+    """
+    (text without its region qualifier, region code). Only a trailing "in/for/across <regions>"
+    or a leading region prefix counts, and a leading one only ahead of a "market"/"industry"
+    suffix or as an abbreviation ("US Plastics"): "India Pale Ale", "Japan Tobacco" and
+    "Global Positioning Systems" keep their words.
+    """
+    match = _TRAILING_REGIONS.search(text)
+    if match:
+        return (text[:match.start()] + text[match.end(1):]).strip(), _region_code(match.group(1))
+    match = _LEADING_REGIONS.match(text)
+    if match:
+        rest = text[match.end():]
+        words = match.group(1).split()
+        if rest.split()[-1] in SUFFIX_WORDS or (len(words) == 1 and words[0] in REGION_CODES):
+            return rest, _region_code(match.group(1))
+    return text, None
+
+
+@lru_cache(maxsize=4096)
+def market_key(market_name: str) -> MarketKey:
+    """
+    Deterministic canonical key: case, whitespace and punctuation, plurals, "market"/"industry"
+    suffixes and region qualifiers ("in the US", "European ... market") don't matter, and aliases
+    are folded. "EV Batteries Market in the U.S." -> MarketKey('ev battery', 'us')
+    """
+    text = (market_name or "").lower().replace("&", " and ")
+    text = re.sub(r"\b(?:[a-z]\.){2,}", lambda m: m.group(0).replace(".", ""), text)  # u.s. -> us
+    text = re.sub(r"[^a-z0-9+]+", " ", text).strip()
+    text, region = _split_region(text)
+
+    words = text.split()
+    canonical = " ".join(singularize(word) for word in _strip_edges(list(words)))
+    canonical = _ALIAS_PATTERN.sub(lambda m: ALIASES[m.group(1)], canonical)
+    if not canonical:
+        # Nothing but qualifiers ("US market"): key on the last of them, keeping the region
+        qualifiers = [word for word in words if word not in CONNECTORS]
+        canonical = singularize(qualifiers[-1]) if qualifiers else ""
+    return MarketKey(canonical, region)
+
+
+def normalize_market_name(market_name: str) -> str:
+    """Canonical market id as one string, e.g. 'ev battery@us'"""
+    return market_key(market_name).market_id
@@ -0,0 +1,367 @@
+# market_orchestrator.py
+
+import importlib
+import threading
+import contextvars
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from cachetools import TTLCache
+from llm_client import MAX_CONCURRENCY, background_priority, breaker
+from llm_metrics import LLMCall, llm_agent
+from single_flight import single_flight_for
+from market_schemas import EMPTY_ROWS_JSON, STRUCTURED_QUERY, DrilldownResult
+
+
+class AgentRegistry(Mapping):
+    """analysis_type -> agent function, given as 'module.function' and imported on first use"""
+
+    def __init__(self, paths: Dict[str, str]):
+        self._paths = paths
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, analysis_type: str) -> Callable:
+        with self._lock:
+            if analysis_type not in self._loaded:
+                module_name, function_name = self._paths[analysis_type].rsplit('.', 1)
+                self._loaded[analysis_type] = getattr(importlib.import_module(module_name), function_name)
+            return self._loaded[analysis_type]
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+MARKET_AGENTS = AgentRegistry({
+    'global': 'global_metrics_agent.get_global_overview',
+    'vertical': 'openai_handler.get_vertical_submarkets',
+    'horizontal': 'horizontal_handler.get_horizontal_submarkets',
+    'metrics': 'metrics_agent.get_detailed_metrics',
+    'companies': 'companies_agent.get_top_companies',
+    'submarkets': 'submarkets_agent.get_submarkets',
+    'web_insights': 'web_search_agent.search_web_insights',
+})
+
+# Token-streaming variants, used for the section rendered in the script thread
+MARKET_STREAMS = AgentRegistry({
+    'global': 'global_metrics_agent.stream_global_overview',
+    'vertical': 'openai_handler.stream_vertical_submarkets',
+    'horizontal': 'horizontal_handler.stream_horizontal_submarkets',
+})
+
+# Multi-item variants: sub-markets -> {sub-market: structured result} from one request
+MARKET_BATCH_AGENTS = AgentRegistry({
+    'metrics': 'metrics_agent.get_detailed_metrics_batched',
+    'companies': 'companies_agent.get_top_companies_batched',
+})
+BATCH_SIZE = 5  # sub-markets per multi-item request; bigger answers get less reliable
+
+# Shared by every session; upstream concurrency is still capped by llm_client
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="market-fanout")
+
+# In-process memo in front of market_cache, so Streamlit reruns don't even hit SQLite
+MEMO_TTL_SECONDS = 300
+_memo = TTLCache(maxsize=1024, ttl=MEMO_TTL_SECONDS)
+_memo_lock = threading.Lock()
+
+# Stale entries with a background refresh already queued in this process
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# How long a fresh result stays fresh in market_cache, per analysis type. Web results go stale
+# faster than market analyses; the warmer and the interactive path must agree on this.
+DEFAULT_EXPIRE_HOURS = 24
+EXPIRE_HOURS = {'web_insights': 12}
+
+# Agents signal failure with these prefixes instead of raising; never cache them
+FAILURE_PREFIXES = ("⚠️", "❌")
+UPSTREAM_DOWN_MESSAGE = "⚠️ The analysis service is unavailable and nothing is cached for this yet. Try again shortly."
+
+
+def expire_hours_for(analysis_type: str) -> int:
+    return EXPIRE_HOURS.get(analysis_type, DEFAULT_EXPIRE_HOURS)
+
+
+def is_cacheable(result: Optional[str]) -> bool:
+    """Not a failure message, and not a structured result without rows (worth a retry, not 24h of nothing)"""
+    return bool(result) and not result.startswith(FAILURE_PREFIXES) and result.strip() != EMPTY_ROWS_JSON
+
+
+def _query_kwargs(structured: bool) -> dict:
+    """Cache key extras: structured (JSON) results are cached apart from Markdown ones"""
+    return STRUCTURED_QUERY if structured else {}
+
+
+def _run_agent(market_name: str, analysis_type: str, structured: bool) -> str:
+    agent = MARKET_AGENTS[analysis_type]
+    with llm_agent(analysis_type):
+        return agent(market_name, structured=True) if structured else agent(market_name)
+
+
+def get_cached_analysis(market_name: str, analysis_type: str, db, expire_hours: int = 24,
+                        structured: bool = False) -> Optional[str]:
+    """
+    Memo first, then market_cache; returns None on a miss. A stale entry is returned
+    as-is and a single background refresh is queued for it (stale-while-revalidate).
+    """
+    query = _query_kwargs(structured)
+    query_hash = db.generate_query_hash(market_name, analysis_type, **query)
+    with _memo_lock:
+        entry = _memo.get(query_hash)
+
+    if entry is None:
+        cached = db.get_cached_result(market_name, analysis_type, **query)
+        if not cached:
+            return None
+        entry = (cached['data'], cached['stale'])
+        with _memo_lock:
+            _memo[query_hash] = entry
+
+    data, stale = entry
+    if stale:
+        schedule_refresh(market_name, analysis_type, db, expire_hours, structured)
+    return data
+
+
+def last_known_analysis(market_name: str, analysis_type: str, db, structured: bool = False) -> Optional[str]:
+    """Newest cached result however old (degraded mode), or None if there never was one"""
+    cached = db.get_last_known_result(market_name, analysis_type, **_query_kwargs(structured))
+    return cached['data'] if cached else None
+
+
+def _degraded(market_name: str, analysis_type: str, db, structured: bool) -> Tuple[str, bool]:
+    data = last_known_analysis(market_name, analysis_type, db, structured)
+    if data is None:
+        return UPSTREAM_DOWN_MESSAGE, False
+    print(f"🔌 Serving last known {analysis_type} for {market_name} (upstream unavailable)")
+    return data, True
+
+
+def schedule_refresh(market_name: str, analysis_type: str, db, expire_hours: int = 24,
+                     structured: bool = False) -> bool:
+    """Queue a background refresh of a stale entry unless one is already running anywhere"""
+    if not breaker.allows_requests():
+        return False  # keep serving stale; the breaker's probes decide when to try again
+    query = _query_kwargs(structured)
+    query_hash = db.generate_query_hash(market_name, analysis_type, **query)
+    with _refreshing_lock:
+        if query_hash in _refreshing:
+            return False
+        _refreshing.add(query_hash)
+
+    if not db.mark_refreshing(market_name, analysis_type, **query):
+        # Another process owns the refresh; its result reaches us via market_cache
+        with _refreshing_lock:
+            _refreshing.discard(query_hash)
+        return False
+
+    print(f"♻️ Serving stale {analysis_type} for {market_name}, refreshing in background")
+    _executor.submit(_refresh, market_name, analysis_type, db, expire_hours, structured)
+    return True
+
+
+def refresh_analysis(market_name: str, analysis_type: str, db, expire_hours: int = 24,
+                     structured: bool = False) -> bool:
+    """Fetch a fresh result at background priority and overwrite the cached one; False on failure"""
+    if not breaker.allows_requests():
+        print(f"🔌 Skipping refresh of {analysis_type} for {market_name}: upstream circuit is open")
+        return False
+    with background_priority():
+        result = _run_agent(market_name, analysis_type, structured)
+    if not is_cacheable(result):
+        # Keep serving the old row; a refresh claim lapses and is retried later
+        print(f"⚠️ Refresh of {analysis_type} for {market_name} failed, keeping cached entry")
+        return False
+    _store(market_name, analysis_type, db, result, expire_hours, structured)
+    print(f"✅ Refreshed {analysis_type} for {market_name}")
+    return True
+
+
+def _refresh(market_name: str, analysis_type: str, db, expire_hours: int, structured: bool):
+    try:
+        refresh_analysis(market_name, analysis_type, db, expire_hours, structured)
+    except Exception as e:
+        print(f"❌ Refresh of {analysis_type} for {market_name} failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(db.generate_query_hash(market_name, analysis_type, **_query_kwargs(structured)))
+
+
+def _store(market_name: str, analysis_type: str, db, result: str, expire_hours: int, structured: bool):
+    """Write a fresh result to market_cache and the memo"""
+    query = _query_kwargs(structured)
+    db.cache_result(market_name, analysis_type, result, expire_hours=expire_hours, **query)
+    with _memo_lock:
+        _memo[db.generate_query_hash(market_name, analysis_type, **query)] = (result, False)
+
+
+def clear_memo():
+    """Drop the in-process memo (after deleting rows from market_cache)"""
+    with _memo_lock:
+        _memo.clear()
+
+
+def fetch_market_analysis(market_name: str, analysis_type: str, db, fetch: Callable[[str], str] = None,
+                          expire_hours: int = 24, structured: bool = False) -> Tuple[str, bool]:
+    """
+    Returns (result, cache_hit) for one analysis. On a miss, identical requests from other
+    sessions and worker processes are coalesced so only one upstream call is made.
+    With structured=True the result is the agent's compact JSON rows instead of Markdown.
+    While the upstream circuit is open, or when the fetch fails, the newest cached result is
+    returned however old it is (as a cache hit).
+    """
+    query = _query_kwargs(structured)
+    query_hash = db.generate_query_hash(market_name, analysis_type, **query)
+
+    def lookup():
+        data = get_cached_analysis(market_name, analysis_type, db, expire_hours, structured)
+        return (data, True) if data is not None else None
+
+    def load():
+        try:
+            if fetch:
+                with llm_agent(analysis_type):
+                    result = fetch(market_name)
+            else:
+                result = _run_agent(market_name, analysis_type, structured)
+        except Exception as e:
+            # Never hand the exception to the single-flight waiters; they get the fallback below
+            print(f"❌ {analysis_type} analysis failed for {market_name}: {e}")
+            result = f"⚠️ The {analysis_type} analysis failed: {e}"
+        if not is_cacheable(result):
+            # Upstream failed: an old answer beats an error message
+            fallback = last_known_analysis(market_name, analysis_type, db, structured)
+            return (fallback, True) if fallback is not None else (result, False)
+        _store(market_name, analysis_type, db, result, expire_hours, structured)
+        return result, False
+
+    call = LLMCall(agent=analysis_type, cache_hit=True)
+    hit = lookup()
+    if hit:
+        call.finish()  # recorded so llm_calls shows the hit ratio per agent
+        return hit
+    if not breaker.allows_requests():
+        return _degraded(market_name, analysis_type, db, structured)
+    return single_flight_for(db).do(query_hash, load, lookup)
+
+
+def fetch_batched_analysis(market_names: List[str], analysis_type: str, db, expire_hours: int = 24,
+                           batch_size: int = BATCH_SIZE) -> Dict[str, Tuple[str, bool]]:
+    """
+    Structured results for several sub-markets: {name: (result, cache_hit)}. Misses are fetched
+    batch_size per request and every item is cached on its own, so later single lookups hit.
+    Sub-markets a batched answer left out (or whose batch failed) are missing from the result.
+    """
+    results = {}
+    misses = []
+    for market_name in dict.fromkeys(market_names):
+        cached = get_cached_analysis(market_name, analysis_type, db, expire_hours, structured=True)
+        if cached is not None:
+            results[market_name] = (cached, True)
+        else:
+            misses.append(market_name)
+    if not misses or not breaker.allows_requests():
+        return results
+
+    agent = MARKET_BATCH_AGENTS[analysis_type]
+    for start in range(0, len(misses), batch_size):
+        batch = misses[start:start + batch_size]
+        try:
+            with llm_agent(f"{analysis_type}_batched"):
+                fetched = agent(batch)
+        except Exception as e:
+            print(f"❌ Batched {analysis_type} failed for {', '.join(batch)}: {e}")
+            continue
+        for market_name, result in fetched.items():
+            if is_cacheable(result):
+                _store(market_name, analysis_type, db, result, expire_hours, structured=True)
+                results[market_name] = (result, False)
+        print(f"📦 Batched {analysis_type}: {len(fetched)}/{len(batch)} sub-markets in one request")
+    return results
+
+
+DRILLDOWN_TYPES = ('metrics', 'companies')
+
+
+def fetch_drilldown(submarket: str, db, expire_hours: int = 24) -> Dict[str, Tuple[str, bool]]:
+    """
+    Structured metrics and top companies for a sub-market: {query_type: (result, cache_hit)}.
+    When both miss they come from one combined call (drilldown_agent) and are cached under
+    each query type, so single-section lookups and the prefetcher share the entries.
+    A section the combined call left empty is fetched again on its own.
+    """
+    def lookup():
+        cached = {t: get_cached_analysis(submarket, t, db, expire_hours, structured=True) for t in DRILLDOWN_TYPES}
+        return {t: (data, True) for t, data in cached.items() if data is not None} or None
+
+    def load():
+        from drilldown_agent import get_drilldown
+        with llm_agent('drilldown'):
+            result = get_drilldown(submarket)
+        if not is_cacheable(result):
+            return None  # the single-section path below has the last-known fallback
+        sections = {t: data for t, data in DrilldownResult.from_json(result).sections().items() if is_cacheable(data)}
+        for analysis_type, data in sections.items():
+            _store(submarket, analysis_type, db, data, expire_hours, structured=True)
+        return {t: (data, False) for t, data in sections.items()} or None
+
+    hits = {}
+    for analysis_type in DRILLDOWN_TYPES:
+        call = LLMCall(agent=analysis_type, cache_hit=True)
+        cached = get_cached_analysis(submarket, analysis_type, db, expire_hours, structured=True)
+        if cached is not None:
+            call.finish()
+            hits[analysis_type] = (cached, True)
+    if len(hits) == len(DRILLDOWN_TYPES):
+        return hits
+
+    if not hits and breaker.allows_requests():
+        key = db.generate_query_hash(submarket, 'drilldown', **STRUCTURED_QUERY)
+        hits.update(single_flight_for(db).do(key, load, lookup) or {})
+    # One section missing or empty, the combined call failed, or the circuit is open: per-section path
+    for analysis_type in DRILLDOWN_TYPES:
+        if analysis_type not in hits:
+            hits[analysis_type] = fetch_market_analysis(submarket, analysis_type, db,
+                                                        expire_hours=expire_hours, structured=True)
+    return hits
+
+
+def fan_out_market_analysis(market_name: str, analysis_types: List[str], db,
+                            expire_hours: int = 24, structured: bool = False) -> Iterator[Tuple[str, str, bool]]:
+    """
+    Starts every requested analysis and returns an iterator of (analysis_type, result, cache_hit).
+    Cache hits are yielded first; misses are submitted immediately, fetched concurrently
+    and cached as they land, so the caller can do other work before iterating.
+    """
+    hits = []
+    pending = {}
+    for analysis_type in analysis_types:
+        call = LLMCall(agent=analysis_type, cache_hit=True)
+        cached = get_cached_analysis(market_name, analysis_type, db, expire_hours, structured)
+        if cached is not None:
+            call.finish()
+            hits.append((analysis_type, cached, True))
+        else:
+            # Run in a copy of the caller's context so its deadline and hedging settings apply
+            future = _executor.submit(contextvars.copy_context().run, fetch_market_analysis,
+                                      market_name, analysis_type, db,
+                                      expire_hours=expire_hours, structured=structured)
+            pending[future] = analysis_type
+
+    return _collect_results(market_name, hits, pending)
+
+
+def _collect_results(market_name: str, hits: list, pending: dict) -> Iterator[Tuple[str, str, bool]]:
+    yield from hits
+
+    for future in as_completed(pending):
+        analysis_type = pending[future]
+        try:
+            result, cache_hit = future.result()
+        except Exception as e:
+            print(f"❌ {analysis_type} analysis failed for {market_name}: {e}")
+            result, cache_hit = None, False
+        yield analysis_type, result, cache_hit
@@ -0,0 +1,290 @@
+# market_schemas.py
+
+import json
+from dataclasses import dataclass, field, asdict
+from typing import TYPE_CHECKING, ClassVar, Dict, List
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+STRING = {"type": "string"}
+
+
+def json_object(properties: Dict[str, dict]) -> dict:
+    """Strict JSON-schema object: every property required, nothing extra"""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def json_array(items: dict) -> dict:
+    return {"type": "array", "items": items}
+
+
+def json_schema_format(name: str, schema: dict) -> dict:
+    """Value for the Responses API `text` parameter that constrains output to `schema`"""
+    return {"format": {"type": "json_schema", "name": name, "schema": schema, "strict": True}}
+
+
+def to_compact_json(data) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+# Appended to an agent's Markdown-oriented prompt in structured mode
+STRUCTURED_INSTRUCTIONS = """
+Return the rows as JSON matching the response schema instead of a Markdown table.
+Cells hold plain text (no Markdown). `source` is the bare URL, or the basis of the
+figure when there is no URL.
+"""
+
+# Extra cache key for structured results, so they never collide with cached Markdown
+STRUCTURED_QUERY = {"format": "json"}
+
+
+# === ROW TYPES ===
+@dataclass
+class VerticalSubmarket:
+    sub_market: str
+    source: str
+
+    COLUMNS: ClassVar[Dict[str, str]] = {"sub_market": "Sub-market", "source": "Source"}
+
+
+@dataclass
+class HorizontalSubmarket:
+    sub_market: str
+    description: str
+    source: str
+
+    COLUMNS: ClassVar[Dict[str, str]] = {
+        "sub_market": "Sub-market or Company",
+        "description": "Description",
+        "source": "Source",
+    }
+
+
+@dataclass
+class MetricRow:
+    metric: str
+    value: str
+    source: str
+
+    COLUMNS: ClassVar[Dict[str, str]] = {"metric": "Metric", "value": "Value", "source": "Source"}
+
+
+@dataclass
+class CompanyRow:
+    company: str
+    market_share: str
+    basis: str
+    source: str
+
+    COLUMNS: ClassVar[Dict[str, str]] = {
+        "company": "Company Name",
+        "market_share": "Market Share (%)",
+        "basis": "Basis of Estimate",
+        "source": "Source",
+    }
+
+
+@dataclass
+class DealRow:
+    acquirer: str
+    acquirer_hq: str
+    target: str
+    target_hq: str
+    description: str
+    date: str
+    source: str
+
+    COLUMNS: ClassVar[Dict[str, str]] = {
+        "acquirer": "Acquirer",
+        "acquirer_hq": "Acquirer HQ",
+        "target": "Target",
+        "target_hq": "Target HQ",
+        "description": "Description",
+        "date": "Date",
+        "source": "Source",
+    }
+
+
+def row_schema(row_type) -> dict:
+    return json_object({name: STRING for name in row_type.COLUMNS})
+
+
+def rows_to_dataframe(rows: list, row_type) -> "pd.DataFrame":
+    """Display DataFrame with the same column labels the markdown tables used"""
+    import pandas as pd  # only needed once there is something to display
+    return pd.DataFrame([asdict(row) for row in rows], columns=list(row_type.COLUMNS)).rename(columns=row_type.COLUMNS)
+
+
+def rows_to_markdown(rows: list, row_type) -> str:
+    """Render rows as a Markdown table; 'source' fields become links"""
+    headers = list(row_type.COLUMNS.values())
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join("---" for _ in headers) + "|"]
+    for row in rows:
+        cells = []
+        for name in row_type.COLUMNS:
+            value = str(getattr(row, name)).replace("|", "\\|").replace("\n", " ")
+            if name == "source" and value.startswith("http"):
+                value = f"[source]({value})"
+            cells.append(value)
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+# === SINGLE-TABLE RESULTS ===
+def table_schema(row_type) -> dict:
+    """Schema for {"rows": [...]}; strict mode needs an object at the top level"""
+    return json_object({"rows": json_array(row_schema(row_type))})
+
+
+def parse_rows(text: str, row_type) -> list:
+    """Typed rows from a structured response or cache entry; raises ValueError/TypeError if it isn't one"""
+    return [row_type(**row) for row in json.loads(text)["rows"]]
+
+
+def rows_to_json(rows: list) -> str:
+    return to_compact_json({"rows": [asdict(row) for row in rows]})
+
+
+EMPTY_ROWS_JSON = rows_to_json([])
+
+
+def rows_or_message(rows: list, message: str) -> str:
+    """Compact rows JSON, or `message` (a "⚠️ ..." failure string, so it is never cached) when there are none"""
+    return rows_to_json(rows) if rows else message
+
+
+def render_markdown(text: str, row_type) -> str:
+    """Markdown for display; Markdown cached before structured mode (or an error message) passes through"""
+    try:
+        return rows_to_markdown(parse_rows(text, row_type), row_type)
+    except (ValueError, TypeError, KeyError):
+        return text
+
+
+def count_rows(text: str, row_type) -> int:
+    try:
+        return len(parse_rows(text, row_type))
+    except (ValueError, TypeError, KeyError):
+        return 0
+
+
+# query_type -> row type of its structured mode
+ROW_TYPES = {
+    'global': MetricRow,
+    'metrics': MetricRow,
+    'companies': CompanyRow,
+    'vertical': VerticalSubmarket,
+    'horizontal': HorizontalSubmarket,
+    'mergers': DealRow,
+}
+
+
+# === MULTI-ITEM RESULTS (several sub-markets in one request) ===
+BATCHED_INSTRUCTIONS = """
+You are given several sub-markets at once. Research each one separately and return one
+entry per sub-market in `items`, with `name` copied exactly as given and its own `rows`
+(an empty list if nothing specific was found). Never mix figures between sub-markets.
+Cells hold plain text (no Markdown). `source` is the bare URL, or the basis of the
+figure when there is no URL.
+"""
+
+
+def batched_schema(row_type) -> dict:
+    """Schema for {"items": [{"name": ..., "rows": [...]}]}, one item per requested sub-market"""
+    item = json_object({"name": STRING, "rows": json_array(row_schema(row_type))})
+    return json_object({"items": json_array(item)})
+
+
+def batched_input(names: List[str]) -> str:
+    return "Sub-markets:\n" + "\n".join(f"- {name}" for name in names)
+
+
+def parse_batched_rows(text: str, row_type, names: List[str]) -> Dict[str, list]:
+    """
+    Typed rows per requested name from a multi-item response. Items are matched by name,
+    then by canonical market key (case, plurals, "market" suffixes); unmatched names are left out.
+    Raises ValueError/TypeError if the text isn't a multi-item response.
+    """
+    from market_names import market_key
+    items = json.loads(text)["items"]
+    by_key = {market_key(name): name for name in names}
+    rows = {}
+    for item in items:
+        name = item.get("name", "")
+        requested = name if name in names else by_key.get(market_key(name))
+        if requested and requested not in rows:
+            rows[requested] = [row_type(**row) for row in item.get("rows", [])]
+    return rows
+
+
+# === COMBINED SUB-MARKETS ===
+SUBMARKETS_SCHEMA = json_object({
+    "vertical": json_array(row_schema(VerticalSubmarket)),
+    "horizontal": json_array(row_schema(HorizontalSubmarket)),
+})
+
+
+@dataclass
+class SubmarketsResult:
+    """Vertical and horizontal sub-markets from one structured response"""
+    vertical: List[VerticalSubmarket] = field(default_factory=list)
+    horizontal: List[HorizontalSubmarket] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SubmarketsResult":
+        return cls(
+            vertical=[VerticalSubmarket(**row) for row in data.get("vertical", [])],
+            horizontal=[HorizontalSubmarket(**row) for row in data.get("horizontal", [])],
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "SubmarketsResult":
+        return cls.from_dict(json.loads(text))
+
+    def to_json(self) -> str:
+        return to_compact_json(asdict(self))
+
+    def vertical_dataframe(self) -> "pd.DataFrame":
+        return rows_to_dataframe(self.vertical, VerticalSubmarket)
+
+    def horizontal_dataframe(self) -> "pd.DataFrame":
+        return rows_to_dataframe(self.horizontal, HorizontalSubmarket)
+
+    def to_markdown(self) -> str:
+        return (f"### Vertical Sub-markets\n\n{rows_to_markdown(self.vertical, VerticalSubmarket)}\n\n"
+                f"### Horizontal Sub-markets\n\n{rows_to_markdown(self.horizontal, HorizontalSubmarket)}\n")
+
+
+# === COMBINED DRILLDOWN (metrics + top companies) ===
+DRILLDOWN_SCHEMA = json_object({
+    "metrics": json_array(row_schema(MetricRow)),
+    "companies": json_array(row_schema(CompanyRow)),
+})
+
+
+@dataclass
+class DrilldownResult:
+    """Metrics and top companies for one sub-market from one structured response"""
+    metrics: List[MetricRow] = field(default_factory=list)
+    companies: List[CompanyRow] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, text: str) -> "DrilldownResult":
+        data = json.loads(text)
+        return cls(
+            metrics=[MetricRow(**row) for row in data.get("metrics", [])],
+            companies=[CompanyRow(**row) for row in data.get("companies", [])],
+        )
+
+    def to_json(self) -> str:
+        return to_compact_json(asdict(self))
+
+    def sections(self) -> Dict[str, str]:
+        """Per query type results, in the same format the single-section agents cache"""
+        return {'metrics': rows_to_json(self.metrics), 'companies': rows_to_json(self.companies)}
@@ -1,16 +1,27 @@
 # mergers_agent.py
 
-import os
-import time
+import re
+import contextvars
 from datetime import datetime
-from dotenv import load_dotenv
-from openai import OpenAI, RateLimitError
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from llm_client import create_response, extract_message_text, stream_response, stream_with_fallback
+from market_schemas import (DealRow, STRUCTURED_INSTRUCTIONS, json_schema_format,
+                            parse_rows, rows_or_message, rows_to_markdown, table_schema)
 TOOLS = [{"type": "web_search_preview"}]
 
+MAX_WINDOWS = 10  # per-year searches for one split query; longer ranges are searched un-split
+_YEAR = re.compile(r"\b(19|20)\d{2}\b")
+_LAST_N_YEARS = re.compile(r"last\s+(\d+)\s+years?", re.IGNORECASE)
+# Only legal-entity suffixes at the end of a name ("Acme Holdings Co Ltd"), never the first word
+_COMPANY_SUFFIXES = re.compile(r"(\s+(inc|incorporated|corp|corporation|co|company|ltd|limited|llc|plc|ag|sa|se|nv|"
+                               r"gmbh))+$")
+# Whole month names and their abbreviations, so "Maybe 2023" or "Marketing 2021" carry no month
+_MONTH = re.compile(r"\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+                    r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b")
+_MONTHS = {name: i for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
 MERGERS_PROMPT_TEMPLATE = """
 You are a research assistant specializing in M&A activity.
 
@@ -34,24 +45,142 @@ Instructions:
 No commentary or explanation. Just the table.
 """
 
-def get_mergers_table(market: str, timeframe: str, retries: int = 3) -> str:
+def get_mergers_table(market: str, timeframe: str, retries: int = 3, structured: bool = False) -> str:
+    """Markdown table, or compact DealRow JSON when structured"""
     prompt = MERGERS_PROMPT_TEMPLATE.format(market=market, timeframe=timeframe)
-    for attempt in range(retries):
-        try:
-            print(f"🔍 Fetching M&A data for '{market}' in '{timeframe}' (attempt {attempt + 1})")
-            response = client.responses.create(
-                model="gpt-4o",
-                input=market,
-                tools=TOOLS,
-                instructions=prompt
-            )
-            final = next((o for o in response.output if getattr(o, "type", "") == "message"), None)
-            return "".join(part.text for part in final.content).strip() if final else "⚠️ No output returned."
-        except RateLimitError:
-            delay = 3 + attempt * 2
-            print(f"⚠️ Rate limit. Retrying in {delay}s...")
-            time.sleep(delay)
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            break
+    structured_kwargs = dict(
+        instructions=prompt + STRUCTURED_INSTRUCTIONS,
+        text=json_schema_format("mergers", table_schema(DealRow))
+    ) if structured else dict(instructions=prompt)
+    try:
+        print(f"🔍 Fetching M&A data for '{market}' in '{timeframe}'")
+        response = create_response(
+            model="gpt-4o",
+            input=market,
+            tools=TOOLS,
+            retries=retries,
+            **structured_kwargs
+        )
+        if structured:
+            return rows_or_message(parse_rows(extract_message_text(response), DealRow), "⚠️ No M&A deals found.")
+        return extract_message_text(response) or "⚠️ No output returned."
+    except Exception as e:
+        print(f"❌ Error: {e}")
     return "⚠️ Failed to retrieve M&A data."
+
+
+def stream_mergers_table(market: str, timeframe: str, retries: int = 3) -> Iterator[str]:
+    """Streaming variant of get_mergers_table that yields text deltas"""
+    prompt = MERGERS_PROMPT_TEMPLATE.format(market=market, timeframe=timeframe)
+    print(f"🔍 Streaming M&A data for '{market}' in '{timeframe}'")
+    return stream_with_fallback(stream_response(
+        model="gpt-4o",
+        input=market,
+        tools=TOOLS,
+        instructions=prompt,
+        retries=retries
+    ), "⚠️ Failed to retrieve M&A data.")
+
+
+# === SPLIT SEARCH (one call per year, merged) ===
+def split_timeframe(timeframe: str, today: datetime = None) -> List[str]:
+    """
+    Per-year windows for "last N years", a year range ("2018–2020") or "since 2019", oldest first.
+    Anything else, or a range of more than MAX_WINDOWS years, is searched as one window.
+    """
+    today = today or datetime.now()
+    match = _LAST_N_YEARS.search(timeframe or "")
+    if match:
+        years = list(range(today.year - int(match.group(1)) + 1, today.year + 1))
+    else:
+        found = [int(m.group(0)) for m in _YEAR.finditer(timeframe or "")]
+        if len(found) == 1 and re.search(r"\bsince\b", timeframe, re.IGNORECASE):
+            found.append(today.year)
+        if len(found) < 2 or found[-1] < found[0]:
+            return [timeframe]
+        years = list(range(found[0], min(found[-1], today.year) + 1))
+    if len(years) < 2:
+        return [timeframe]
+    if len(years) > MAX_WINDOWS:
+        print(f"⚠️ '{timeframe}' spans {len(years)} years, more than {MAX_WINDOWS} per-year searches; "
+              f"searching it as one window")
+        return [timeframe]
+    return [f"{year} (year to date)" if year == today.year else str(year) for year in years]
+
+
+def _company_key(name: str) -> str:
+    words = " ".join(re.sub(r"[^a-z0-9 ]+", " ", (name or "").lower()).split())
+    return _COMPANY_SUFFIXES.sub("", re.sub(r"^the\s+(?=\S)", "", words))
+
+
+def _date_key(date: str) -> str:
+    """Year-month when the date has one, else the year, so '2023-03-15' and 'March 2023' agree"""
+    text = (date or "").lower()
+    year = _YEAR.search(text)
+    if not year:
+        return text.strip()
+    numeric = re.search(r"\b\d{4}-(\d{1,2})\b", text)
+    named = _MONTH.search(text)
+    month = int(numeric.group(1)) if numeric else (_MONTHS[named.group(1)[:3]] if named else None)
+    return f"{year.group(0)}-{month:02d}" if month else year.group(0)
+
+
+def deal_key(deal: DealRow) -> tuple:
+    return _company_key(deal.acquirer), _company_key(deal.target), _date_key(deal.date)
+
+
+def merge_deals(deal_lists: List[List[DealRow]]) -> List[DealRow]:
+    """
+    One table from several searches, de-duplicated on acquirer/target/date. The same deal
+    reported with and without a month (e.g. around a window boundary) counts once; a row
+    with a source URL wins over one without.
+    """
+    merged = {}
+    for deals in deal_lists:
+        for deal in deals:
+            acquirer, target, date = deal_key(deal)
+            if not acquirer or not target:
+                continue
+            year = date[:4]
+            key = next((k for k in merged if k[:2] == (acquirer, target)
+                        and (k[2] == date or (k[2][:4] == year and (len(k[2]) == 4 or len(date) == 4)))), None)
+            if key is None:
+                merged[(acquirer, target, date)] = deal
+            elif not merged[key].source.startswith("http") and deal.source.startswith("http"):
+                merged[key] = deal
+    return sorted(merged.values(), key=lambda deal: _date_key(deal.date), reverse=True)
+
+
+def _window_deals(market: str, window: str, retries: int) -> Optional[List[DealRow]]:
+    result = get_mergers_table(market, window, retries=retries, structured=True)
+    try:
+        return parse_rows(result, DealRow)
+    except (ValueError, TypeError, KeyError):
+        print(f"⚠️ M&A search for '{market}' in {window} returned no deals: {result[:80]}")
+        return None
+
+
+def get_mergers_table_split(market: str, timeframe: str, retries: int = 3, structured: bool = False) -> str:
+    """
+    get_mergers_table over per-year windows, searched concurrently and merged into one
+    de-duplicated deal table: fuller coverage at about the latency of a single search.
+    """
+    windows = split_timeframe(timeframe)
+    if len(windows) == 1:
+        return get_mergers_table(market, timeframe, retries=retries, structured=structured)
+
+    print(f"🔍 Splitting M&A search for '{market}' into {len(windows)} windows: {', '.join(windows)}")
+    with ThreadPoolExecutor(max_workers=len(windows), thread_name_prefix="mna-window") as pool:
+        # Each window runs in a copy of the caller's context, so its agent scope and deadlines apply
+        futures = [pool.submit(contextvars.copy_context().run, _window_deals, market, window, retries)
+                   for window in windows]
+        results = [future.result() for future in futures]
+
+    found = [deals for deals in results if deals is not None]
+    if not found:
+        return "⚠️ Failed to retrieve M&A data."
+    deals = merge_deals(found)
+    print(f"✅ {sum(len(d) for d in found)} deals from {len(found)}/{len(windows)} windows, {len(deals)} after de-duplication")
+    if structured:
+        return rows_or_message(deals, "⚠️ No M&A deals found.")
+    return rows_to_markdown(deals, DealRow)
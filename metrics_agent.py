@@ -1,12 +1,11 @@
 # metrics_agent.py
 
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-import streamlit as st
-load_dotenv()
-
-client = OpenAI()
+from llm_client import extract_message_text
+from model_router import create_routed_response
+from typing import Dict, List
+from market_schemas import (MetricRow, BATCHED_INSTRUCTIONS, STRUCTURED_INSTRUCTIONS, batched_input, batched_schema,
+                            json_schema_format, parse_batched_rows, parse_rows, rows_or_message, rows_to_json,
+                            table_schema)
 
 SYSTEM_PROMPT = """
 You are a market research assistant with web access via the `web_search_preview` tool.
@@ -28,18 +27,64 @@ Strict rules:
 
 TOOLS = [{"type": "web_search_preview"}]
 
-def get_detailed_metrics(submarket: str) -> str:
+def build_detailed_metrics_request(submarket: str, structured: bool = False) -> dict:
+    """Request body for responses.create (shared by the interactive and batch paths)"""
     user_query = f"Get the market size, CAGR, and forecast period for '{submarket}' market from 2018 to 2023 ."
+    request = {
+        "model": "gpt-4o",
+        "input": user_query,
+        "instructions": SYSTEM_PROMPT,
+        "tools": TOOLS
+    }
+    if structured:
+        request["instructions"] = SYSTEM_PROMPT + STRUCTURED_INSTRUCTIONS
+        request["text"] = json_schema_format("detailed_metrics", table_schema(MetricRow))
+    return request
+
+def get_detailed_metrics(submarket: str, structured: bool = False) -> str:
+    """Markdown table, or compact MetricRow JSON when structured"""
+    # Starts on the small model; escalates to gpt-4o when the answer isn't a well-formed table
+    try:
+        response = create_routed_response('metrics', **build_detailed_metrics_request(submarket, structured))
+    except Exception as e:
+        # Deadline, open circuit, connection errors, exhausted 429 retries: fail like the other agents
+        print(f"❌ Error fetching metrics for {submarket}: {e}")
+        return "⚠️ Failed to retrieve market metrics."
 
-    response = client.responses.create(
-        model="gpt-4o",
-        input=user_query,
-        instructions=SYSTEM_PROMPT,
-        tools=TOOLS
-    )
+    if structured:
+        try:
+            return rows_or_message(parse_rows(extract_message_text(response), MetricRow), "⚠️ No metrics found.")
+        except (ValueError, TypeError) as e:
+            print(f"❌ Unparseable metrics for {submarket}: {e}")
+            return "❌ No output message from model."
 
     for item in response.output:
         if getattr(item, "type", "") == "message":
             return "".join([c.text for c in item.content])
 
     return "❌ No output message from model."
+
+
+BATCHED_TASK = """
+For each sub-market, get the market size, CAGR, and forecast period from 2018 to 2023.
+"""
+
+def build_detailed_metrics_batched_request(submarkets: List[str]) -> dict:
+    """One structured request covering several sub-markets"""
+    return {
+        "model": "gpt-4o",
+        "input": batched_input(submarkets),
+        "instructions": SYSTEM_PROMPT + BATCHED_TASK + BATCHED_INSTRUCTIONS,
+        "tools": TOOLS,
+        "text": json_schema_format("detailed_metrics_batched", batched_schema(MetricRow))
+    }
+
+def get_detailed_metrics_batched(submarkets: List[str]) -> Dict[str, str]:
+    """Compact MetricRow JSON per sub-market from one request; sub-markets without rows are left out"""
+    response = create_routed_response('metrics_batched', **build_detailed_metrics_batched_request(submarkets))
+    try:
+        rows = parse_batched_rows(extract_message_text(response), MetricRow, submarkets)
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"❌ Unparseable batched metrics for {len(submarkets)} sub-markets: {e}")
+        return {}
+    return {name: rows_to_json(found) for name, found in rows.items() if found}
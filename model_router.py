@@ -0,0 +1,184 @@
+# model_router.py
+
+import re
+import json
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from config import get_settings
+from llm_client import create_response, extract_message_text, stream_response
+from llm_metrics import current_agent, escalation
+
+DEFAULT_MODEL = "gpt-4o"
+
+
+# === VALIDATORS (cheap checks that a small model's answer is usable) ===
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+\|?\s*$", re.MULTILINE)
+_REFUSAL = re.compile(r"^\s*(i'?m sorry|i am sorry|i can(no|')t|i am unable|i'?m unable|unfortunately, i)",
+                      re.IGNORECASE)
+
+
+def is_markdown_table(text: str) -> bool:
+    """Header row, separator row and at least one data row"""
+    match = _TABLE_SEPARATOR.search(text or "")
+    if not match:
+        return False
+    before = text[:match.start()].rstrip().splitlines()
+    after = [line for line in text[match.end():].splitlines() if line.strip().startswith("|")]
+    return bool(before) and "|" in before[-1] and len(after) >= 1
+
+
+def has_json_rows(text: str) -> bool:
+    """Structured {"rows": [...]} output with at least one row that has a value in it"""
+    try:
+        rows = json.loads(text).get("rows")
+    except (ValueError, TypeError, AttributeError):
+        return False
+    return bool(rows) and any(any(str(value).strip() for value in row.values()) for row in rows
+                              if isinstance(row, dict))
+
+
+def is_well_formed_table(text: str) -> bool:
+    """JSON rows in structured mode, a Markdown table otherwise"""
+    text = (text or "").strip()
+    return has_json_rows(text) if text.startswith("{") else is_markdown_table(text)
+
+
+def has_batched_rows(text: str) -> bool:
+    """Multi-item {"items": [{"name", "rows"}]} output where at least one item has rows"""
+    try:
+        items = json.loads(text).get("items")
+    except (ValueError, TypeError, AttributeError):
+        return False
+    return bool(items) and any(isinstance(item, dict) and item.get("rows") for item in items)
+
+
+def has_drilldown_rows(text: str) -> bool:
+    """Combined {"metrics": [...], "companies": [...]} output with rows in both sections"""
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        return False
+    return isinstance(data, dict) and bool(data.get("metrics")) and bool(data.get("companies"))
+
+
+def is_chunk_answer(text: str) -> bool:
+    """A PDF chunk scan said something (even just "Not mentioned.") instead of coming back empty or refusing"""
+    text = (text or "").strip()
+    return bool(text) and not _REFUSAL.match(text)
+
+
+VALIDATORS: Dict[str, Callable[[str], bool]] = {
+    'table': is_well_formed_table,
+    'answer': is_chunk_answer,
+    'items': has_batched_rows,
+    'drilldown': has_drilldown_rows,
+}
+
+
+# === ROUTING POLICY ===
+@dataclass(frozen=True)
+class Route:
+    """Models tried in order (the last one is the fallback) and the check each answer must pass"""
+    models: Tuple[str, ...]
+    validator: Optional[str] = None
+
+
+ROUTES: Dict[str, Route] = {
+    'metrics': Route(("gpt-4o-mini", "gpt-4o"), 'table'),
+    'companies': Route(("gpt-4o-mini", "gpt-4o"), 'table'),
+    'metrics_batched': Route(("gpt-4o-mini", "gpt-4o"), 'items'),
+    'companies_batched': Route(("gpt-4o-mini", "gpt-4o"), 'items'),
+    'drilldown': Route(("gpt-4o-mini", "gpt-4o"), 'drilldown'),
+    'pdf_chunk': Route(("gpt-4o-mini", "gpt-4o"), 'answer'),
+}
+
+
+def route_for(name: str, default_model: str = DEFAULT_MODEL) -> Route:
+    """
+    Routing policy for `name`; LLM_ROUTE_<NAME> (comma-separated models) overrides the models,
+    e.g. LLM_ROUTE_METRICS=gpt-4o to turn routing off for the metrics agent.
+    """
+    route = ROUTES.get(name, Route((default_model,)))
+    override = get_settings().get(f"LLM_ROUTE_{name.upper()}")
+    if override:
+        models = tuple(model.strip() for model in str(override).split(",") if model.strip())
+        route = Route(models or route.models, route.validator)
+    return route
+
+
+def create_routed_response(route_name: str, retries: int = 3, **request):
+    """
+    responses.create on the route's cheapest model, escalating to the next one whenever the
+    answer fails the route's validator. Escalated calls are flagged in llm_calls.
+    """
+    from openai import BadRequestError
+    route = route_for(route_name, request.get("model", DEFAULT_MODEL))
+    validate = VALIDATORS.get(route.validator)
+    agent = current_agent() or route_name
+    for tier, model in enumerate(route.models):
+        last = tier == len(route.models) - 1
+        try:
+            with escalation() if tier else nullcontext():
+                response = create_response(retries=retries, agent=agent, **{**request, "model": model})
+        except BadRequestError as e:
+            if last:
+                raise
+            # e.g. a tool or parameter the smaller model doesn't support
+            print(f"↗️ {agent}: {model} rejected the request ({e}), escalating to {route.models[tier + 1]}")
+            continue
+        if last or validate is None or validate(extract_message_text(response)):
+            return response
+        print(f"↗️ {agent}: {model} answer failed '{route.validator}' check, escalating to {route.models[tier + 1]}")
+
+
+class Retraction(str):
+    """
+    Stream marker from stream_routed_response: drop the last `length` characters yielded so far.
+    It is an empty string, so consumers must apply it (see join_stream) rather than just join.
+    """
+
+    def __new__(cls, length: int):
+        marker = super().__new__(cls, "")
+        marker.length = length
+        return marker
+
+
+def join_stream(deltas: Iterator[str]) -> str:
+    """Text of a routed stream, with rejected answers removed"""
+    text = ""
+    for delta in deltas:
+        text = text[:len(text) - delta.length] if isinstance(delta, Retraction) else text + delta
+    return text
+
+
+def stream_routed_response(route_name: str, retries: int = 3, **request) -> Iterator[str]:
+    """
+    Streaming variant: the cheap model's answer streams live and is validated once it is complete.
+    If it fails, a Retraction for everything it yielded follows and the next model's answer
+    streams in its place, so only the accepted answer survives join_stream.
+    """
+    from openai import BadRequestError
+    route = route_for(route_name, request.get("model", DEFAULT_MODEL))
+    validate = VALIDATORS.get(route.validator)
+    agent = current_agent() or route_name
+    for tier, model in enumerate(route.models):
+        last = tier == len(route.models) - 1
+        parts = []
+        with escalation() if tier else nullcontext():
+            # The call record (and its escalation flag) is taken when the stream is created
+            stream = stream_response(retries=retries, agent=agent, **{**request, "model": model})
+        try:
+            for delta in stream:
+                parts.append(delta)
+                yield delta
+        except BadRequestError as e:
+            if last or parts:
+                raise
+            # e.g. a tool or parameter the smaller model doesn't support
+            print(f"↗️ {agent}: {model} rejected the request ({e}), escalating to {route.models[tier + 1]}")
+            continue
+        if last or validate is None or validate("".join(parts)):
+            return
+        print(f"↗️ {agent}: {model} answer failed '{route.validator}' check, escalating to {route.models[tier + 1]}")
+        yield Retraction(sum(len(part) for part in parts))
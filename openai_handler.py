@@ -1,13 +1,9 @@
 # openai_handler.py
 
-import os
-import time
-from dotenv import load_dotenv
-from openai import OpenAI, RateLimitError
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from typing import Iterator
+from llm_client import create_response, extract_message_text, stream_response, stream_with_fallback
+from market_schemas import (VerticalSubmarket, STRUCTURED_INSTRUCTIONS, json_schema_format,
+                            parse_rows, rows_or_message, table_schema)
 TOOLS = [
     {"type": "web_search_preview"}
 ]
@@ -28,23 +24,37 @@ Given a market name, return only its **vertical sub-markets** in a Markdown tabl
 - No explanation — just the table
 """
 
-def get_vertical_submarkets(market_query: str, retries: int = 3) -> str:
-    for attempt in range(retries):
-        try:
-            print(f"🔍 Fetching verticals for {market_query} [attempt {attempt+1}]")
-            response = client.responses.create(
-                model="gpt-4o",
-                input=market_query,
-                tools=TOOLS,
-                instructions=VERTICAL_PROMPT
-            )
-            final = next((o for o in response.output if getattr(o, "type", "") == "message"), None)
-            return "".join(part.text for part in final.content).strip() if final else "(no output)"
-        except RateLimitError:
-            delay = 3 + attempt * 2
-            print(f"⚠️ Rate limit. Retrying in {delay}s...")
-            time.sleep(delay)
-        except Exception as e:
-            print(f"❌ Error fetching vertical submarkets: {e}")
-            break
+def get_vertical_submarkets(market_query: str, retries: int = 3, structured: bool = False) -> str:
+    """Markdown table, or compact VerticalSubmarket JSON when structured"""
+    structured_kwargs = dict(
+        instructions=VERTICAL_PROMPT + STRUCTURED_INSTRUCTIONS,
+        text=json_schema_format("vertical_submarkets", table_schema(VerticalSubmarket))
+    ) if structured else dict(instructions=VERTICAL_PROMPT)
+    try:
+        print(f"🔍 Fetching verticals for {market_query}")
+        response = create_response(
+            model="gpt-4o",
+            input=market_query,
+            tools=TOOLS,
+            retries=retries,
+            **structured_kwargs
+        )
+        if structured:
+            return rows_or_message(parse_rows(extract_message_text(response), VerticalSubmarket),
+                                   "⚠️ No vertical sub-markets found.")
+        return extract_message_text(response) or "(no output)"
+    except Exception as e:
+        print(f"❌ Error fetching vertical submarkets: {e}")
     return "⚠️ Failed to retrieve vertical sub-markets."
+
+
+def stream_vertical_submarkets(market_query: str, retries: int = 3) -> Iterator[str]:
+    """Streaming variant of get_vertical_submarkets that yields text deltas"""
+    print(f"🔍 Streaming verticals for {market_query}")
+    return stream_with_fallback(stream_response(
+        model="gpt-4o",
+        input=market_query,
+        tools=TOOLS,
+        instructions=VERTICAL_PROMPT,
+        retries=retries
+    ), "⚠️ Failed to retrieve vertical sub-markets.")
@@ -1,13 +1,6 @@
 # pdf_chunks_util.py
 import fitz  # PyMuPDF
 import tempfile
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
 CHUNK_SIZE = 50  # Pages per chunk
 
 def split_pdf_to_chunks(file, chunk_size=CHUNK_SIZE):
@@ -1,20 +1,13 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-import fitz  # PyMuPDF
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from llm_client import create_response, upload_file
 
 def upload_pdf_to_openai(pdf_path: str) -> str:
     with open(pdf_path, "rb") as f:
-        file = client.files.create(file=f, purpose="user_data")
+        file = upload_file(f, purpose="user_data")
     print(f"✅ Uploaded PDF. File ID: {file.id}")
     return file.id
 
 def query_uploaded_pdf(file_id: str, query: str) -> str:
-    response = client.responses.create(
+    response = create_response(
         model="gpt-4o",
         input=[
             {
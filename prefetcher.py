@@ -0,0 +1,106 @@
+# prefetcher.py
+
+import queue
+import itertools
+import threading
+from typing import List
+from llm_client import background_priority
+from market_orchestrator import (BATCH_SIZE, DRILLDOWN_TYPES, fetch_batched_analysis, fetch_market_analysis,
+                                 get_cached_analysis)
+
+
+class DrilldownPrefetcher:
+    """
+    Warms the metrics/companies cache for listed sub-markets in the background.
+    Jobs run in priority order on a small worker pool, at background priority in the
+    shared rate limiter, so interactive clicks always go first. Queued sub-markets are
+    fetched up to BATCH_SIZE per request.
+    """
+
+    def __init__(self, db, workers: int = 2, max_queue: int = 64):
+        self.db = db
+        self.workers = workers
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._order = itertools.count()
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def schedule(self, submarkets: List[str]) -> int:
+        """Queue drilldowns for submarkets, highest priority first; returns how many were queued"""
+        self._ensure_workers()
+        queued = 0
+        for priority, submarket in enumerate(submarkets):
+            for query_type in DRILLDOWN_TYPES:
+                key = (submarket, query_type)
+                with self._lock:
+                    if key in self._scheduled:
+                        continue
+                    self._scheduled.add(key)
+                try:
+                    self._queue.put_nowait((priority, next(self._order), submarket, query_type))
+                    queued += 1
+                except queue.Full:
+                    with self._lock:
+                        self._scheduled.discard(key)
+                    print(f"⚠️ Prefetch queue full, skipping {submarket} ({query_type})")
+        return queued
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"prefetch-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _take_jobs(self) -> List[tuple]:
+        """Block for the next job, then take whatever else is queued, up to one batch per drilldown type"""
+        jobs = [self._queue.get()]
+        while len(jobs) < BATCH_SIZE * len(DRILLDOWN_TYPES):
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._take_jobs()
+            by_type = {}
+            for _, _, submarket, query_type in jobs:
+                by_type.setdefault(query_type, []).append(submarket)
+            for query_type, submarkets in by_type.items():
+                try:
+                    missing = [s for s in submarkets
+                               if get_cached_analysis(s, query_type, self.db, structured=True) is None]
+                    with background_priority():
+                        if len(missing) == 1:
+                            print(f"🔮 Prefetching {query_type} for {missing[0]}")
+                            fetch_market_analysis(missing[0], query_type, self.db, structured=True)
+                        elif missing:
+                            # Several sub-markets in one request, cached per sub-market
+                            print(f"🔮 Prefetching {query_type} for {len(missing)} sub-markets in one request")
+                            fetch_batched_analysis(missing, query_type, self.db)
+                except Exception as e:
+                    print(f"❌ Prefetch failed for {', '.join(submarkets)} ({query_type}): {e}")
+                finally:
+                    with self._lock:
+                        self._scheduled.difference_update((s, query_type) for s in submarkets)
+                    for _ in submarkets:
+                        self._queue.task_done()
+
+
+_prefetchers = {}
+_prefetchers_lock = threading.Lock()
+
+
+def prefetcher_for(db) -> DrilldownPrefetcher:
+    """Process-wide prefetcher for a database file (survives Streamlit reruns)"""
+    with _prefetchers_lock:
+        if db.db_path not in _prefetchers:
+            _prefetchers[db.db_path] = DrilldownPrefetcher(db)
+        return _prefetchers[db.db_path]
@@ -1,14 +1,7 @@
 # query_saved_file_chunks.py
 
-import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-import time
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from llm_client import create_response
 PROMPT_TEMPLATE = """
 You are a market research analyst.
 Only answer from the content in the provided file.
@@ -28,7 +21,7 @@ def query_files(file_ids_path, query_text):
         print(f"🔍 Querying pages {start}-{end} (File ID: {file_id})")
 
         try:
-            response = client.responses.create(
+            response = create_response(
                 model="gpt-4o",
                 input=[
                     {
@@ -43,7 +36,6 @@ def query_files(file_ids_path, query_text):
             combined_output += f"\n\n### 📄 Pages {start}-{end}\n{response.output_text.strip()}"
         except Exception as e:
             combined_output += f"\n❌ Error on pages {start}-{end}: {e}"
-        time.sleep(1.5)
 
     return combined_output.strip()
 
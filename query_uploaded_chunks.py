@@ -1,9 +1,5 @@
-import time
-from openai import OpenAI
-import os
-import streamlit as st
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from typing import Iterator
+from model_router import create_routed_response, stream_routed_response
 def query_chunks(query: str, file_id_chunks: list) -> str:
     full_response = ""
     for chunk in file_id_chunks:
@@ -12,7 +8,8 @@ def query_chunks(query: str, file_id_chunks: list) -> str:
         print(f"🔍 Querying pages {start}-{end} (File ID: {file_id})")
 
         try:
-            response = client.responses.create(
+            response = create_routed_response(
+                'pdf_chunk',
                 model="gpt-4o",
                 input=[
                     {
@@ -28,6 +25,38 @@ def query_chunks(query: str, file_id_chunks: list) -> str:
         except Exception as e:
             full_response += f"\n❌ Error on pages {start}-{end}: {e}"
 
-        time.sleep(1.5)
-
     return full_response.strip()
+
+
+def stream_query_chunks(query: str, file_id_chunks: list) -> Iterator[str]:
+    """
+    Streaming variant of query_chunks: yields each chunk's page header followed by its text deltas.
+    Escalated chunks include a model_router.Retraction; read the result with join_stream.
+    """
+    for i, chunk in enumerate(file_id_chunks):
+        file_id = chunk["file_id"]
+        start, end = chunk["start"], chunk["end"]
+        print(f"🔍 Streaming pages {start}-{end} (File ID: {file_id})")
+
+        yield ("\n\n" if i else "") + f"### 📄 Pages {start}-{end}\n"
+        answered = False
+        try:
+            for delta in stream_routed_response(
+                'pdf_chunk',
+                model="gpt-4o",
+                input=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "input_file", "file_id": file_id},
+                            {"type": "input_text", "text": query}
+                        ]
+                    }
+                ]
+            ):
+                answered = True
+                yield delta
+        except Exception as e:
+            # Mark a cut-off answer as such rather than letting it read as complete
+            note = "answer above is incomplete" if answered else "no answer"
+            yield f"\n❌ Error on pages {start}-{end} ({note}): {e}"
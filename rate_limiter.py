@@ -0,0 +1,237 @@
+# rate_limiter.py
+
+import re
+import time
+import random
+import asyncio
+import threading
+from typing import Mapping, Optional
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset headers such as '1s', '6m0s' or '120ms' into seconds"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers: Optional[Mapping]) -> Optional[float]:
+    """Read Retry-After (or retry-after-ms) from a 429 response"""
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return None
+
+
+class TokenBucket:
+    """Continuously refilling bucket sized to a per-minute limit"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_per_sec = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_sec
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]):
+        """Align the bucket with the server's view from rate-limit headers"""
+        if limit:
+            self.capacity = limit
+            self.refill_per_sec = limit / 60.0
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if reset_seconds and remaining < self.capacity:
+                # The server tells us exactly when the window refills
+                self.refill_per_sec = max(self.refill_per_sec, (self.capacity - remaining) / reset_seconds)
+
+
+class RateLimiter:
+    """
+    Process-wide limiter shared by every agent: request and token buckets fed by the
+    x-ratelimit-* response headers, plus an AIMD concurrency limit that halves on 429s
+    (at most once per decrease_cooldown, so a burst of concurrent 429s counts as one
+    congestion signal) and creeps back up on successes.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 max_concurrency: int, min_concurrency: int = 1,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 background_share: float = 0.5, decrease_cooldown: float = 2.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.interactive_waiting = 0
+        self.background_share = background_share
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.blocked_until = 0.0
+        self.decrease_cooldown = decrease_cooldown
+        self.last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    # === ACQUIRE / RELEASE ===
+    def try_acquire(self, estimated_tokens: int = 0, background: bool = False) -> float:
+        """
+        Take a slot if possible; otherwise return how long to wait before trying again.
+        Background callers only get a share of the concurrency and step aside while
+        any interactive caller is waiting.
+        """
+        with self._cond:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if background:
+                background_cap = max(1, int(self.concurrency_limit * self.background_share))
+                if self.interactive_waiting or self.in_flight >= background_cap:
+                    return 0.25
+            if self.in_flight >= int(self.concurrency_limit):
+                return 0.05
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(estimated_tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, estimated_tokens: int = 0, background: bool = False):
+        """Block until a request slot and enough token budget are available"""
+        waiting = False
+        try:
+            while True:
+                wait = self.try_acquire(estimated_tokens, background)
+                if wait <= 0:
+                    return
+                with self._cond:
+                    if not background and not waiting:
+                        waiting = True
+                        self.interactive_waiting += 1
+                    self._cond.wait(timeout=wait)
+        finally:
+            if waiting:
+                with self._cond:
+                    self.interactive_waiting -= 1
+
+    async def aacquire(self, estimated_tokens: int = 0, background: bool = False):
+        """Async counterpart of acquire (never blocks the event loop)"""
+        while True:
+            wait = self.try_acquire(estimated_tokens, background)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self):
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify_all()
+
+    # === FEEDBACK ===
+    def settle_tokens(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the real usage of a call is known"""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            delta = estimated_tokens - actual_tokens
+            if delta > 0:
+                self.tokens.give_back(delta)
+            else:
+                self.tokens.take(-delta)
+
+    def update_from_headers(self, headers: Optional[Mapping]):
+        """Sync both buckets with x-ratelimit-* headers from any response"""
+        if not headers:
+            return
+
+        def number(name):
+            try:
+                return float(headers.get(name)) if headers.get(name) is not None else None
+            except ValueError:
+                return None
+
+        with self._cond:
+            self.requests.sync(number("x-ratelimit-limit-requests"),
+                               number("x-ratelimit-remaining-requests"),
+                               parse_reset_duration(headers.get("x-ratelimit-reset-requests")))
+            self.tokens.sync(number("x-ratelimit-limit-tokens"),
+                             number("x-ratelimit-remaining-tokens"),
+                             parse_reset_duration(headers.get("x-ratelimit-reset-tokens")))
+
+    def on_success(self):
+        """Additive increase: roughly +1 concurrency per window of successful calls"""
+        with self._cond:
+            self.concurrency_limit = min(self.max_concurrency,
+                                         self.concurrency_limit + 1.0 / max(self.concurrency_limit, 1.0))
+            self._cond.notify_all()
+
+    def on_rate_limited(self, headers: Optional[Mapping] = None) -> Optional[float]:
+        """Multiplicative decrease on a 429; honours Retry-After for every caller"""
+        retry_after = retry_after_seconds(headers)
+        with self._cond:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.decrease_cooldown:
+                # 429s from requests that were already in flight say nothing new about the limit
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                self.last_decrease = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.update_from_headers(headers)
+        return retry_after
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Exponential backoff with full jitter, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after + random.uniform(0, self.base_backoff))
+        return delay
+
+    def snapshot(self) -> dict:
+        """Current limiter state, for dashboards and logs"""
+        with self._cond:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                'concurrency_limit': round(self.concurrency_limit, 2),
+                'in_flight': self.in_flight,
+                'interactive_waiting': self.interactive_waiting,
+                'requests_available': int(self.requests.tokens),
+                'tokens_available': int(self.tokens.tokens),
+            }
@@ -0,0 +1,386 @@
+# replay_transport.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import itertools
+from typing import Dict, Optional, Tuple
+import httpx
+
+# Request fields that don't change the answer and must not change the cassette key
+VOLATILE_FIELDS = ("stream", "metadata", "user")
+SSE_CHUNK_CHARS = 40
+# Headers that describe the wire encoding of a live answer, not its content
+HOP_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+_ids = itertools.count(1)
+
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """Stable key for an interaction: method, path and the canonical JSON body"""
+    try:
+        payload = json.loads(body or b"{}")
+        if isinstance(payload, dict):
+            payload = {k: v for k, v in payload.items() if k not in VOLATILE_FIELDS}
+        canonical = json.dumps(payload, sort_keys=True)
+    except ValueError:
+        canonical = ""  # multipart uploads: keyed by path only
+    return hashlib.sha256(f"{method} {path} {canonical}".encode()).hexdigest()
+
+
+class Cassette:
+    """Recorded interactions on disk: {"interactions": [{key, method, path, status, body}]}"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._by_key = {}
+        self._by_path = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for interaction in json.load(f).get("interactions", []):
+                    self._index(interaction)
+
+    def _index(self, interaction: dict):
+        self._by_key[interaction["key"]] = interaction
+        self._by_path.setdefault((interaction["method"], interaction["path"]), interaction)
+
+    def find(self, key: str, method: str, path: str, any_for_endpoint: bool = False) -> Optional[dict]:
+        """Exact match; optionally fall back to any recording for the same endpoint"""
+        interaction = self._by_key.get(key)
+        if interaction is None and any_for_endpoint:
+            interaction = self._by_path.get((method, path))
+        return interaction
+
+    def record(self, interaction: dict):
+        with self._lock:
+            self._index(interaction)
+            if self.path:
+                with open(self.path, "w") as f:
+                    json.dump({"interactions": list(self._by_key.values())}, f, indent=2)
+
+
+# === SYNTHETIC ANSWERS (no recording for an endpoint) ===
+def example_for_schema(schema: dict, rows: int = 3):
+    """Smallest realistic instance of a strict JSON schema"""
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: example_for_schema(prop, rows) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [example_for_schema(schema.get("items", {}), rows) for _ in range(rows)]
+    if kind in ("number", "integer"):
+        return 1
+    if kind == "boolean":
+        return True
+    return "replay"
+
+
+def synthetic_text(request: dict) -> str:
+    text_format = (request.get("text") or {}).get("format") or {}
+    if text_format.get("type") == "json_schema":
+        return json.dumps(example_for_schema(text_format.get("schema", {})))
+    return "| Metric | Value | Source |\n|---|---|---|\n| Replay | 1 | [source](https://example.com) |"
+
+
+def response_body(text: str, model: str = "gpt-4o", input_tokens: int = 0) -> dict:
+    """A completed Responses API object with one output message"""
+    output_tokens = max(1, len(text) // 4)
+    return {
+        "id": f"resp_replay_{next(_ids)}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [{
+            "type": "message",
+            "id": f"msg_replay_{next(_ids)}",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def file_body(filename: str = "upload.pdf", size: int = 0, purpose: str = "user_data") -> dict:
+    return {
+        "id": f"file-replay{next(_ids)}",
+        "object": "file",
+        "bytes": size,
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+
+
+def embeddings_body(texts, model: str = "text-embedding-3-small", dimensions: int = 64) -> dict:
+    """Deterministic unit vectors (seeded by each text), so replayed lookups are repeatable"""
+    texts = [texts] if isinstance(texts, str) else texts
+    data = []
+    for index, text in enumerate(texts):
+        rng = random.Random(hashlib.sha256(str(text).encode()).digest())
+        vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        data.append({"object": "embedding", "index": index, "embedding": [v / norm for v in vector]})
+    tokens = sum(len(str(text)) // 4 + 1 for text in texts)
+    return {"object": "list", "data": data, "model": model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+def synthesize(method: str, path: str, body: bytes) -> Tuple[int, dict]:
+    if path.endswith("/responses") and method == "POST":
+        request = json.loads(body or b"{}")
+        input_tokens = len(json.dumps(request.get("input", ""))) // 4 + len(request.get("instructions") or "") // 4
+        return 200, response_body(synthetic_text(request), request.get("model", "gpt-4o"), input_tokens)
+    if path.endswith("/files") and method == "POST":
+        return 200, file_body(size=len(body or b""))
+    if path.endswith("/embeddings") and method == "POST":
+        request = json.loads(body or b"{}")
+        return 200, embeddings_body(request.get("input", []), request.get("model", "text-embedding-3-small"))
+    return 404, {"error": {"message": f"No recording for {method} {path}", "type": "invalid_request_error"}}
+
+
+def sse_events(response: dict) -> bytes:
+    """Replay a completed response as the event stream responses.create(stream=True) expects"""
+    text = "".join(part.get("text", "") for item in response.get("output", []) if item.get("type") == "message"
+                   for part in item.get("content", []))
+    item_id = next((item.get("id") for item in response.get("output", []) if item.get("type") == "message"), "msg")
+    sequence = itertools.count()
+    in_progress = dict(response, status="in_progress", output=[])
+    events = [{"type": "response.created", "response": in_progress}]
+    for start in range(0, len(text), SSE_CHUNK_CHARS):
+        events.append({"type": "response.output_text.delta", "item_id": item_id, "output_index": 0,
+                       "content_index": 0, "delta": text[start:start + SSE_CHUNK_CHARS], "logprobs": []})
+    events.append({"type": "response.completed", "response": response})
+    return b"".join(
+        f"event: {event['type']}\ndata: {json.dumps(dict(event, sequence_number=next(sequence)))}\n\n".encode()
+        for event in events
+    )
+
+
+def completed_from_sse(content: bytes) -> Optional[dict]:
+    """Final response object of a recorded event stream"""
+    for line in content.decode(errors="ignore").splitlines():
+        if line.startswith("data: ") and '"response.completed"' in line:
+            return json.loads(line[len("data: "):]).get("response")
+    return None
+
+
+# === FAULT INJECTION ===
+class FaultProfile:
+    """
+    Upstream behaviour to simulate: lognormal latency around latency_ms (sigma sets the
+    tail), a share of 429s carrying Retry-After, and a share of 500s.
+    """
+
+    def __init__(self, latency_ms: float = 0, latency_sigma: float = 0.5,
+                 rate_limit_rate: float = 0, error_rate: float = 0,
+                 retry_after: float = 1, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self) -> float:
+        if not self.latency_ms:
+            return 0.0
+        with self._lock:
+            return self.latency_ms / 1000 * self._random.lognormvariate(0, self.latency_sigma)
+
+    def fault(self) -> Optional[Tuple[int, dict, dict]]:
+        """(status, headers, body) of an injected failure, or None"""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429, {"retry-after": str(self.retry_after)}, {
+                "error": {"message": "Rate limit reached (replay)", "type": "requests", "code": "rate_limit_exceeded"}}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, {}, {"error": {"message": "Injected server error (replay)", "type": "server_error"}}
+        return None
+
+
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "500",
+    "x-ratelimit-remaining-requests": "499",
+    "x-ratelimit-reset-requests": "120ms",
+    "x-ratelimit-limit-tokens": "30000",
+    "x-ratelimit-remaining-tokens": "29000",
+    "x-ratelimit-reset-tokens": "2s",
+}
+
+
+class ReplayServer:
+    """
+    In-process stand-in for api.openai.com shared by the sync and async transports.
+    Replays recorded cassettes (or synthesizes a plausible answer) for responses.create and
+    files.create with injected latency and faults; with record=True it forwards to the real
+    API and records instead. `calls` counts upstream requests per path.
+    """
+
+    def __init__(self, cassette: Cassette, faults: FaultProfile = None, record: bool = False):
+        self.cassette = cassette
+        self.faults = faults or FaultProfile()
+        self.record = record
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def transport(self) -> "ReplayTransport":
+        return ReplayTransport(self, httpx.HTTPTransport() if self.record else None)
+
+    def async_transport(self) -> "AsyncReplayTransport":
+        return AsyncReplayTransport(self, httpx.AsyncHTTPTransport() if self.record else None)
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def count(self, path: str):
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+    def answer(self, request: httpx.Request, body: bytes) -> httpx.Response:
+        method, path = request.method, request.url.path
+        self.count(path)
+        fault = self.faults.fault()
+        if fault:
+            status, headers, payload = fault
+            return httpx.Response(status, headers=headers, json=payload, request=request)
+
+        # Uploads differ byte-for-byte on every run, so any recorded upload will do
+        interaction = self.cassette.find(request_key(method, path, body), method, path,
+                                         any_for_endpoint=not _is_json(body))
+        status, payload = (interaction["status"], interaction["body"]) if interaction else synthesize(method, path, body)
+
+        if status == 200 and _is_stream_request(body):
+            return httpx.Response(200, headers={"content-type": "text/event-stream", **RATE_LIMIT_HEADERS},
+                                  content=sse_events(payload), request=request)
+        return httpx.Response(status, headers=RATE_LIMIT_HEADERS, json=payload, request=request)
+
+    def save(self, request: httpx.Request, body: bytes, response: httpx.Response, content: bytes):
+        """Store a live answer; streams are stored as their final response"""
+        self.count(request.url.path)
+        if response.headers.get("content-type", "").startswith("text/event-stream"):
+            payload = completed_from_sse(content)
+        else:
+            try:
+                payload = json.loads(content)
+            except ValueError:
+                return
+        if payload is None:
+            return
+        method, path = request.method, request.url.path
+        self.cassette.record({"key": request_key(method, path, body), "method": method, "path": path,
+                              "status": response.status_code, "body": payload})
+
+
+def _is_json(body: bytes) -> bool:
+    try:
+        json.loads(body or b"{}")
+        return True
+    except ValueError:
+        return False
+
+
+def _is_stream_request(body: bytes) -> bool:
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and bool(payload.get("stream"))
+
+
+def _replayed(response: httpx.Response, content: bytes, request: httpx.Request) -> httpx.Response:
+    """Hand a recorded live answer back to the client (content is already decoded)"""
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in HOP_HEADERS]
+    return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+
+def _bounded_latency(latency: float, request: httpx.Request):
+    """(seconds to sleep, timed out?) for a simulated wait, honouring the request's read timeout"""
+    read_timeout = (request.extensions.get("timeout") or {}).get("read")
+    if read_timeout is not None and latency > read_timeout:
+        return read_timeout, True
+    return latency, False
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Blocking httpx transport for OpenAI(http_client=...)"""
+
+    def __init__(self, server: ReplayServer, record_from: httpx.BaseTransport = None):
+        self.server = server
+        self.record_from = record_from
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if self.record_from is not None:
+            response = self.record_from.handle_request(request)
+            content = response.read()
+            self.server.save(request, body, response, content)
+            return _replayed(response, content, request)
+
+        delay, timed_out = _bounded_latency(self.server.faults.latency(), request)
+        time.sleep(delay)
+        if timed_out:
+            raise httpx.ReadTimeout("Simulated upstream latency exceeded the read timeout", request=request)
+        return self.server.answer(request, body)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of ReplayTransport for AsyncOpenAI"""
+
+    def __init__(self, server: ReplayServer, record_from: httpx.AsyncBaseTransport = None):
+        self.server = server
+        self.record_from = record_from
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.record_from is not None:
+            response = await self.record_from.handle_async_request(request)
+            content = await response.aread()
+            self.server.save(request, body, response, content)
+            return _replayed(response, content, request)
+
+        delay, timed_out = _bounded_latency(self.server.faults.latency(), request)
+        await asyncio.sleep(delay)
+        if timed_out:
+            raise httpx.ReadTimeout("Simulated upstream latency exceeded the read timeout", request=request)
+        return self.server.answer(request, body)
+
+
+def server_from_settings(setting) -> Optional[ReplayServer]:
+    """
+    ReplayServer configured from LLM_REPLAY_* settings, or None when replay is off.
+    LLM_REPLAY_MODE is 'replay' or 'record'; LLM_REPLAY_CASSETTE is the cassette JSON path.
+    """
+    mode = (setting("LLM_REPLAY_MODE") or "").lower()
+    if mode not in ("replay", "record"):
+        return None
+    faults = FaultProfile(
+        latency_ms=float(setting("LLM_REPLAY_LATENCY_MS", 0)),
+        latency_sigma=float(setting("LLM_REPLAY_LATENCY_SIGMA", 0.5)),
+        rate_limit_rate=float(setting("LLM_REPLAY_429_RATE", 0)),
+        error_rate=float(setting("LLM_REPLAY_ERROR_RATE", 0)),
+        seed=int(setting("LLM_REPLAY_SEED")) if setting("LLM_REPLAY_SEED") else None,
+    )
+    return ReplayServer(Cassette(setting("LLM_REPLAY_CASSETTE")), faults, record=(mode == "record"))
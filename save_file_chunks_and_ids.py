@@ -1,15 +1,9 @@
 # save_file_chunks_and_ids.py
 
-import os
 import fitz  # PyMuPDF
 import tempfile
-from openai import OpenAI
-from dotenv import load_dotenv
 import json
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from llm_client import upload_file
 CHUNK_SIZE = 50  # pages per chunk
 
 def split_and_upload_pdf(pdf_path: str, output_json="saved_file_ids.json"):
@@ -27,7 +21,7 @@ def split_and_upload_pdf(pdf_path: str, output_json="saved_file_ids.json"):
         chunk_doc.close()
 
         with open(temp_path, "rb") as f:
-            uploaded = client.files.create(file=f, purpose="user_data")
+            uploaded = upload_file(f, purpose="user_data")
             print(f"✅ Uploaded chunk {i+1}-{end_page}: {uploaded.id}")
             saved_ids.append({"start": i+1, "end": end_page, "file_id": uploaded.id})
 
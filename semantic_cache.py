@@ -0,0 +1,226 @@
+# semantic_cache.py
+
+import re
+import time
+import hashlib
+import threading
+from typing import Callable, List, Optional, Tuple
+from config import get_settings
+from market_names import market_key
+
+settings = get_settings()
+
+# Embedder: texts -> one vector per text. Vectors are L2-normalized here, so any embedder works.
+Embedder = Callable[[List[str]], List[List[float]]]
+
+# Cosine similarity a match needs; OpenAI embeddings and the lexical hashing embedder score on different scales
+SIMILARITY_THRESHOLDS = {'openai': 0.86, 'hashing': 0.7}
+SYNC_SECONDS = 300  # how often names cached by other processes are pulled into the index
+INDEXED_TYPES = ('global', 'submarkets')  # a market is reusable once its top-level analysis is cached
+
+
+def openai_embedder(model: str = "text-embedding-3-small") -> Embedder:
+    """Embeddings API through llm_client (rate limited, breaker-aware, recorded in llm_calls)"""
+    def embed(texts: List[str]) -> List[List[float]]:
+        from llm_client import create_embeddings
+        return create_embeddings(texts, model=model, agent='semantic_cache')
+    return embed
+
+
+_FILLER_WORDS = {"market", "markets", "industry", "industries", "global", "the", "and", "of", "in", "for"}
+
+
+def hashing_embedder(dimensions: int = 512) -> Embedder:
+    """
+    Local, deterministic embedder: hashed character trigrams of each non-filler word. Catches spelling
+    and plural variants ("EV Batteries" / "ev battery market") but not synonyms; meant for tests and offline use.
+    """
+    def embed(texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            vector = [0.0] * dimensions
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                if word in _FILLER_WORDS:
+                    continue
+                padded = f"#{word}#"
+                for i in range(max(1, len(padded) - 2)):
+                    digest = hashlib.md5(padded[i:i + 3].encode()).digest()
+                    vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0
+            vectors.append(vector)
+        return vectors
+    return embed
+
+
+def default_embedder() -> Tuple[Embedder, float]:
+    """
+    Embedder and threshold from settings: SEMANTIC_CACHE_EMBEDDER=hashing for the local embedder,
+    otherwise OpenAI embeddings; SEMANTIC_CACHE_THRESHOLD overrides the threshold.
+    """
+    kind = "hashing" if settings.get("SEMANTIC_CACHE_EMBEDDER", "openai") == "hashing" else "openai"
+    embedder = (hashing_embedder() if kind == "hashing"
+                else openai_embedder(settings.get("SEMANTIC_CACHE_MODEL", "text-embedding-3-small")))
+    return embedder, settings.get("SEMANTIC_CACHE_THRESHOLD", SIMILARITY_THRESHOLDS[kind], float)
+
+
+class SemanticCache:
+    """
+    Maps a market name to an already-cached market that means the same thing, so
+    "Electric vehicle batteries" can reuse the analysis cached for "EV Batteries".
+    Canonical names of past markets (see market_names) live in a FAISS inner-product index
+    over normalized embeddings (cosine similarity); a match must score at least `threshold`,
+    be for the same region, and not be a narrower or broader version of the query
+    ("Plastic Packaging" vs "Plastic Packaging Machinery").
+    """
+
+    CANDIDATES = 5  # nearest neighbours checked against the region and specificity rules
+
+    def __init__(self, db, embedder: Embedder = None, threshold: float = None):
+        if embedder is None:
+            embedder, default_threshold = default_embedder()
+            threshold = threshold if threshold is not None else default_threshold
+        self.db = db
+        self.embedder = embedder
+        self.threshold = threshold if threshold is not None else SIMILARITY_THRESHOLDS['openai']
+        self._names = []
+        self._known = set()
+        self._embeddings = None  # rows aligned with _names, kept so evictions can rebuild the index
+        self._index = None
+        self._synced_at = 0.0
+        # Guards the index only; embedding requests and DB reads happen outside it
+        self._lock = threading.Lock()
+
+    def _vectors(self, texts: List[str]):
+        import numpy as np
+        vectors = np.asarray(self.embedder(texts), dtype="float32")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.ascontiguousarray(vectors / np.where(norms == 0, 1.0, norms), dtype="float32")
+
+    def _new_names_locked(self, names: List[str]) -> List[str]:
+        # One entry per canonical market: spelling variants are exact cache hits already
+        return list({market_key(name): name for name in reversed(names)
+                     if market_key(name) not in self._known}.values())
+
+    def _add(self, names: List[str]):
+        with self._lock:
+            names = self._new_names_locked(names)
+        if not names:
+            return
+        vectors = self._vectors([market_key(name).canonical for name in names])
+        with self._lock:
+            self._add_locked(names, vectors)
+
+    def _add_locked(self, names: List[str], vectors):
+        import faiss
+        import numpy as np
+        fresh = [i for i, name in enumerate(names) if market_key(name) not in self._known]  # raced with another add
+        if not fresh:
+            return
+        names, vectors = [names[i] for i in fresh], vectors[fresh]
+        if self._index is None:
+            self._index = faiss.IndexFlatIP(vectors.shape[1])
+        self._index.add(vectors)
+        self._embeddings = vectors if self._embeddings is None else np.vstack([self._embeddings, vectors])
+        self._names.extend(names)
+        self._known.update(market_key(name) for name in names)
+
+    def _evict_locked(self, keys: set):
+        """Drop markets whose cached analyses expired or were deleted; the index is rebuilt without them"""
+        import faiss
+        keys = keys & self._known
+        if not keys:
+            return
+        keep = [i for i, name in enumerate(self._names) if market_key(name) not in keys]
+        self._names = [self._names[i] for i in keep]
+        self._known -= keys
+        if keep:
+            self._embeddings = self._embeddings[keep]
+            self._index = faiss.IndexFlatIP(self._embeddings.shape[1])
+            self._index.add(self._embeddings)
+        else:
+            self._embeddings, self._index = None, None
+        print(f"🧹 Semantic cache: dropped {len(keys)} markets with no live cached analysis")
+
+    def _sync(self):
+        """Every SYNC_SECONDS: index names cached by other processes and drop names with no live rows"""
+        with self._lock:
+            if time.monotonic() - self._synced_at < SYNC_SECONDS:
+                return
+            self._synced_at = time.monotonic()  # one thread syncs; the others use the index as it is
+        try:
+            names = self.db.get_cached_market_names(INDEXED_TYPES)
+            with self._lock:
+                self._evict_locked(self._known - {market_key(name) for name in names})
+            self._add(names)
+        except Exception:
+            with self._lock:
+                self._synced_at = 0.0  # retry on the next lookup
+            raise
+
+    def add(self, market_name: str):
+        """Index a market whose analysis was just cached"""
+        try:
+            self._add([market_name])
+        except Exception as e:
+            print(f"⚠️ Semantic cache: could not index '{market_name}': {e}")
+
+    def reset(self):
+        """Forget every indexed name (after cache rows are deleted); rebuilt from the DB on next lookup"""
+        with self._lock:
+            self._names, self._known, self._embeddings, self._index, self._synced_at = [], set(), None, None, 0.0
+
+    def lookup(self, market_name: str) -> Optional[Tuple[str, float]]:
+        """(cached market, similarity) for the closest other market above the threshold, else None"""
+        try:
+            self._sync()
+            key = market_key(market_name)
+            with self._lock:
+                if key in self._known or self._index is None or self._index.ntotal == 0:
+                    return None  # same canonical market: an ordinary cache hit
+            query = self._vectors([key.canonical])  # embedding request, outside the lock
+            with self._lock:
+                if self._index is None:
+                    return None
+                scores, ids = self._index.search(query, self.CANDIDATES)
+                candidates = [(self._names[idx], float(score)) for score, idx in zip(scores[0], ids[0])
+                              if idx >= 0 and score >= self.threshold
+                              and self._same_market(key, market_key(self._names[idx]))]
+            match = None
+            for name, score in candidates:
+                # The index is only synced every few minutes; never redirect to a market with no live rows
+                if self.db.has_cached_market(name, INDEXED_TYPES):
+                    match = (name, score)
+                    break
+                with self._lock:
+                    self._evict_locked({market_key(name)})
+        except Exception as e:
+            # No embeddings (upstream down, faiss missing): behave like an exact-match cache
+            print(f"⚠️ Semantic cache lookup failed for '{market_name}': {e}")
+            return None
+        if match:
+            print(f"♻️ '{market_name}' matches cached '{match[0]}' (similarity {match[1]:.2f})")
+        return match
+
+    @staticmethod
+    def _same_market(query, candidate) -> bool:
+        """Region must agree, and neither name may just add qualifiers to the other"""
+        if query.region != candidate.region:
+            return False
+        query_words, candidate_words = set(query.canonical.split()), set(candidate.canonical.split())
+        return not (query_words < candidate_words or candidate_words < query_words)
+
+    def resolve(self, market_name: str) -> Tuple[str, Optional[float]]:
+        """Market name to analyze: a near-duplicate cached market if there is one, else the name itself"""
+        match = self.lookup(market_name)
+        return match if match else (market_name, None)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def semantic_cache_for(db) -> SemanticCache:
+    """Process-wide SemanticCache for a database file"""
+    with _caches_lock:
+        if db.db_path not in _caches:
+            _caches[db.db_path] = SemanticCache(db)
+        return _caches[db.db_path]
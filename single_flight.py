@@ -0,0 +1,86 @@
+# single_flight.py
+
+import os
+import time
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+from deadlines import MAX_DEADLINE
+
+# A lease must outlive the slowest fetch it guards: a routed call may escalate once, and each
+# model tier gets its own deadline of up to MAX_DEADLINE. Otherwise a second process takes over
+# the lease and sends a duplicate upstream call while the first is still running.
+LEASE_SECONDS = 2 * MAX_DEADLINE + 30
+
+
+class SingleFlight:
+    """
+    Collapses identical in-flight fetches into one upstream call.
+    Threads in this process share the leader's Future; other processes are
+    kept out by a lease row in SQLite and pick the result up from the cache.
+    """
+
+    def __init__(self, db, lease_seconds: int = LEASE_SECONDS, poll_interval: float = 0.5):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def do(self, key: str, fetch: Callable[[], Any], lookup: Callable[[], Optional[Any]]) -> Any:
+        """
+        Run fetch() at most once per key at a time. fetch must write its result to the cache
+        before returning; lookup() reads it back and returns None on a miss.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            print(f"⏳ Waiting on in-flight request {key[:8]}")
+            return future.result()
+
+        try:
+            result = self._do_across_processes(key, fetch, lookup)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _do_across_processes(self, key: str, fetch: Callable[[], Any], lookup: Callable[[], Optional[Any]]) -> Any:
+        while True:
+            if self.db.acquire_lease(key, self.owner, self.lease_seconds):
+                try:
+                    # Another process may have filled the cache while we were waiting
+                    cached = lookup()
+                    return cached if cached is not None else fetch()
+                finally:
+                    self.db.release_lease(key, self.owner)
+
+            # Someone else is fetching: wait for the cache to fill or for their lease to lapse
+            while self.db.is_lease_active(key):
+                time.sleep(self.poll_interval)
+                cached = lookup()
+                if cached is not None:
+                    return cached
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight_for(db) -> SingleFlight:
+    """Process-wide SingleFlight for a database file"""
+    with _flights_lock:
+        if db.db_path not in _flights:
+            _flights[db.db_path] = SingleFlight(db)
+        return _flights[db.db_path]
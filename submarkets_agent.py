@@ -0,0 +1,47 @@
+# submarkets_agent.py
+
+from llm_client import create_response, extract_message_text
+from market_schemas import SubmarketsResult, SUBMARKETS_SCHEMA, json_schema_format
+TOOLS = [
+    {"type": "web_search_preview"}
+]
+
+SUBMARKETS_PROMPT = """
+You are a precise Market Research Assistant.
+
+Given a market name, return both its vertical and its horizontal sub-markets.
+
+Vertical sub-markets:
+- 8–10 rows, each a specific end-use sector (e.g., Automotive, Healthcare, Construction)
+- Do not include horizontal services like logistics or IT platforms
+
+Horizontal sub-markets:
+- 10 rows of segments or companies that operate across multiple verticals
+- B2B infrastructure, platforms, tools, services or manufacturing processes
+  (e.g., injection molding providers, logistics platforms, resin suppliers, major B2B vendors)
+- Give a one-line description for each
+
+Use **real sources**: `source` is the URL of the page backing each row.
+"""
+
+
+def build_submarkets_request(market_query: str) -> dict:
+    """Responses API request for get_submarkets (shared with the batch warm-up)"""
+    return dict(
+        model="gpt-4o",
+        input=market_query,
+        tools=TOOLS,
+        instructions=SUBMARKETS_PROMPT,
+        text=json_schema_format("submarkets", SUBMARKETS_SCHEMA),
+    )
+
+
+def get_submarkets(market_query: str, retries: int = 3) -> str:
+    """Vertical and horizontal sub-markets in one call, as compact SubmarketsResult JSON"""
+    try:
+        print(f"🔍 Fetching sub-markets for {market_query}")
+        response = create_response(**build_submarkets_request(market_query), retries=retries)
+        return SubmarketsResult.from_json(extract_message_text(response)).to_json()
+    except Exception as e:
+        print(f"❌ Error fetching sub-markets: {e}")
+    return "⚠️ Failed to retrieve sub-markets."
@@ -0,0 +1,15 @@
+# test_batch_warmup.py
+
+import os
+import tempfile
+from batch_warmup import LocalBatchBackend, run_batch_warmup
+from market_db import WorkingMarketDB
+
+if __name__ == "__main__":
+    db = WorkingMarketDB(os.path.join(tempfile.gettempdir(), "test_batch_warmup.db"))
+    backend = LocalBatchBackend(canned={"global": "| Metric | Value | Source |\n|---|---|---|\n| CAGR | 5% | test |"},
+                                polls_until_complete=2)
+    jobs = [("Plastic Market in the US", "global"), ("Plastics in Automotive", "metrics")]
+
+    print(run_batch_warmup(db, jobs, backend, poll_interval=0))
+    print(db.get_cached_result("Plastic Market in the US", "global"))
@@ -0,0 +1,48 @@
+# test_circuit_breaker.py
+
+import time
+import httpx
+from openai import APIConnectionError, RateLimitError
+import llm_client
+from circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/responses")
+
+
+def call(error: Exception = None):
+    """One upstream call through the breaker that fails with `error` (or succeeds)"""
+    try:
+        with llm_client.upstream_call("test call"):
+            if error:
+                raise error
+    except Exception:
+        pass
+
+
+if __name__ == "__main__":
+    llm_client.breaker = breaker = CircuitBreaker(min_calls=2, cooldown=0.1)
+    rate_limited = RateLimitError("rate limited", response=httpx.Response(429, request=REQUEST), body=None)
+
+    # 429s are neutral: they neither trip the breaker nor count as successes
+    for _ in range(5):
+        call(rate_limited)
+    assert breaker.state == CLOSED and breaker.snapshot()['calls'] == 0, breaker.snapshot()
+
+    # A straggler admitted before the breaker opened can't close it once half-open
+    straggler = breaker.before_call("straggler")
+    call(APIConnectionError(request=REQUEST))
+    call(APIConnectionError(request=REQUEST))
+    time.sleep(0.15)
+    assert breaker.allows_requests() and breaker.state == HALF_OPEN
+    breaker.record_success(straggler)
+    assert breaker.state == HALF_OPEN, breaker.state
+    print("Straggler success ignored while half-open")
+
+    # A 429 on the probe frees the probe slot without deciding anything
+    call(rate_limited)
+    assert breaker.state == HALF_OPEN and breaker.allows_requests()
+
+    # Only the probe's own success closes the breaker
+    call()
+    assert breaker.state == CLOSED, breaker.state
+    print("Probe success closed the breaker")
@@ -0,0 +1,30 @@
+# test_drilldown_failures.py
+
+import os
+import tempfile
+import model_router
+from circuit_breaker import CircuitOpenError
+from deadlines import DeadlineExceeded
+from market_db import WorkingMarketDB
+from market_orchestrator import clear_memo, fetch_drilldown
+from market_schemas import CompanyRow, MetricRow, render_markdown
+
+
+def raising(error):
+    def create_response(*args, **kwargs):
+        raise error
+    return create_response
+
+
+if __name__ == "__main__":
+    db = WorkingMarketDB(os.path.join(tempfile.gettempdir(), "test_drilldown_failures.db"))
+
+    # Upstream errors raised inside the agents must come back as failure strings, not tracebacks
+    for error in [DeadlineExceeded("metrics call exceeded its deadline"), CircuitOpenError("upstream circuit is open")]:
+        model_router.create_response = raising(error)
+        clear_memo()
+        drilldown = fetch_drilldown(f"Plastics in Automotive ({type(error).__name__})", db)
+        for analysis_type, row_type in [('metrics', MetricRow), ('companies', CompanyRow)]:
+            result, cache_hit = drilldown[analysis_type]
+            assert result.startswith("⚠️") and not cache_hit, result
+            print(f"{type(error).__name__} / {analysis_type}: {render_markdown(result, row_type)}")
@@ -0,0 +1,32 @@
+# test_empty_rows.py
+
+import os
+import tempfile
+from types import SimpleNamespace
+import metrics_agent
+from market_db import WorkingMarketDB
+from market_orchestrator import clear_memo, fetch_market_analysis, is_cacheable
+from market_schemas import EMPTY_ROWS_JSON
+
+
+def message_response(text: str):
+    """Minimal Responses API result with one output message"""
+    return SimpleNamespace(output=[SimpleNamespace(type="message", content=[SimpleNamespace(text=text)])])
+
+
+if __name__ == "__main__":
+    db = WorkingMarketDB(os.path.join(tempfile.gettempdir(), "test_empty_rows.db"))
+    clear_memo()
+
+    # A structured answer with no rows is a failure, not a result
+    metrics_agent.create_routed_response = lambda route, **request: message_response('{"rows": []}')
+    result = metrics_agent.get_detailed_metrics("Plastics in Toys", structured=True)
+    assert result == "⚠️ No metrics found.", result
+    print(f"Agent: {result}")
+
+    # Even if one reaches the orchestrator, it is returned but never cached
+    assert not is_cacheable(EMPTY_ROWS_JSON)
+    result, cache_hit = fetch_market_analysis("Plastics in Toys", "metrics", db, fetch=lambda name: EMPTY_ROWS_JSON,
+                                              structured=True)
+    assert db.get_cached_result("Plastics in Toys", "metrics", format="json") is None
+    print(f"Orchestrator: {result} (not cached)")
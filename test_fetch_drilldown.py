@@ -0,0 +1,37 @@
+# test_fetch_drilldown.py
+
+import os
+import tempfile
+from types import SimpleNamespace
+import companies_agent
+import drilldown_agent
+from market_db import WorkingMarketDB
+from market_orchestrator import clear_memo, fetch_drilldown
+
+COMBINED = '{"metrics": [{"metric": "CAGR", "value": "6%", "source": "test"}], "companies": []}'
+COMPANIES = '{"rows": [{"company": "Acme", "market_share": "12%", "basis": "estimate", "source": "test"}]}'
+
+
+def message_response(text: str):
+    """Minimal Responses API result with one output message"""
+    return SimpleNamespace(output=[SimpleNamespace(type="message", content=[SimpleNamespace(text=text)])])
+
+
+if __name__ == "__main__":
+    # A fresh database each run: a cached companies row from an earlier run would skip the re-fetch
+    db = WorkingMarketDB(os.path.join(tempfile.mkdtemp(), "test_fetch_drilldown.db"))
+    clear_memo()
+    section_calls = []
+    drilldown_agent.create_routed_response = lambda route, **request: message_response(COMBINED)
+    companies_agent.create_routed_response = (
+        lambda route, **request: section_calls.append(route) or message_response(COMPANIES))
+
+    # The combined call came back without companies: only that section is fetched again, on its own
+    drilldown = fetch_drilldown("Plastics in Toys", db)
+    assert section_calls == ['companies'], section_calls
+    assert '"CAGR"' in drilldown['metrics'][0] and '"Acme"' in drilldown['companies'][0], drilldown
+    print(f"Metrics from the combined call, companies re-fetched: {drilldown}")
+
+    # Only the non-empty answers were cached
+    cached = db.get_cached_result("Plastics in Toys", "companies", format="json")
+    assert cached and '"Acme"' in cached['data'], cached
@@ -0,0 +1,31 @@
+# test_llm_metrics.py
+
+import os
+import sqlite3
+import tempfile
+import threading
+import llm_metrics
+from market_db import WorkingMarketDB
+
+
+def count_calls(db_path: str) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM llm_calls").fetchone()[0]
+
+
+if __name__ == "__main__":
+    folder = tempfile.mkdtemp()
+    first = WorkingMarketDB(os.path.join(folder, "first.db")).db_path
+    second = WorkingMarketDB(os.path.join(folder, "second.db")).db_path
+
+    writer = llm_metrics.configure(first)
+    threads = threading.active_count()
+    llm_metrics.LLMCall(agent="test", model="gpt-4o").finish()
+
+    # Switching databases reuses the writer thread; what was buffered goes to the old database
+    assert llm_metrics.configure(second) is writer and threading.active_count() == threads
+    llm_metrics.LLMCall(agent="test", model="gpt-4o").finish()
+    llm_metrics.LLMCall(agent="test", model="gpt-4o").finish()
+    writer.flush()
+    assert (count_calls(first), count_calls(second)) == (1, 2), (count_calls(first), count_calls(second))
+    print("One writer thread across configure() calls; records land in the right database")
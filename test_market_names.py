@@ -0,0 +1,36 @@
+# test_market_names.py
+
+from market_names import MarketKey, market_key
+
+# Spelling and qualifier variants of one market share a key
+SAME = [
+    ("EV Batteries Market in the U.S.", "ev battery market in the us"),
+    ("Plastics in the US", "US Plastics Market"),
+    ("Global EV Battery Market", "EV batteries"),
+    ("Cloud Computing in US and Europe", "Cloud computing in Europe and the U.S."),
+    ("Space", "Space industry"),
+]
+
+# Region words that are part of the market's name, not a qualifier
+DIFFERENT = [
+    ("India Pale Ale", "Pale Ale in India"),
+    ("Japan Tobacco", "Tobacco in Japan"),
+    ("Fine China Tableware", "Fine Tableware in China"),
+    ("Africa safari tourism", "Safari tourism in Africa"),
+    ("Global Positioning Systems", "Positioning Systems"),
+    ("World Cup merchandise", "Cup merchandise"),
+    ("Cloud Computing in US and Europe", "Cloud Computing in the US"),
+    ("Commercial Space", "Commercial"),
+]
+
+if __name__ == "__main__":
+    for a, b in SAME:
+        assert market_key(a) == market_key(b), (a, b, market_key(a), market_key(b))
+        print(f"{a!r} == {b!r} -> {market_key(a).market_id}")
+    for a, b in DIFFERENT:
+        assert market_key(a) != market_key(b), (a, b, market_key(a))
+        print(f"{a!r} != {b!r} -> {market_key(a).market_id} / {market_key(b).market_id}")
+
+    assert market_key("Cloud Computing in US and Europe") == MarketKey("cloud computing", "europe+us")
+    assert market_key("US Space Industry") == MarketKey("space", "us")
+    assert market_key("Global Positioning Systems") == MarketKey("global positioning system")
@@ -1,6 +1,6 @@
 # test_mergers.py
 
-from mergers_agent import get_mergers_table
+from mergers_agent import get_mergers_table, get_mergers_table_split
 
 if __name__ == "__main__":
     market = "Plastic Market in the US"
@@ -8,3 +8,6 @@ if __name__ == "__main__":
 
     markdown_table = get_mergers_table(market, timeframe)
     print(markdown_table)
+
+    # One search per year, merged and de-duplicated
+    print(get_mergers_table_split(market, timeframe))
@@ -0,0 +1,36 @@
+# test_mergers_split.py
+
+from datetime import datetime
+from market_schemas import DealRow
+from mergers_agent import MAX_WINDOWS, _company_key, _date_key, merge_deals, split_timeframe
+
+TODAY = datetime(2025, 6, 1)
+
+
+def deal(acquirer: str, target: str, date: str) -> DealRow:
+    return DealRow(acquirer=acquirer, acquirer_hq="", target=target, target_hq="", description="",
+                   date=date, source="")
+
+
+if __name__ == "__main__":
+    # Ranges wider than MAX_WINDOWS are searched as one window instead of losing the oldest years
+    assert split_timeframe("2019–2021", TODAY) == ["2019", "2020", "2021"]
+    assert split_timeframe("2000–2024", TODAY) == ["2000–2024"]
+    assert len(split_timeframe(f"last {MAX_WINDOWS} years", TODAY)) == MAX_WINDOWS
+    print("Long ranges fall back to one search")
+
+    # Months only as whole words or abbreviations
+    assert _date_key("March 2023") == _date_key("2023-03-15") == "2023-03"
+    assert _date_key("Sept. 2021") == "2021-09"
+    for text in ["Maybe 2023", "Marketing update 2023", "Decade review 2023", "Junior 2023"]:
+        assert _date_key(text) == "2023", (text, _date_key(text))
+    print("Month prefixes no longer read as months")
+
+    # Only trailing legal-entity suffixes are ignored
+    assert _company_key("Acme Holdings Co., Ltd.") == "acme holdings"
+    assert _company_key("The Acme Corporation") == "acme"
+    assert _company_key("Co Group SA") != _company_key("Group SA")
+    assert _company_key("Virgin Group") != _company_key("Virgin")
+    assert len(merge_deals([[deal("Virgin Group", "Target", "2023"), deal("Virgin", "Target", "2023")]])) == 2
+    assert len(merge_deals([[deal("Acme Inc.", "Target", "2023-03"), deal("Acme", "Target", "March 2023")]])) == 1
+    print("Distinct acquirers stay distinct")
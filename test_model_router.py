@@ -0,0 +1,48 @@
+# test_model_router.py
+
+import httpx
+from openai import BadRequestError
+import model_router
+from model_router import Retraction, join_stream, stream_routed_response
+
+ANSWERS = {}
+exhausted = []
+
+
+def fake_stream_response(retries: int = 3, agent: str = None, model: str = None, **request):
+    def deltas():
+        answer = ANSWERS[model]
+        if isinstance(answer, Exception):
+            raise answer
+        yield from answer
+        exhausted.append(model)
+    return deltas()
+
+
+def bad_request(message: str) -> BadRequestError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return BadRequestError(message, response=httpx.Response(400, request=request), body=None)
+
+
+if __name__ == "__main__":
+    model_router.stream_response = fake_stream_response
+    request = dict(model="gpt-4o", input="What was revenue in 2023?")
+
+    # The small model's first tokens reach the caller before its stream is finished
+    ANSWERS.update({"gpt-4o-mini": ["Revenue ", "grew ", "5%."], "gpt-4o": ["unused"]})
+    stream = stream_routed_response('pdf_chunk', **request)
+    assert next(stream) == "Revenue " and not exhausted
+    assert join_stream(stream) == "grew 5%." and exhausted == ["gpt-4o-mini"]
+    print("First token streamed before the answer was complete")
+
+    # A refusal is retracted and replaced by the larger model's answer
+    ANSWERS.update({"gpt-4o-mini": ["I'm sorry, ", "I can't help."], "gpt-4o": ["Revenue grew 5%."]})
+    deltas = list(stream_routed_response('pdf_chunk', **request))
+    assert any(isinstance(delta, Retraction) for delta in deltas)
+    assert join_stream(deltas) == "Revenue grew 5%.", deltas
+    print(f"Escalated: {join_stream(deltas)!r}")
+
+    # A request the small model rejects goes straight to the next model
+    ANSWERS.update({"gpt-4o-mini": bad_request("tool not supported"), "gpt-4o": ["Not mentioned."]})
+    assert join_stream(stream_routed_response('pdf_chunk', **request)) == "Not mentioned."
+    print("Rejected request escalated")
@@ -0,0 +1,30 @@
+# test_rate_limiter.py
+
+import time
+import threading
+from rate_limiter import RateLimiter
+
+if __name__ == "__main__":
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=100000, max_concurrency=16,
+                          decrease_cooldown=0.2)
+
+    # Eight requests in flight get 429s together: one congestion signal, one halving
+    barrier = threading.Barrier(8)
+
+    def rate_limited():
+        barrier.wait()
+        limiter.on_rate_limited()
+
+    threads = [threading.Thread(target=rate_limited) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.concurrency_limit == 8, limiter.snapshot()
+    print(f"Burst of 8 simultaneous 429s: limit 16 -> {limiter.concurrency_limit:g}")
+
+    # A 429 after the cooldown is a new signal
+    time.sleep(0.25)
+    limiter.on_rate_limited()
+    assert limiter.concurrency_limit == 4, limiter.snapshot()
+    print(f"Later 429: limit -> {limiter.concurrency_limit:g}")
@@ -0,0 +1,47 @@
+# test_rekey_migration.py
+
+import os
+import sqlite3
+import tempfile
+import market_db
+from market_db import WorkingMarketDB
+
+
+def make_legacy(db_path: str, market_name: str):
+    """Turn a cached row back into one stored under its raw name, as before canonical keys"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE market_cache SET canonical_name = NULL, region = NULL, query_hash = ? WHERE market_name = ?",
+                     (WorkingMarketDB._legacy_hash(market_name, "global", {}), market_name))
+
+
+def is_rekeyed(db_path: str, market_name: str) -> bool:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT canonical_name FROM market_cache WHERE market_name = ?",
+                            (market_name,)).fetchone()[0] is not None
+
+
+if __name__ == "__main__":
+    path = os.path.join(tempfile.mkdtemp(), "test_rekey_migration.db")
+    db = WorkingMarketDB(path)
+    db.cache_result("Medical Devices Market", "global", "| Metric | Value |")
+    make_legacy(path, "Medical Devices Market")
+
+    # An unversioned database is re-keyed once...
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA user_version = 0")
+    WorkingMarketDB(path)
+    assert is_rekeyed(path, "Medical Devices Market")
+    assert db.get_cached_result("medical devices", "global") is not None
+    print("Legacy row re-keyed on first open")
+
+    # ...and later opens skip the scan
+    make_legacy(path, "Medical Devices Market")
+    WorkingMarketDB(path)
+    assert not is_rekeyed(path, "Medical Devices Market")
+    print("Re-key skipped once recorded")
+
+    # A new key version runs it again
+    market_db.KEY_VERSION += 1
+    WorkingMarketDB(path)
+    assert is_rekeyed(path, "Medical Devices Market")
+    print("Re-key runs again after a KEY_VERSION bump")
@@ -0,0 +1,21 @@
+# test_replay_transport.py
+
+import io
+import os
+
+# Runs the agents offline: no API key, answers synthesized by the replay server
+os.environ.setdefault("LLM_REPLAY_MODE", "replay")
+os.environ.setdefault("LLM_REPLAY_LATENCY_MS", "200")
+os.environ.setdefault("LLM_REPLAY_429_RATE", "0.2")
+
+from llm_client import get_replay_server, upload_file
+from global_metrics_agent import get_global_overview, stream_global_overview
+from submarkets_agent import get_submarkets
+
+if __name__ == "__main__":
+    market = "Plastic Market in the US"
+    print(get_global_overview(market))
+    print("".join(stream_global_overview(market)))
+    print(get_submarkets(market))
+    print(upload_file(("chunk.pdf", io.BytesIO(b"%PDF-1.4 replay"), "application/pdf")).id)
+    print(get_replay_server().calls)
@@ -0,0 +1,49 @@
+# test_semantic_cache.py
+
+import os
+import tempfile
+import threading
+from market_db import WorkingMarketDB
+from semantic_cache import SemanticCache, hashing_embedder
+
+if __name__ == "__main__":
+    db = WorkingMarketDB(os.path.join(tempfile.gettempdir(), "test_semantic_cache.db"))
+    for market in ["EV Batteries", "Plastics", "Medical Devices", "Plastic Packaging"]:
+        db.cache_result(market, "global", "| Metric | Value | Source |\n|---|---|---|\n| CAGR | 5% | test |")
+    cache = SemanticCache(db, embedder=hashing_embedder(), threshold=0.7)
+
+    for query in ["EV Batteries", "ev battery market", "EV charging", "Plastics", "Medical Devises"]:
+        print(f"{query!r} -> {cache.resolve(query)}")
+
+    # A different region or a narrower market must never reuse the cached analysis
+    for query in ["Plastics in the US", "Medical Imaging Devices", "Plastic Packaging Machinery"]:
+        resolved, similarity = cache.resolve(query)
+        assert similarity is None, f"{query!r} wrongly reused {resolved!r}"
+        print(f"{query!r} -> not reused")
+
+    # Nor a market whose cached analysis has expired since it was indexed
+    db.cache_result("Medical Devices", "global", "expired", expire_hours=0, stale_hours=0, jitter=0)
+    resolved, similarity = cache.resolve("Medical Devises")
+    assert similarity is None, f"reused expired {resolved!r}"
+    print("'Medical Devises' -> not reused once 'Medical Devices' expired")
+
+    # A slow embedding request must not hold the index lock
+    embed = hashing_embedder()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_embedder(texts):
+        if texts == ["plastik packaging"]:
+            started.set()
+            release.wait(10)
+        return embed(texts)
+
+    slow = SemanticCache(db, embedder=slow_embedder, threshold=0.7)
+    slow.resolve("Plastics")  # syncs the index
+    lookup = threading.Thread(target=slow.resolve, args=("Plastik Packaging",))
+    lookup.start()
+    assert started.wait(10)
+    assert slow._lock.acquire(timeout=1), "index lock held during an embedding request"
+    slow._lock.release()
+    release.set()
+    lookup.join()
+    print("Index lock free while embedding")
@@ -0,0 +1,46 @@
+# test_single_flight_failures.py
+
+import os
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from deadlines import DeadlineExceeded
+from market_db import WorkingMarketDB
+from market_orchestrator import clear_memo, fetch_market_analysis
+
+calls = []
+calls_lock = threading.Lock()
+
+
+def raising_agent(market_name: str) -> str:
+    """Slow enough for the other sessions to queue up behind the leader, then fails"""
+    with calls_lock:
+        calls.append(market_name)
+    time.sleep(0.5)
+    raise DeadlineExceeded("metrics call exceeded its deadline")
+
+
+def fetch_concurrently(market_name: str, sessions: int = 4):
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(fetch_market_analysis, market_name, 'metrics', db, fetch=raising_agent)
+                   for _ in range(sessions)]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+    db = WorkingMarketDB(os.path.join(tempfile.gettempdir(), "test_single_flight_failures.db"))
+    clear_memo()
+
+    # Nothing cached: the leader's failure reaches every waiter as a failure string, not an exception
+    results = fetch_concurrently("Plastics in Aerospace")
+    assert len(calls) == 1, calls
+    assert all(result.startswith("⚠️") and not cache_hit for result, cache_hit in results), results
+    print(f"No history: {results[0]}")
+
+    # An expired row exists: every session gets the last known result instead
+    db.cache_result("Plastics in Marine", "metrics", "| Metric | Value | Source |\n|---|---|---|\n| CAGR | 4% | old |",
+                    expire_hours=0, stale_hours=0, jitter=0)
+    results = fetch_concurrently("Plastics in Marine")
+    assert all(cache_hit and "old" in result for result, cache_hit in results), results
+    print(f"Last known: {results[0]}")
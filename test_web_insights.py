@@ -0,0 +1,32 @@
+# test_web_insights.py
+
+import os
+import tempfile
+from types import SimpleNamespace
+import web_search_agent
+from market_db import WorkingMarketDB
+from market_orchestrator import clear_memo
+from web_search_agent import get_web_insights
+
+prompts = []
+
+
+def fake_create_response(**request):
+    prompts.append(request["input"][-1]["content"])
+    return SimpleNamespace(output_text="- EV battery prices fell 14% in 2024")
+
+
+if __name__ == "__main__":
+    db = WorkingMarketDB(os.path.join(tempfile.mkdtemp(), "test_web_insights.db"))
+    clear_memo()
+    web_search_agent.create_response = fake_create_response
+
+    # The search sees the prompt as written; only the cache key is normalized
+    insights, cache_hit = get_web_insights("What's new in EV Batteries in the US?", db)
+    assert prompts == ["What's new in EV Batteries in the US?"] and not cache_hit, prompts
+    print(f"Searched: {prompts[0]!r}")
+
+    # Differently cased and spaced, it is the same question
+    insights, cache_hit = get_web_insights("  what's new in EV batteries   in the US ", db)
+    assert cache_hit and len(prompts) == 1 and "14%" in insights, (cache_hit, prompts)
+    print("Same normalized prompt served from cache")
@@ -1,12 +1,9 @@
 # web_search_agent.py
 
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
-import streamlit as st
-load_dotenv()
-#client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+import re
+from typing import Tuple
+from llm_client import create_response
+
 TOOLS = [{"type": "web_search_preview"}]
 
 SYSTEM_PROMPT = '''
@@ -31,7 +28,7 @@ def search_web_insights(prompt: str) -> str:
     """
     ip = SYSTEM_PROMPT.format(prompt = prompt)
     try:
-        response = client.responses.create(
+        response = create_response(
             model="gpt-4o",
             input=[
                 {"role": "system", "content": SYSTEM_PROMPT.strip()},
@@ -43,3 +40,20 @@ def search_web_insights(prompt: str) -> str:
         return response.output_text.strip()
     except Exception as e:
         return f"❌ Web search failed: {e}"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Cache key for a web prompt: case, extra whitespace and trailing punctuation don't matter"""
+    return re.sub(r"\s+", " ", prompt or "").strip().rstrip(" ?.!").lower()
+
+
+def get_web_insights(prompt: str, db) -> Tuple[str, bool]:
+    """
+    Returns (insights, cache_hit). Insights are cached in market_cache by normalized prompt
+    for the 'web_insights' TTL of market_orchestrator; concurrent identical searches make a
+    single upstream call. The search itself gets the prompt as the user wrote it.
+    """
+    from market_orchestrator import expire_hours_for, fetch_market_analysis
+    return fetch_market_analysis(normalize_prompt(prompt), 'web_insights', db,
+                                 fetch=lambda key: search_web_insights(prompt),
+                                 expire_hours=expire_hours_for('web_insights'))